@@ -44,6 +44,7 @@ LANG_MAP = {
     "lbl_cmap": {"cn": "伪彩:", "en": "Colormap:"},
     "lbl_bg_col": {"cn": "背景色:", "en": "BG Color:"},
     "chk_lock": {"cn": "🔒 锁定范围", "en": "🔒 Lock Range"},
+    "chk_stack_range": {"cn": "全序列自动范围", "en": "Stack-wide Auto"},
     "btn_apply": {"cn": "应用", "en": "Apply"},
     "lbl_roi_tools": {"cn": "🛠️ ROI & 测量", "en": "🛠️ ROI & Measurement"},
     "lbl_export": {"cn": "💾 数据导出", "en": "💾 Data Export"},
@@ -0,0 +1,150 @@
+# src/diagnostics.py
+"""
+[新增] 性能诊断 (命令行 --profile / --profile-startup / --trace-memory)。
+启用后收集启动阶段耗时、关键节点 (加载 / 对齐 / 导出) 的内存快照以及主循环的 cProfile 数据，
+退出时写入带时间戳的报告文件，方便用户附在 Bug 报告里。
+未启用时所有模块级函数都是空操作，对正常运行没有开销。
+"""
+import os
+import sys
+import io
+import time
+import datetime
+import platform
+import threading
+import contextlib
+
+_active = None
+
+
+class Diagnostics:
+    def __init__(self, profile=False, startup=False, memory=False, out_dir=None):
+        self.t0 = time.perf_counter()
+        self.stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.out_dir = out_dir or os.getcwd()
+        self.startup = startup
+        self.memory = memory
+        self.phases = []        # (name, 耗时 s)
+        self.marks = []         # (name, 距启动 s)
+        self.snapshots = []     # (label, 距启动 s, current, peak, top 分配行)
+        self._lock = threading.Lock()
+        self.profiler = None
+
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def elapsed(self):
+        return time.perf_counter() - self.t0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """记录一个阶段的耗时"""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, time.perf_counter() - t))
+
+    def mark(self, name):
+        with self._lock:
+            self.marks.append((name, self.elapsed()))
+
+    def memory_snapshot(self, label, top=10):
+        """tracemalloc 快照：当前 / 峰值占用 + 分配最多的代码行"""
+        if not self.memory: return
+        import tracemalloc
+        t = self.elapsed()
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )).statistics("lineno")[:top]
+        lines = [f"{s.traceback[0].filename}:{s.traceback[0].lineno}  {s.size / 1e6:.2f} MB  ({s.count} blocks)"
+                 for s in stats]
+        with self._lock:
+            self.snapshots.append((label, t, current, peak, lines))
+
+    def start_profile(self):
+        if self.profiler: self.profiler.enable()
+
+    def stop_profile(self):
+        if self.profiler: self.profiler.disable()
+
+    def report_path(self, ext=".txt"):
+        return os.path.join(self.out_dir, f"ria_perf_{self.stamp}{ext}")
+
+    def write_report(self, version=""):
+        """写出报告 (文本)；启用 --profile 时额外保存 .pstats 原始数据。返回报告路径。"""
+        out = io.StringIO()
+        out.write("=== RIA Performance Report ===\n")
+        out.write(f"RIA Version:   {version}\n")
+        out.write(f"Python:        {sys.version.split()[0]} ({platform.architecture()[0]})\n")
+        out.write(f"OS:            {platform.system()} {platform.release()}\n")
+        out.write(f"Created:       {self.stamp}\n")
+        out.write(f"Command:       {' '.join(sys.argv)}\n")
+        out.write(f"Session:       {self.elapsed():.1f} s\n")
+
+        with self._lock:
+            phases, marks, snapshots = list(self.phases), list(self.marks), list(self.snapshots)
+
+        if phases:
+            out.write("\n--- Startup Phases ---\n")
+            for name, dt in phases:
+                out.write(f"{name:<28}{dt * 1000:>10.1f} ms\n")
+        if marks:
+            out.write("\n--- Milestones (since launch) ---\n")
+            for name, t in marks:
+                out.write(f"{name:<28}{t:>10.3f} s\n")
+        if snapshots:
+            out.write("\n--- Memory Snapshots (tracemalloc) ---\n")
+            for label, t, current, peak, lines in snapshots:
+                out.write(f"[{label}] +{t:.2f} s  current {current / 1e6:.1f} MB  peak {peak / 1e6:.1f} MB\n")
+                for line in lines:
+                    out.write(f"    {line}\n")
+
+        if self.profiler:
+            import pstats
+            stats_path = self.report_path(".pstats")
+            self.profiler.dump_stats(stats_path)
+            out.write(f"\n--- Profile (main thread, top 40 by cumulative time) ---\n")
+            out.write(f"Raw data: {stats_path}\n")
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(40)
+
+        path = self.report_path()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        return path
+
+
+def enable(profile=False, startup=False, memory=False, out_dir=None):
+    """启用诊断 (进程内唯一)"""
+    global _active
+    _active = Diagnostics(profile=profile, startup=startup, memory=memory, out_dir=out_dir)
+    return _active
+
+
+def get():
+    return _active
+
+
+def phase(name):
+    """阶段计时 (仅 --profile-startup 时记录)"""
+    if _active is None or not _active.startup:
+        return contextlib.nullcontext()
+    return _active.phase(name)
+
+
+def mark(name):
+    if _active is not None: _active.mark(name)
+
+
+def milestone(label):
+    """关键节点：记录时间，启用 --trace-memory 时同时做内存快照"""
+    if _active is None: return
+    _active.mark(label)
+    _active.memory_snapshot(label)
@@ -7,13 +7,11 @@ import sys
 import warnings
 import datetime
 import threading
-import requests
-import webbrowser
+import time
 import json
 from typing import List, Optional
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 
 # --- Import Components ---
@@ -21,16 +19,20 @@ try:
     from .constants import LANG_MAP
     from .components import ToggledFrame
     from .io_utils import read_and_split_multichannel, read_separate_files 
-    from .gui_components import PlotManager, RoiManager
+    from .gui_components import PlotManager, RoiManager, PlaybackEngine, RenderScheduler, ProgressBus
     from .model import AnalysisSession
+    from . import diagnostics
+    from .processing import segment_cells, extract_kymographs, build_polyline_sampling_plan, fast_contrast_limits, FRAME_STAT_FIELDS
 
 except ImportError:
     try:
         from constants import LANG_MAP
         from components import ToggledFrame
         from io_utils import read_and_split_multichannel, read_separate_files
-        from gui_components import PlotManager, RoiManager
+        from gui_components import PlotManager, RoiManager, PlaybackEngine, RenderScheduler, ProgressBus
         from model import AnalysisSession
+        import diagnostics
+        from processing import segment_cells, extract_kymographs, build_polyline_sampling_plan, fast_contrast_limits, FRAME_STAT_FIELDS
 
     except ImportError as e:
         print(f"Import Error: {e}. Ensure all modules exist.")
@@ -70,6 +72,9 @@ class KymographWindow:
         self.var_auto_range = tk.BooleanVar(value=True)
         self.var_cmap = tk.StringVar(value="jet")
         self.var_log = tk.BooleanVar(value=False)
+        self.var_interp = tk.StringVar(value="Bilinear")  # [新增] 采样插值方式
+        self.var_line_width = tk.IntVar(value=1)          # [新增] 垂直方向平均的线宽 (px)
+        self.var_spline = tk.BooleanVar(value=False)      # [新增] 折线按样条平滑采样
 
         # --- Layout ---
         # 1. Plot Area
@@ -140,6 +145,31 @@ class KymographWindow:
         ttk.OptionMenu(fr_look, self.var_cmap, self.var_cmap.get(), *cmap_opts, command=lambda _: self.refresh_plot()).pack(fill="x", pady=2)
         ttk.Checkbutton(fr_look, text="Log Scale", variable=self.var_log, command=self.refresh_plot, style="White.TCheckbutton").pack(anchor="w")
 
+        # Group 4: [新增] Sampling (插值方式 + 线宽)
+        fr_samp = ttk.LabelFrame(parent, text="📐 Sampling", padding=5, style="Card.TLabelframe")
+        fr_samp.pack(side="left", fill="both", expand=True, padx=2)
+
+        ttk.OptionMenu(fr_samp, self.var_interp, self.var_interp.get(), "Bilinear", "Nearest",
+                       command=lambda _: self._resample()).pack(fill="x", pady=2)
+        f_w = ttk.Frame(fr_samp, style="Card.TFrame"); f_w.pack(fill="x")
+        ttk.Label(f_w, text="Width:").pack(side="left")
+        ttk.Spinbox(f_w, from_=1, to=51, increment=2, textvariable=self.var_line_width, width=4,
+                    command=self._resample).pack(side="left")
+        ttk.Label(f_w, text="px").pack(side="left")
+        ttk.Checkbutton(fr_samp, text="Spline", variable=self.var_spline, command=self._resample,
+                        style="White.TCheckbutton").pack(anchor="w")
+
+    def get_sampling(self):
+        """[新增] 返回 (method, line_width, spline)，供主程序构建采样计划。"""
+        method = "nearest" if self.var_interp.get() == "Nearest" else "bilinear"
+        try: width = max(1, int(self.var_line_width.get()))
+        except: width = 1
+        return method, width, bool(self.var_spline.get())
+
+    def _resample(self):
+        """[新增] 采样参数变化后请求主程序重新提取。"""
+        self.app.update_kymograph_by_id(self.roi_id)
+
     def _toggle_range_inputs(self):
         state = "disabled" if self.var_auto_range.get() else "normal"
         self.ent_start.config(state=state)
@@ -216,15 +246,27 @@ class KymographWindow:
         cmap = self.var_cmap.get()
 
         # 4. 绘图
-        self.ax.clear()
-        self.im_obj = self.ax.imshow(
-            data, 
-            aspect='auto', 
-            cmap=cmap, 
-            norm=norm,
-            extent=extent,
-            origin='upper'
-        )
+        # [优化] 已有图像时原地更新 (set_data / set_norm)，不再清空坐标轴、重建 imshow 和 Colorbar
+        if self.im_obj is not None and self.im_obj.axes is self.ax:
+            self.im_obj.set_data(data)
+            self.im_obj.set_extent(extent)
+            self.im_obj.set_cmap(cmap)
+            if type(self.im_obj.norm) is type(norm):
+                self.im_obj.norm.vmin, self.im_obj.norm.vmax = norm.vmin, norm.vmax
+            else:
+                self.im_obj.set_norm(norm)
+            rebuilt = False
+        else:
+            self.ax.clear()
+            self.im_obj = self.ax.imshow(
+                data, 
+                aspect='auto', 
+                cmap=cmap, 
+                norm=norm,
+                extent=extent,
+                origin='upper'
+            )
+            rebuilt = True
         
         self.ax.set_xlabel(f"Distance ({'um' if um_px!=1 else 'px'})")
         self.ax.set_ylabel(f"Time ({'s' if s_frame!=1 else 'frames'})")
@@ -238,23 +280,32 @@ class KymographWindow:
                 t_end = f_end * s_frame
                 self.ax.set_ylim(t_end, t_start) 
             except: pass
+        else:
+            self.ax.set_xlim(0, max_dist)
+            self.ax.set_ylim(max_time, 0)
         
         # 7. Colorbar [完美修复版]
         # 如果 self.cax (Colorbar的轴) 不存在，则创建一个新的 (只创建一次)
         if self.cax is None:
+            from mpl_toolkits.axes_grid1 import make_axes_locatable  # [优化] 延迟导入
             divider = make_axes_locatable(self.ax)
             self.cax = divider.append_axes("right", size="5%", pad=0.05)
         
-        # 清空 cax 里的旧内容，而不是删除 cax 本身
-        self.cax.clear()
-        
-        # 在指定的 cax 上绘制新的 colorbar，这样 ax 就不会被挤压了
-        self.cbar = self.fig.colorbar(self.im_obj, cax=self.cax)
-        
-        self.apply_theme()
+        if rebuilt or self.cbar is None:
+            # 清空 cax 里的旧内容，而不是删除 cax 本身
+            self.cax.clear()
+            # 在指定的 cax 上绘制新的 colorbar，这样 ax 就不会被挤压了
+            self.cbar = self.fig.colorbar(self.im_obj, cax=self.cax)
+            self.apply_theme()
+        else:
+            self.cbar.update_normal(self.im_obj)
+            self.canvas.draw_idle()
 
 
 class RatioAnalyzerApp:
+    KYMO_MAX_FPS = 30  # [新增] 拖动直线时 Kymograph 的最高刷新率
+    EXPORT_TILE = 256  # [新增] 分块导出的 Tile 边长 (像素)
+
     def __init__(self, root, startup_file=None):
         self.root = root
         self.current_theme = "light"
@@ -305,6 +356,24 @@ class RatioAnalyzerApp:
         self.root.configure(bg="#F0F2F5") 
         self.root.minsize(1000, 900)
         self.kymo_windows = {}
+        self._kymo_plans = {}  # [新增] roi_id -> (几何/参数 key, 采样计划)
+        # [新增] Kymograph 后台提取: 待处理请求 (每个 ROI 只保留最新一个) + 条件变量
+        self._kymo_pending = {}
+        self._kymo_cond = threading.Condition()
+        self._kymo_thread = None
+        # [新增] 逐帧统计后台任务: 当前任务 token / 延迟启动句柄 / 检测到的异常帧
+        self._stats_job = None
+        self._stats_after = None
+        self._stats_last_draw = 0.0
+        self.frame_outliers = None
+        self._spark_marker = None
+        self._spark_sig = None
+        # [新增] 播放引擎: 后台预取 + 按墙钟渲染
+        self.playback = PlaybackEngine(self.root, self._playback_frame, self._playback_render, self._playback_stats)
+        # [新增] 滑块拖动时合并重绘，帧计算放到后台线程
+        self.render_sched = RenderScheduler(self.root, self._render_snapshot, self._render_compute, self._render_deliver)
+        # [新增] 后台任务进度总线 (对齐 / 导出 / 逐帧统计)，Tk 线程定频轮询
+        self.progress = ProgressBus(self.root)
         
         try:
             icon_path = self.get_asset_path("ratiofish.ico")
@@ -695,8 +764,13 @@ class RatioAnalyzerApp:
             self.root.after_cancel(self._resize_timer)
         self._resize_timer = self.root.after(50, lambda: self.plot_mgr.resize(event))
 
+    def open_url(self, url):
+        """[新增] 在浏览器中打开链接 (webbrowser 延迟导入)"""
+        import webbrowser
+        webbrowser.open(url)
+
     def star_github(self):
-        webbrowser.open("https://github.com/Epivitae/RatioImagingAnalyzer")
+        self.open_url("https://github.com/Epivitae/RatioImagingAnalyzer")
         self.btn_github.config(text="★ GitHub", style="Starred.TButton")
 
     def setup_ui_skeleton(self):
@@ -782,6 +856,7 @@ class RatioAnalyzerApp:
             
             logo_path = self.get_asset_path("app_ico.png")
             self.plot_mgr.show_logo(logo_path)
+            diagnostics.mark("graphics engine ready")
             
         except Exception as e:
             print(f"Graphics Engine Init Error: {e}")
@@ -966,6 +1041,7 @@ class RatioAnalyzerApp:
         self.btn_undo_align.pack(side="right", fill="x", expand=True)
         self.ui_elements["btn_undo_align"] = self.btn_undo_align
         self.pb_align = ttk.Progressbar(self.grp_pre, orient="horizontal", mode="determinate")
+        self.lbl_align_prog = ttk.Label(self.grp_pre, text="", foreground="gray", style="White.TLabel")
 
     # src/gui.py -> setup_calc_group (替换整个方法)
 
@@ -1142,6 +1218,11 @@ class RatioAnalyzerApp:
         self.btn_apply = ttk.Button(f_rng, command=self.update_plot, width=6, style="Compact.TButton")
         self.btn_apply.pack(side="right", padx=2, fill="y")
         self.ui_elements["btn_apply"] = self.btn_apply
+        # [新增] Auto 模式使用整段序列的稳定范围 (后台计算，完成前按单帧估计)
+        self.var_stack_range = tk.BooleanVar(value=False)
+        self.chk_stack_range = ttk.Checkbutton(self.grp_view, variable=self.var_stack_range, command=self.update_plot, style="White.TCheckbutton")
+        self.chk_stack_range.pack(anchor="w", pady=(2, 0))
+        self.ui_elements["chk_stack_range"] = self.chk_stack_range
 
     def setup_brand_logo(self):
         self.fr_brand = ttk.Frame(self.frame_left, style="White.TFrame")
@@ -1290,10 +1371,27 @@ class RatioAnalyzerApp:
         # FPS 选择菜单
         self.fps_var = tk.StringVar(value="10 FPS")
         ttk.OptionMenu(row_ctl, self.fps_var, "10 FPS", "1 FPS", "5 FPS", "10 FPS", "20 FPS", "Max", command=self.change_fps).pack(side="left")
+        # [新增] 实际帧率 / 请求帧率
+        self.lbl_fps = ttk.Label(row_ctl, text="", width=13, foreground="gray", style="White.TLabel")
+        self.lbl_fps.pack(side="left", padx=(3, 0))
+
+        # [新增] 直接渲染开关：播放时绕过 Matplotlib (不显示 ROI / Colorbar)
+        self.var_direct_render = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row_ctl, text="⚡", variable=self.var_direct_render, style="White.TCheckbutton").pack(side="left", padx=(5, 0))
 
         # 工具栏占位符 (用于 Matplotlib 工具栏)
         self.tb_frame_placeholder = ttk.Frame(row_ctl, style="White.TFrame")
         self.tb_frame_placeholder.pack(side="right")
+
+        # [新增] 时间轴缩略曲线 (逐帧均值 + 异常帧标记)，点击跳转到对应帧
+        row_spark = ttk.Frame(bottom_area, style="White.TFrame")
+        row_spark.pack(fill="x", pady=(0, 5))
+        self.lbl_outliers = ttk.Label(row_spark, text="", foreground="#d9534f", width=6, style="White.TLabel")
+        self.lbl_outliers.pack(side="right")
+        self.cv_spark = tk.Canvas(row_spark, height=18, bg="white", highlightthickness=0, cursor="hand2")
+        self.cv_spark.pack(side="left", fill="x", expand=True)
+        self.cv_spark.bind("<Configure>", lambda e: self.draw_sparkline())
+        self.cv_spark.bind("<Button-1>", self._on_sparkline_click)
         
         # === Row 1: Tools Grid (ROI 工具区) ===
         grid_area = ttk.Frame(bottom_area, style="White.TFrame")
@@ -1320,7 +1418,7 @@ class RatioAnalyzerApp:
         def set_shape_wrapper(mode): 
             self.shape_var.set(mode)
             self.roi_mgr.set_mode(mode)
-            if mode == "line":
+            if mode in ("line", "polyline"):
                 self.btn_kymo.config(state="normal") 
             else:
                 self.btn_kymo.config(state="disabled")
@@ -1331,6 +1429,9 @@ class RatioAnalyzerApp:
         # 直线 (蓝色)
         ttk.Radiobutton(f_shapes, text="╱", variable=self.shape_var, value="line", 
                         command=lambda: set_shape_wrapper("line"), style="Blue.Toolbutton").pack(side="left", padx=0)
+        # [新增] 折线 (左键加点，双击/右键结束)
+        ttk.Radiobutton(f_shapes, text="〰", variable=self.shape_var, value="polyline", 
+                        command=lambda: set_shape_wrapper("polyline"), style="Blue.Toolbutton").pack(side="left", padx=0)
         # 其他形状
         ttk.Radiobutton(f_shapes, text="□", variable=self.shape_var, value="rect", 
                         command=lambda: set_shape_wrapper("rect"), style="Toolbutton").pack(side="left", padx=0)
@@ -1364,6 +1465,10 @@ class RatioAnalyzerApp:
         row_act = ttk.Frame(fr_roi, style="White.TFrame")
         row_act.pack(fill="x", pady=4)
         
+        # 0. [新增] 自动分割 ROI
+        self.btn_auto_roi = ttk.Button(row_act, text="🧬 Auto", command=self.show_auto_roi_dialog)
+        self.btn_auto_roi.pack(side="left", fill="x", expand=True, padx=(0, 2))
+
         # 1. Kymo 按钮 (蓝色)
         # 技巧：去掉大 width，使用 expand=True, fill="x" 让它自动拉伸
         self.btn_kymo = ttk.Button(row_act, text="🌊 Kymo", command=self.show_kymograph_window, 
@@ -1383,6 +1488,9 @@ class RatioAnalyzerApp:
         # 这样它就会和前面两个按钮一起平分整行的宽度
         self.chk_live.pack(side="left", fill="x", expand=True, padx=(2, 0))
         self.ui_elements["chk_live"] = self.chk_live
+        # [新增] 自动分割 / 曲线提取的进度 (仅任务运行时显示在按钮行下方)
+        self._row_roi_act = row_act
+        self.lbl_roi_prog = ttk.Label(fr_roi, text="", foreground="gray", style="White.TLabel")
         
         # Sub-Row C: Params
         row_param = ttk.Frame(fr_roi, style="White.TFrame")
@@ -1410,6 +1518,17 @@ class RatioAnalyzerApp:
                                         variable=self.norm_var, 
                                         style="Toggle.TButton")
         self.chk_norm.pack(side="right", padx=2)
+
+        # Sub-Row D: [新增] ΔF/F 基线模式 (全局 / 滑动百分位 / 滑动最小值)
+        row_base = ttk.Frame(fr_roi, style="White.TFrame")
+        row_base.pack(fill="x", pady=(4, 0))
+        ttk.Label(row_base, text="F₀ Baseline:", style="White.TLabel").pack(side="left")
+        self.combo_baseline = ttk.Combobox(row_base, values=["Global", "Rolling %ile", "Rolling Min"],
+                                           width=11, state="readonly")
+        self.combo_baseline.current(0); self.combo_baseline.pack(side="left", padx=2)
+        ttk.Label(row_base, text="Win (frames):", style="White.TLabel").pack(side="left", padx=(5, 0))
+        self.var_baseline_win = tk.StringVar(value="100")
+        ttk.Entry(row_base, textvariable=self.var_baseline_win, width=5).pack(side="left", padx=2)
         # --- Col 1: Data Export ---
         fr_exp = ttk.LabelFrame(grid_area, padding=5, style="Card.TLabelframe")
         fr_exp.grid(row=0, column=1, sticky="nsew", padx=(0, 5))
@@ -1426,6 +1545,18 @@ class RatioAnalyzerApp:
         self.btn_save_raw = ttk.Button(fr_exp, text="💽 Save Raw Ratio", command=self.save_raw_thread)
         self.btn_save_raw.pack(fill="x", pady=2)
         self.ui_elements["btn_save_raw"] = self.btn_save_raw
+        # [新增] Tiff 压缩方式 + 分块存储 (应用于 Frame / Stack / Raw Ratio 导出)
+        row_codec = ttk.Frame(fr_exp, style="White.TFrame")
+        row_codec.pack(fill="x", pady=(2, 0))
+        self.var_export_codec = tk.StringVar(value="none")
+        self.combo_codec = ttk.Combobox(row_codec, textvariable=self.var_export_codec,
+                                        values=["none", "zlib", "zstd", "lzw"], width=6, state="readonly")
+        self.combo_codec.pack(side="left", fill="x", expand=True)
+        self.var_export_tiled = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row_codec, text="Tiles", variable=self.var_export_tiled,
+                        style="Toggle.TButton", width=5).pack(side="left", padx=(2, 0))
+        # [新增] 导出进度 (吞吐量 / ETA)，仅导出时显示
+        self.lbl_export_prog = ttk.Label(fr_exp, text="", foreground="gray", style="White.TLabel")
         
         # --- Col 2: Settings ---
         # [修改] 使用 ToggledFrame 组件，实现"平时隐藏，点三角形展开"的效果
@@ -1454,7 +1585,7 @@ class RatioAnalyzerApp:
         self.btn_contact = ttk.Button(
             self.fr_settings.sub_frame, 
             text="📧 Contact Author", 
-            command=lambda: webbrowser.open("https://www.cns.ac.cn") 
+            command=lambda: self.open_url("https://www.cns.ac.cn") 
         )
         self.btn_contact.pack(fill="x", pady=(0, 2), padx=2)
         self.ui_elements["btn_contact"] = self.btn_contact
@@ -1487,35 +1618,114 @@ class RatioAnalyzerApp:
         # 立即计算一次数据并显示
         self.update_kymograph_for_roi(line_roi)
 
+    def update_kymograph_by_id(self, roi_id):
+        """[新增] 按 ROI ID 刷新 Kymograph (采样参数变化时由 KymographWindow 调用)"""
+        for roi in self.roi_mgr.roi_list:
+            if roi['id'] == roi_id and roi['type'] in ('line', 'polyline'):
+                self.update_kymograph_for_roi(roi)
+                return
+
     def update_kymograph_for_roi(self, line_roi):
-        """核心计算逻辑，供 show_kymograph_window 和 拖动事件 调用"""
+        """
+        请求刷新某条直线 ROI 的 Kymograph，供 show_kymograph_window 和 拖动事件 调用。
+        [优化] 只在 Tk 线程读取参数；提取交给后台线程 (同一 ROI 只保留最新请求，并限制刷新率)。
+        """
         roi_id = line_roi['id']
-        if roi_id not in self.kymo_windows or not self.kymo_windows[roi_id].is_open:
+        win = self.kymo_windows.get(roi_id)
+        if win is None or not win.is_open:
             return
 
-        from processing import extract_kymograph
         d1, d2, bg1, bg2 = self.get_active_data()
         if d1 is None: return
 
-        p1, p2 = line_roi['params']
-
-        try:
-            # 计算数据 (与之前相同)
-            kymo1 = extract_kymograph(d1 - bg1, p1, p2)
-            if kymo1 is None: return
-
-            if d2 is not None:
-                kymo2 = extract_kymograph(d2 - bg2, p1, p2)
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    kymo_final = np.divide(kymo1, kymo2, where=kymo2 > 1.0)
-                    kymo_final[kymo2 <= 1.0] = 0
-            else:
-                kymo_final = kymo1
+        method, width, spline = win.get_sampling()
+        job = {
+            'points': tuple(tuple(p) for p in line_roi['params']), 'data': (d1, d2, bg1, bg2),
+            'method': method, 'width': width, 'spline': spline, 'is_log': self.log_var.get(),
+        }
+        with self._kymo_cond:
+            self._kymo_pending[roi_id] = job  # latest-wins: 覆盖尚未处理的旧请求
+            if self._kymo_thread is None:
+                self._kymo_thread = threading.Thread(target=self._kymo_worker, daemon=True)
+                self._kymo_thread.start()
+            self._kymo_cond.notify()
+
+    def _kymo_worker(self):
+        """
+        [新增] Kymograph 后台线程：取出所有最新请求 -> 限制帧率 -> 一次遍历提取 -> 回到 Tk 线程更新图像
+        """
+        min_interval = 1.0 / self.KYMO_MAX_FPS
+        last_start = 0.0
+        while True:
+            with self._kymo_cond:
+                while not self._kymo_pending:
+                    self._kymo_cond.wait()
+
+            # 帧率上限: 等待期间到达的新请求会直接覆盖旧任务
+            delay = last_start + min_interval - time.perf_counter()
+            if delay > 0: time.sleep(delay)
+            with self._kymo_cond:
+                jobs = self._kymo_pending
+                self._kymo_pending = {}
+            if not jobs: continue
+            last_start = time.perf_counter()
 
-            self.kymo_windows[roi_id].update_data(kymo_final, self.log_var.get())
+            try:
+                results = self._compute_kymographs(jobs)
+            except Exception as e:
+                print(f"Kymo update error: {e}")
+                continue
+            for roi_id, kymo in results.items():
+                if kymo is None: continue
+                self.root.after(0, lambda r=roi_id, k=kymo, lg=jobs[roi_id]['is_log']: self._deliver_kymograph(r, k, lg))
+
+    def _kymo_plan(self, roi_id, job, shape):
+        """[新增] 采样计划 (索引 + 权重) 只依赖几何与采样参数，按 ROI 缓存并在两个通道间复用"""
+        key = (job['points'], job['method'], job['width'], job['spline'], shape[1:])
+        cached = self._kymo_plans.get(roi_id)
+        if cached is None or cached[0] != key:
+            plan = build_polyline_sampling_plan(shape, job['points'], job['width'], job['method'], job['spline'])
+            cached = (key, plan)
+            self._kymo_plans[roi_id] = cached
+        return cached[1]
+
+    def _compute_kymographs(self, jobs):
+        """
+        [新增] 在后台线程中提取 Kymograph (比率模式下返回 Ch1/Ch2)。
+        同一数据上的多条线拼接为一个采样计划，每个通道只遍历一次堆栈。
+        """
+        results = {}
+        groups = {}
+        for roi_id, job in jobs.items():
+            d1, d2 = job['data'][0], job['data'][1]
+            groups.setdefault((id(d1), id(d2)), []).append(roi_id)
+
+        for roi_ids in groups.values():
+            d1, d2, bg1, bg2 = jobs[roi_ids[0]]['data']
+            plans = [self._kymo_plan(r, jobs[r], d1.shape) for r in roi_ids]
+
+            # [优化] 先从原始堆栈上采样 (T, L)，再扣背景，避免整栈相减产生的临时数组
+            kymos1 = extract_kymographs(d1, plans)
+            kymos2 = extract_kymographs(d2, plans) if d2 is not None else [None] * len(plans)
+            for r, k1, k2 in zip(roi_ids, kymos1, kymos2):
+                if k1 is None:
+                    results[r] = None
+                    continue
+                k1 = k1.astype(np.float32) - np.float32(bg1)
+                if k2 is not None:
+                    k2 = k2.astype(np.float32) - np.float32(bg2)
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        kymo_final = np.divide(k1, k2, where=k2 > 1.0)
+                        kymo_final[k2 <= 1.0] = 0
+                else:
+                    kymo_final = k1
+                results[r] = kymo_final
+        return results
 
-        except Exception as e:
-            print(f"Kymo update error: {e}")
+    def _deliver_kymograph(self, roi_id, kymo, is_log):
+        win = self.kymo_windows.get(roi_id)
+        if win is not None and win.is_open:
+            win.update_data(kymo, is_log)
 
 
     def save_roi_dialog(self):
@@ -1545,6 +1755,111 @@ class RatioAnalyzerApp:
         if path:
             self.roi_mgr.load_rois(path)
 
+    def show_auto_roi_dialog(self):
+        """
+        [新增] 自动细胞分割对话框：阈值 + 连通域 (+ 可选 Watershed)，结果直接加入 ROI 列表。
+        """
+        if self.data1 is None:
+            messagebox.showinfo("Auto ROI", "Please load an image first.")
+            return
+
+        dialog = Toplevel(self.root)
+        dialog.title("Auto ROI")
+        dialog.geometry("300x300")
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        x = self.root.winfo_x() + (self.root.winfo_width() // 2) - 150
+        y = self.root.winfo_y() + (self.root.winfo_height() // 2) - 150
+        dialog.geometry(f"+{x}+{y}")
+
+        ttk.Label(dialog, text="🧬 Automatic Cell Segmentation", font=("Segoe UI", 11, "bold")).pack(pady=10)
+
+        f_form = ttk.Frame(dialog, padding=(20, 0))
+        f_form.pack(fill="x")
+
+        var_proj = tk.StringVar(value="Mean")
+        var_thresh = tk.StringVar(value="")
+        var_min_area = tk.StringVar(value="20")
+        var_max_area = tk.StringVar(value="")
+        var_ws = tk.BooleanVar(value=False)
+        var_ws_dist = tk.StringVar(value="5")
+
+        ttk.Label(f_form, text="Projection:").grid(row=0, column=0, pady=3, sticky="e")
+        ttk.Combobox(f_form, textvariable=var_proj, values=["Mean", "Max"], state="readonly", width=10).grid(row=0, column=1, pady=3, padx=5, sticky="w")
+        ttk.Label(f_form, text="Threshold:").grid(row=1, column=0, pady=3, sticky="e")
+        ttk.Entry(f_form, textvariable=var_thresh, width=12).grid(row=1, column=1, pady=3, padx=5, sticky="w")
+        ttk.Label(f_form, text="Min Area (px):").grid(row=2, column=0, pady=3, sticky="e")
+        ttk.Entry(f_form, textvariable=var_min_area, width=12).grid(row=2, column=1, pady=3, padx=5, sticky="w")
+        ttk.Label(f_form, text="Max Area (px):").grid(row=3, column=0, pady=3, sticky="e")
+        ttk.Entry(f_form, textvariable=var_max_area, width=12).grid(row=3, column=1, pady=3, padx=5, sticky="w")
+        ttk.Checkbutton(f_form, text="Watershed", variable=var_ws).grid(row=4, column=0, pady=3, sticky="e")
+        ttk.Entry(f_form, textvariable=var_ws_dist, width=12).grid(row=4, column=1, pady=3, padx=5, sticky="w")
+
+        ttk.Label(dialog, text="(Empty threshold = Otsu, empty max = no limit)", foreground="gray", font=("Segoe UI", 9)).pack()
+
+        def parse(var, cast, default):
+            txt = var.get().strip()
+            if not txt: return default
+            try: return cast(txt)
+            except ValueError: return default
+
+        def confirm():
+            opts = {
+                "method": "max" if var_proj.get() == "Max" else "mean",
+                "threshold": parse(var_thresh, float, None),
+                "min_area": parse(var_min_area, int, 20),
+                "max_area": parse(var_max_area, int, None),
+                "use_watershed": var_ws.get(),
+                "min_distance": parse(var_ws_dist, int, 5),
+            }
+            dialog.destroy()
+            self.btn_auto_roi.config(state="disabled", text="⏳ ...")
+            task = self.start_roi_progress("auto_roi", total=self.data1.shape[0], stage="Projection")
+            threading.Thread(target=self._auto_roi_task, args=(opts, task), daemon=True).start()
+
+        ttk.Button(dialog, text="Run", command=confirm, style="Success.TButton").pack(pady=15, fill="x", padx=40)
+
+    def _auto_roi_task(self, opts, task):
+        """后台线程：计算投影并分割，不操作 UI (进度写入 task)。"""
+        try:
+            proj = self.session.get_projection(opts["method"], channel=1, progress_callback=task)
+            task.set_stage("Segmenting", total=0)
+            labels, regions = segment_cells(
+                proj,
+                threshold=opts["threshold"],
+                min_area=opts["min_area"],
+                max_area=opts["max_area"],
+                use_watershed=opts["use_watershed"],
+                min_distance=opts["min_distance"]
+            )
+            self.root.after(0, lambda: self._auto_roi_done(labels, regions))
+        except Exception as e:
+            err_msg = str(e)
+            self.root.after(0, lambda: messagebox.showerror("Auto ROI Error", err_msg))
+            self.root.after(0, lambda: self.btn_auto_roi.config(state="normal", text="🧬 Auto"))
+        finally:
+            task.finish()
+
+    def start_roi_progress(self, name, total, stage):
+        """[新增] 登记 ROI 相关的后台任务 (自动分割 / 曲线提取)，进度显示在 ROI 按钮行下方 (主线程调用)"""
+        def on_update(info):
+            if info['finished']:
+                self.lbl_roi_prog.pack_forget()
+                return
+            self.lbl_roi_prog.config(text=ProgressBus.describe(info))
+            self.lbl_roi_prog.pack(fill="x", after=self._row_roi_act)
+        return self.progress.start(name, total=total, stage=stage, on_update=on_update)
+
+    def _auto_roi_done(self, labels, regions):
+        self.btn_auto_roi.config(state="normal", text="🧬 Auto")
+        if not regions:
+            messagebox.showinfo("Auto ROI", "No cells found. Try a lower threshold or smaller Min Area.")
+            return
+        n = self.roi_mgr.add_rois_from_segmentation(labels, regions)
+        print(f"[Auto ROI] Added {n} ROIs.")
+        if self.live_plot_var.get(): self.plot_roi_curve()
+
     def ask_channel_roles(self, n_channels):
         dialog = Toplevel(self.root)
         dialog.title("Assign Channels")
@@ -1739,6 +2054,7 @@ class RatioAnalyzerApp:
             self.plot_mgr.init_image((h, w), cmap="coolwarm")
             self.roi_mgr.connect(self.plot_mgr.ax)
             self.update_plot()
+            self.schedule_frame_stats(delay=0)  # [新增] 后台建立逐帧统计索引
 
             # 4. 按钮反馈
             self.pb_loading.pack_forget()
@@ -1832,6 +2148,7 @@ class RatioAnalyzerApp:
     def clear_all_data(self):
         self.is_playing = False
         self.btn_play.config(text="▶")
+        self.playback.stop(); self.lbl_fps.config(text="")
 
         self.data1 = None
         self.data2 = None
@@ -1841,6 +2158,9 @@ class RatioAnalyzerApp:
         self.cached_bg1 = 0
         self.cached_bg2 = 0
         self.cached_bg_aux = []
+        self.session.notify_data_changed()
+        self._stats_job = None; self.frame_outliers = None  # [新增] 停止后台统计
+        self.lbl_outliers.config(text=""); self.draw_sparkline()
         
         self.c1_path = None
         self.c2_path = None
@@ -1886,6 +2206,7 @@ class RatioAnalyzerApp:
         self.frame_scale.configure(to=1, value=0)
         self.lbl_frame.config(text="0/0")
         self.pb_align.pack_forget()
+        self.lbl_align_prog.pack_forget()
 
         # Clear all channels buttons
         for btn in self.channel_buttons:
@@ -1979,7 +2300,7 @@ class RatioAnalyzerApp:
             variable.set(val)
             fmt = "{:.0f}" if is_int else "{:.1f}"
             val_lbl.config(text=fmt.format(val))
-            if not self.is_playing: self.update_plot()
+            self.request_render() # [优化] 合并重绘，不再每个滑块事件都完整重算
             
         s = ttk.Scale(f, from_=min_v, to=max_v, command=on_slide)
         s.set(variable.get())
@@ -2045,20 +2366,21 @@ class RatioAnalyzerApp:
         self.btn_load.config(state="disabled")
         self.pb_align.pack(fill="x", pady=(5, 0))
         self.pb_align["value"] = 0
-        threading.Thread(target=self.alignment_task, daemon=True).start()
-
+        self.lbl_align_prog.config(text="")
+        self.lbl_align_prog.pack(fill="x")
+        task = self.progress.start("align", total=self.data1.shape[0], stage="Aligning", on_update=self._on_align_progress)
+        threading.Thread(target=self.alignment_task, args=(task,), daemon=True).start()
 
+    def _on_align_progress(self, info):
+        if info['finished']: return
+        if info['total']: self.pb_align.configure(value=info['done'] / info['total'] * 100)
+        self.lbl_align_prog.config(text=ProgressBus.describe(info))
 
-    def alignment_task(self):
+    def alignment_task(self, task):
         try:
-            # 定义回调函数，用于更新 GUI 的进度条
-            # 这里的逻辑是：Model 在后台线程跑，每处理一帧调用一次这个函数
-            # 我们用 self.root.after 把更新指令发回主线程，防止界面卡死或闪退
-            def progress_cb(curr, total):
-                self.root.after(0, lambda: self.pb_align.configure(value=(curr/total)*100))
-            
+            # [修改] Model 在后台线程每处理一帧写一次进度句柄，由进度总线定频刷新进度条
             # [CALL MODEL] 所有的脏活累活都在这里面
-            self.session.align_data(progress_callback=progress_cb)
+            self.session.align_data(progress_callback=task)
             
             # 完成后通知 UI 刷新按钮状态
             self.root.after(0, self.alignment_done_ui)
@@ -2071,6 +2393,8 @@ class RatioAnalyzerApp:
             # 捕获其他未知错误
             self.root.after(0, lambda: messagebox.showerror("Alignment Error", str(e)))
             self.root.after(0, self.alignment_reset_ui)
+        finally:
+            task.finish()
 
 
     def undo_alignment(self):
@@ -2097,12 +2421,14 @@ class RatioAnalyzerApp:
         self.recalc_background()
         self.update_plot()
         self.pb_align.pack_forget()
+        self.lbl_align_prog.pack_forget()
         self.btn_load.config(state="normal")
         self.btn_align.config(state="normal", text=self.t("btn_align_done"), style="Success.TButton")
         self.btn_undo_align.config(state="normal", text=self.t("btn_undo_align"), style="Gray.TButton")
 
     def alignment_reset_ui(self):
         self.pb_align.pack_forget()
+        self.lbl_align_prog.pack_forget()
         self.btn_load.config(state="normal")
         self.btn_align.config(state="normal")
     
@@ -2112,30 +2438,123 @@ class RatioAnalyzerApp:
         [Refactored] 仅作为“参数收集器”。
         收集 UI 上的滑块值、复选框状态，打包传给 Model，然后直接返回结果。
         """
-        # 1. 收集 UI 参数
-        int_th = self.var_int_thresh.get()
-        ratio_th = self.var_ratio_thresh.get()
-        
-        sm_val = int(self.var_smooth.get())
-        
-        is_log = self.log_var.get()
-        use_custom_bg = self.use_custom_bg_var.get()
-
-        # [新增] 检查是否需要交换通道
-        # 如果下拉框选的是 "c2_c1"，则需要交换
-        need_swap = (self.ratio_mode_var.get() == "c2_c1")
-
-        # 2. 委托给 Model 计算
-        return self.session.get_processed_frame(
-            frame_idx=frame_idx,
-            int_thresh=int_th,
-            ratio_thresh=ratio_th,
-            smooth_size=sm_val,
-            log_scale=is_log,
-            use_custom_bg=use_custom_bg,
-            swap_channels=need_swap # [传参]
+        # 委托给 Model 计算
+        return self.session.get_processed_frame(frame_idx=frame_idx, **self.get_frame_params())
+
+    def get_frame_params(self):
+        """[新增] 收集 UI 上的处理参数 (主线程调用)，可直接传给 session.get_processed_frame"""
+        return dict(
+            int_thresh=self.var_int_thresh.get(),
+            ratio_thresh=self.var_ratio_thresh.get(),
+            smooth_size=int(self.var_smooth.get()),
+            log_scale=self.log_var.get(),
+            use_custom_bg=self.use_custom_bg_var.get(),
+            # 如果下拉框选的是 "c2_c1"，则需要交换通道
+            swap_channels=(self.ratio_mode_var.get() == "c2_c1"),
         )
 
+    # =========================================================
+    #  [新增] 逐帧统计索引 (后台构建) -> 全序列范围 / 异常帧 / 时间轴缩略曲线
+    # =========================================================
+    def schedule_frame_stats(self, delay=400):
+        """参数变化后延迟启动 (拖动滑块时只在停下后重建)"""
+        if self._stats_after is not None:
+            try: self.root.after_cancel(self._stats_after)
+            except Exception: pass
+        self._stats_after = self.root.after(delay, self._start_frame_stats)
+
+    def _start_frame_stats(self):
+        self._stats_after = None
+        if self.data1 is None: return
+        params = self.get_frame_params()
+        token = self.session.frame_stats_key("ratio", params)
+        if self._stats_job == token: return  # 已在计算或已完成
+        self._stats_job = token  # 旧任务检测到 token 变化后自行退出
+        self.frame_outliers = None
+        self.lbl_outliers.config(text="")
+        task = self.progress.start("frame_stats", on_update=lambda info: self._on_frame_stats_progress(token, info))
+        threading.Thread(target=self._frame_stats_task, args=(token, params, task), daemon=True).start()
+
+    def _frame_stats_task(self, token, params, task):
+        stop = lambda: self._stats_job != token
+        progress = lambda source, done, total: task.update(done, total)
+        try:
+            for source in self.session.frame_stats_sources():
+                task.set_stage(f"Frame stats ({source})")  # 每个数据源单独计时
+                if not self.session.build_frame_stats(source, params, should_stop=stop, on_progress=progress): return
+        except Exception as e:
+            print(f"Frame stats error: {e}"); return
+        finally:
+            task.finish()
+        self.root.after(0, self._on_frame_stats_done, token)
+
+    def _on_frame_stats_progress(self, token, info):
+        if self._stats_job != token or info['finished']: return
+        now = time.perf_counter()
+        if now - self._stats_last_draw < 0.3: return
+        self._stats_last_draw = now
+        self.draw_sparkline()
+
+    def _on_frame_stats_done(self, token):
+        if self._stats_job != token: return
+        self.frame_outliers = self.session.detect_outlier_frames(self.get_frame_params())
+        n_out = 0 if self.frame_outliers is None else int(self.frame_outliers.sum())
+        self.lbl_outliers.config(text=f"⚠ {n_out}" if n_out else "")
+        self.draw_sparkline()
+        if self.var_stack_range.get() and not self.lock_var.get() and not self.is_playing: self.update_plot()
+
+    def get_stack_contrast(self):
+        """[新增] 由逐帧统计即时给出全序列显示范围 (统计未完成时用已完成的帧)"""
+        return self.session.frame_stats_contrast(self.view_mode, self.get_frame_params(), self.frame_outliers)
+
+    def draw_sparkline(self):
+        """时间轴缩略曲线：当前视图的逐帧均值 + 异常帧 (红) + 当前帧 (黑)"""
+        cv = self.cv_spark
+        cv.delete("all")
+        self._spark_marker = None
+        if self.data1 is None: return
+        w, h = cv.winfo_width(), cv.winfo_height()
+        if w < 10: return
+        n = self.data1.shape[0]
+        sx = (w - 1) / max(n - 1, 1)
+        entry = self.session.get_frame_stats(self.view_mode, self.get_frame_params())
+        if entry is not None:
+            table, done = entry
+            y = table[:, FRAME_STAT_FIELDS.index("mean")]
+            xs = np.flatnonzero(done & np.isfinite(y))
+            if xs.size >= 2:
+                if xs.size > w: xs = xs[np.linspace(0, xs.size - 1, w).astype(int)]
+                ys = y[xs]
+                span = (ys.max() - ys.min()) or 1.0
+                py = (h - 2) - (ys - ys.min()) / span * (h - 4)
+                cv.create_line(*np.column_stack([xs * sx, py]).ravel().tolist(), fill="#0056b3")
+        if self.frame_outliers is not None and self.frame_outliers.size == n:
+            for i in np.flatnonzero(self.frame_outliers):
+                cv.create_line(i * sx, 0, i * sx, h, fill="#d9534f")
+        self._spark_marker = cv.create_line(0, 0, 0, h, fill="black")
+        self._update_spark_marker()
+
+    def refresh_sparkline(self):
+        """视图或参数变化时重画曲线，否则只移动当前帧标记"""
+        sig = (self.view_mode, tuple(sorted(self.get_frame_params().items())), self.session.data_version)
+        if sig != self._spark_sig:
+            self._spark_sig = sig
+            self.draw_sparkline()
+        else:
+            self._update_spark_marker()
+
+    def _update_spark_marker(self):
+        if self._spark_marker is None or self.data1 is None: return
+        w, h = self.cv_spark.winfo_width(), self.cv_spark.winfo_height()
+        x = self.var_frame.get() * (w - 1) / max(self.data1.shape[0] - 1, 1)
+        self.cv_spark.coords(self._spark_marker, x, 0, x, h)
+
+    def _on_sparkline_click(self, event):
+        if self.data1 is None: return
+        w = max(self.cv_spark.winfo_width() - 1, 1)
+        n = self.data1.shape[0]
+        self.on_frame_slide(min(max(round(event.x / w * (n - 1)), 0), n - 1))
+
     def toggle_scale_mode(self):
         if self.lock_var.get():
             self.entry_vmin.config(state="normal")
@@ -2147,10 +2566,39 @@ class RatioAnalyzerApp:
 
     def update_plot(self):
         if self.data1 is None: return
+        if self.is_playing:
+            # [新增] 播放中由播放引擎负责渲染，这里只同步参数
+            self.playback.update_params(self._display_params())
+            return
         idx = self.var_frame.get()
-        img = self.get_processed_frame(idx)
+        params = self._display_params()
+        img = self.session.get_processed_frame(idx, **params)
         if img is None: return
+        self.render_sched.mark_rendered()  # 后台尚未完成的旧请求作废
+        self.render_frame(idx, img, params["level"], params["region"])
+
+    def request_render(self):
+        """[新增] 异步重绘请求 (滑块用)：合并到下一个刷新周期，计算在后台完成"""
+        if self.data1 is None: return
+        if self.is_playing:
+            self.playback.update_params(self._display_params())
+            return
+        self.render_sched.request()
+
+    def _render_snapshot(self):
+        return self.var_frame.get(), self._display_params()
+
+    def _render_compute(self, snap):
+        idx, params = snap
+        return self.session.get_processed_frame(idx, **params)
 
+    def _render_deliver(self, snap, img):
+        if self.data1 is None or self.is_playing: return
+        idx, params = snap
+        self.render_frame(idx, img, params["level"], params["region"])
+
+    def render_frame(self, idx, img, level=1, region=None):
+        """[新增] 渲染已处理好的一帧 (显示范围 / 标题 / 图像 / 缩略曲线)；level / region 见 _display_params"""
         # 1. 计算 View Mode 字符串 (用于标题) 和 Colorbar 标签
         cbar_str = "Intensity Value" # 默认值
         
@@ -2180,11 +2628,12 @@ class RatioAnalyzerApp:
         else:
             mode = "Auto"
             try:
-                valid_mask = ~np.isnan(img)
-                if self.log_var.get(): valid_mask &= (img > 1e-6)
-                valid_data = img[valid_mask]
-                if len(valid_data) > 0: vmin, vmax = np.nanpercentile(valid_data, [5, 95])
-                else: vmin, vmax = 0.1, 1.0
+                # [优化] 抽样估计百分位，代替整帧 nanpercentile
+                min_val = 1e-6 if self.log_var.get() else None
+                lim = self.get_stack_contrast() if self.var_stack_range.get() else None
+                if lim is not None: mode = "Auto (Stack)"
+                else: lim = fast_contrast_limits(img, (5, 95), min_value=min_val)
+                vmin, vmax = lim if lim is not None else (0.1, 1.0)
             except: vmin, vmax = 0, 1
             
             self.entry_vmin.config(state="normal"); self.entry_vmax.config(state="normal")
@@ -2201,9 +2650,19 @@ class RatioAnalyzerApp:
             img, vmin, vmax, 
             log_scale=self.log_var.get(), 
             title=title, 
-            cbar_label=cbar_str # [修改] 传入计算好的标签
+            cbar_label=cbar_str, # [修改] 传入计算好的标签
+            fast=self.is_playing, # [新增] 播放时走 Blitting 路径
+            direct=self.var_direct_render.get(), # [新增] 播放时直接渲染 (LUT -> PhotoImage)
+            extent=self.plot_mgr.display_extent(img.shape, level, region) # [新增] 显示金字塔
         )
 
+        # 5. [新增] 逐帧统计 / 缩略曲线 (播放时只移动当前帧标记)
+        if self.is_playing:
+            self._update_spark_marker()
+        else:
+            self.refresh_sparkline()
+            self.schedule_frame_stats()
+
     def update_cmap(self):
         self.plot_mgr.update_cmap(self.cmap_var.get(), self.bg_color_var.get())
 
@@ -2213,59 +2672,42 @@ class RatioAnalyzerApp:
         unit = self.combo_unit.get()
         i_th = self.var_int_thresh.get()
         r_th = self.var_ratio_thresh.get()
+        baseline = {"Rolling %ile": "percentile", "Rolling Min": "min"}.get(self.combo_baseline.get(), "global")
+        try: base_win = max(3, int(float(self.var_baseline_win.get())))
+        except: base_win = 100
         self.roi_mgr.plot_curve(
             interval=interval, 
             unit=unit, 
             is_log=self.log_var.get(),
             do_norm=self.norm_var.get(),
             int_thresh=i_th,
-            ratio_thresh=r_th
+            ratio_thresh=r_th,
+            baseline=baseline,
+            baseline_window=base_win
         )
 
     def save_stack_thread(self):
         if self.data1 is None: return
-        threading.Thread(target=self.save_stack_task).start()
+        # [修改] 主线程选择路径、收集参数，子线程只负责计算与写盘 (filedialog / Tk 变量不跨线程访问)
+        ts = datetime.datetime.now().strftime("%H%M%S")
+        path = filedialog.asksaveasfilename(defaultextension=".tif", initialfile=f"Ratio_Stack_{ts}.tif")
+        if not path: return
+
+        params = {
+            "int_thresh": self.var_int_thresh.get(),
+            "ratio_thresh": self.var_ratio_thresh.get(),
+            "smooth": int(self.var_smooth.get()),
+            "log_scale": self.log_var.get(),
+            "use_custom_bg": self.use_custom_bg_var.get(),
+            **self.get_export_options()
+        }
+        task = self._start_export_progress("btn_save_stack", "Saving stack")
+        threading.Thread(target=self.save_stack_task, args=(path, params, task)).start()
     
-    def save_stack_task(self):
+    def save_stack_task(self, path, params, task):
         try:
-            # 1. 禁用按钮，防止重复点击
-            # 注意：在线程中操作 UI 最好用 after，或者确保这是在主线程触发前的状态更新
-            self.root.after(0, lambda: self.ui_elements["btn_save_stack"].config(state="disabled", text="⏳ Saving..."))
-            
-            # 2. 弹出文件保存对话框 (必须在主线程，这里通常没问题，因为 thread 是在 task 内部启动的还是外部？)
-            # 假设这个 task 是被 threading.Thread 调用的，那么 ask_filename 最好在外部做。
-            # 但为了兼容旧逻辑，如果原本就是直接调用的，我们先这样写。
-            # 如果这是一个线程函数，filedialog 可能会卡住。
-            # 为了稳妥，建议逻辑是：主线程获取路径 -> 启动子线程保存。
-            # 但为了少改动，我们假设这里运行环境和之前一致。
-            
-            ts = datetime.datetime.now().strftime("%H%M%S")
-            # 注意：filedialog 并不是完全线程安全的，但在 Windows 上通常能跑
-            path = filedialog.asksaveasfilename(defaultextension=".tif", initialfile=f"Ratio_Stack_{ts}.tif")
-            
-            if not path: 
-                # 取消了，恢复按钮
-                self.root.after(0, lambda: self.ui_elements["btn_save_stack"].config(state="normal", text=self.t("btn_save_stack")))
-                return
-            
-            # 3. 收集参数 (从 UI 变量获取)
-            params = {
-                "int_thresh": self.var_int_thresh.get(),
-                "ratio_thresh": self.var_ratio_thresh.get(),
-                "smooth": int(self.var_smooth.get()),
-                "log_scale": self.log_var.get(),
-                "use_custom_bg": self.use_custom_bg_var.get()
-            }
-
-            # 4. 定义进度回调 (用于更新按钮文字)
-            def progress_cb(curr, total):
-                # 使用 root.after 确保 UI 更新在主线程执行
-                self.root.after(0, lambda: self.ui_elements["btn_save_stack"].config(text=f"⏳ {curr}/{total}"))
-
-            # 5. [CALL MODEL] 执行保存
-            self.session.export_processed_stack(path, params, progress_callback=progress_cb)
-            
-            # 6. 完成提示
+            # [CALL MODEL] 执行保存，进度写入总线
+            self.session.export_processed_stack(path, params, progress_callback=task)
             self.root.after(0, lambda: messagebox.showinfo("Success", f"Stack saved to:\n{path}"))
             
         except Exception as e: 
@@ -2274,39 +2716,56 @@ class RatioAnalyzerApp:
             import traceback; traceback.print_exc()
         finally: 
             # 无论成功失败，最后都要恢复按钮
-            self.root.after(0, lambda: self.ui_elements["btn_save_stack"].config(state="normal", text=self.t("btn_save_stack")))
+            task.finish()
+            self.root.after(0, lambda: self._end_export_progress("btn_save_stack"))
+
     def save_raw_thread(self):
         if self.data1 is None: return
-        threading.Thread(target=self.save_raw_task).start()
-
-
+        ts = datetime.datetime.now().strftime("%H%M%S")
+        path = filedialog.asksaveasfilename(defaultextension=".tif", initialfile=f"Clean_Ratio_Stack_{ts}.tif")
+        if not path: return
+        
+        # 收集参数
+        i_th = self.var_int_thresh.get()
+        r_th = self.var_ratio_thresh.get()
+        opts = self.get_export_options()
+        task = self._start_export_progress("btn_save_raw", "Saving raw ratio")
+        threading.Thread(target=self.save_raw_task, args=(path, i_th, r_th, task, opts)).start()
 
-    def save_raw_task(self):
+    def save_raw_task(self, path, i_th, r_th, task, opts=None):
         try:
-            self.root.after(0, lambda: self.ui_elements["btn_save_raw"].config(state="disabled", text="⏳ Saving..."))
-            
-            ts = datetime.datetime.now().strftime("%H%M%S")
-            path = filedialog.asksaveasfilename(defaultextension=".tif", initialfile=f"Clean_Ratio_Stack_{ts}.tif")
-            if not path: 
-                self.root.after(0, lambda: self.ui_elements["btn_save_raw"].config(state="normal", text=self.t("btn_save_raw")))
-                return
-            
-            # 收集参数
-            i_th = self.var_int_thresh.get()
-            r_th = self.var_ratio_thresh.get()
-            
-            def progress_cb(curr, total):
-                self.root.after(0, lambda: self.ui_elements["btn_save_raw"].config(text=f"⏳ {curr}/{total}"))
-
             # [CALL MODEL]
-            self.session.export_raw_ratio_stack(path, i_th, r_th, progress_callback=progress_cb)
-            
+            self.session.export_raw_ratio_stack(path, i_th, r_th, progress_callback=task, **(opts or {}))
             self.root.after(0, lambda: messagebox.showinfo("Success", f"Raw Ratio saved to:\n{path}"))
             
         except Exception as e: 
             self.root.after(0, lambda: messagebox.showerror("Error", str(e)))
         finally: 
-            self.root.after(0, lambda: self.ui_elements["btn_save_raw"].config(state="normal", text=self.t("btn_save_raw")))
+            task.finish()
+            self.root.after(0, lambda: self._end_export_progress("btn_save_raw"))
+
+    def get_export_options(self):
+        """[新增] Tiff 导出格式选项 (压缩方式 / 分块边长)"""
+        return {"compression": self.var_export_codec.get(),
+                "tile": self.EXPORT_TILE if self.var_export_tiled.get() else None}
+
+    def _start_export_progress(self, btn_key, stage):
+        """[新增] 导出开始：禁用按钮并登记进度任务 (主线程调用)"""
+        btn = self.ui_elements[btn_key]
+        btn.config(state="disabled", text="⏳ Saving...")
+        self.lbl_export_prog.config(text="")
+        self.lbl_export_prog.pack(fill="x", pady=(2, 0))
+
+        def on_update(info):
+            if info['finished']: return
+            btn.config(text=f"⏳ {info['done']}/{info['total']}")
+            self.lbl_export_prog.config(text=ProgressBus.describe(info))
+            self.lbl_export_prog.pack(fill="x", pady=(2, 0))  # 另一个导出结束时可能已被隐藏
+        return self.progress.start(btn_key, total=self.data1.shape[0], stage=stage, on_update=on_update)
+
+    def _end_export_progress(self, btn_key):
+        self.ui_elements[btn_key].config(state="normal", text=self.t(btn_key))
+        self.lbl_export_prog.pack_forget()
 
 
 
@@ -2325,7 +2784,8 @@ class RatioAnalyzerApp:
             "ratio_thresh": self.var_ratio_thresh.get(),
             "smooth": int(self.var_smooth.get()),
             "log_scale": self.log_var.get(),
-            "use_custom_bg": self.use_custom_bg_var.get()
+            "use_custom_bg": self.use_custom_bg_var.get(),
+            **self.get_export_options()
         }
         
         try:
@@ -2339,25 +2799,52 @@ class RatioAnalyzerApp:
 
     def on_frame_slide(self, v):
         self.var_frame.set(int(float(v))); self.lbl_frame.config(text=f"{self.var_frame.get()}/{self.data1.shape[0]-1}")
-        if not self.is_playing: self.update_plot()
+        if not self.is_playing: self.request_render()
+        else: self.playback.seek(self.var_frame.get())  # [新增] 播放中拖动 = 跳转
     
     def toggle_play(self):
-        if self.is_playing: self.is_playing = False; self.btn_play.config(text="▶")
-        else: self.is_playing = True; self.btn_play.config(text="⏸"); self.play_loop()
-    
-    def play_loop(self):
-        if not self.is_playing: return
-        curr = self.var_frame.get(); nxt = 0 if curr >= self.data1.shape[0]-1 else curr + 1
-        self.var_frame.set(nxt); self.frame_scale.set(nxt)
-        self.lbl_frame.config(text=f"{nxt}/{self.data1.shape[0]-1}"); self.update_plot()
-        dt = 1 if "Max" in self.fps_var.get() else int(1000/int(self.fps_var.get().split()[0]))
-        self.root.after(dt, self.play_loop)
-    
+        if self.is_playing:
+            self.is_playing = False; self.btn_play.config(text="▶")
+            self.playback.stop(); self.lbl_fps.config(text="")
+            self.plot_mgr.end_fast_render(redraw=False)
+            self.update_plot() # 以常规渲染补画当前帧 (直接渲染期间画布未更新)
+        else:
+            if self.data1 is None: return
+            self.is_playing = True; self.btn_play.config(text="⏸")
+            n = self.data1.shape[0]
+            self.playback.start((self.var_frame.get() + 1) % n, n, self._requested_fps(), self._display_params())
+
+    def _requested_fps(self):
+        """None 表示 Max (最大吞吐量)"""
+        v = self.fps_var.get()
+        if "Max" in v: return None
+        try: return int(v.split()[0])
+        except: return 10
+
+    def _display_params(self):
+        """[新增] 显示用参数：处理参数 + 视图 + 金字塔层级 / 可见区域 (ROI 统计与导出仍用全分辨率)"""
+        level, region = self.plot_mgr.get_display_request(self.data1.shape[1:])
+        return dict(self.get_frame_params(), view_mode=self.view_mode, level=level, region=region)
+
+    def _playback_frame(self, idx, params):
+        # 后台线程：只访问 Model，不碰 Tk 变量
+        return self.session.get_processed_frame(idx, **params)
+
+    def _playback_render(self, idx, img, params):
+        self.var_frame.set(idx)
+        self.lbl_frame.config(text=f"{idx}/{self.data1.shape[0]-1}")
+        self.render_frame(idx, img, params["level"], params["region"])
+
+    def _playback_stats(self, achieved, fps, dropped):
+        req = "Max" if fps is None else f"{fps}"
+        self.lbl_fps.config(text=f"{achieved:.1f}/{req} fps")
+
     def change_fps(self, v):
         if "Max" in v: self.fps = 100
         else:
             try: self.fps = int(v.split()[0])
             except: self.fps = 10
+        self.playback.set_fps(self._requested_fps())
 
     def check_update_thread(self):
         self.btn_check_update.config(state="disabled") 
@@ -2366,6 +2853,7 @@ class RatioAnalyzerApp:
     def check_update_task(self):
         api_url = "https://api.github.com/repos/Epivitae/RatioImagingAnalyzer/releases/latest"
         try:
+            import requests  # [优化] 仅在检查更新时导入
             response = requests.get(api_url, timeout=5)
             response.raise_for_status() 
             data = response.json()
@@ -2390,7 +2878,7 @@ class RatioAnalyzerApp:
     def ask_download(self, version, url):
         msg = self.t("msg_new_ver").format(version)
         if messagebox.askyesno(self.t("title_update"), msg):
-            webbrowser.open(url)
+            self.open_url(url)
 
 
     def save_project_dialog(self):
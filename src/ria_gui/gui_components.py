@@ -7,13 +7,21 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolb
 from matplotlib.widgets import RectangleSelector, EllipseSelector, PolygonSelector
 from matplotlib.patches import Rectangle, Ellipse, Polygon, Circle
 from matplotlib.path import Path as MplPath
-from matplotlib.colors import LogNorm, Normalize
+from matplotlib.colors import LogNorm, Normalize, to_hex
 import matplotlib.lines as mlines
 import threading
+import collections
 import time
 import os
 import json
 
+try:
+    from .processing import (region_outline, extract_roi_traces, rolling_dff, build_colormap_lut, frame_to_rgb,
+                             display_level_for)
+except ImportError:
+    from processing import (region_outline, extract_roi_traces, rolling_dff, build_colormap_lut, frame_to_rgb,
+                            display_level_for)
+
 ROI_COLORS = ['#FF3333', '#33FF33', '#3388FF', '#FFFF33', '#FF33FF', '#33FFFF', '#FF8833']
 
 class PlotManager:
@@ -34,6 +42,7 @@ class PlotManager:
         
         if 'ROIPlotWindow' in locals():
             self.plot_window_controller = ROIPlotWindow(self.app.root)
+            self.plot_window_controller.on_stat_request = lambda stat: self.app.roi_mgr.request_trace_stat(stat)
         else:
             self.plot_window_controller = None
         
@@ -56,6 +65,14 @@ class PlotManager:
         self.cbar = None
         self.toolbar = None
 
+        # [新增] Blitting 渲染状态 (播放时只重绘图像、ROI 和标题)
+        self._blit_active = False
+        self._blit_bg = None
+        self._norm_key = None
+        self._last_full_draw = 0.0
+        self.canvas.mpl_connect('draw_event', self._on_draw_event)
+        self.fast_viewer = None  # [新增] 直接渲染器 (按需创建)
+
 
     def apply_theme(self, bg_color, fg_color):
         """
@@ -124,6 +141,7 @@ class PlotManager:
         self.toolbar.update()
 
     def show_logo(self, logo_path):
+        self._blit_active = False; self._blit_bg = None; self._norm_key = None
         self.fig.clear() 
         self.ax = self.fig.add_subplot(111)
         self.ax.axis('off')
@@ -145,30 +163,175 @@ class PlotManager:
         self.canvas.draw()
 
     def init_image(self, shape, cmap="jet"):
+        self._blit_active = False; self._blit_bg = None; self._norm_key = None
         self.fig.clear()
         self.ax = self.fig.add_subplot(111)
         self.ax.axis('off')
         self.im_object = self.ax.imshow(np.zeros(shape), cmap=cmap)
+        # [新增] 显示金字塔: 图像可能是裁剪 / 降采样后的，通过 extent 映射回全分辨率坐标，
+        # 因此关闭自动缩放 (set_extent 不应改变视野)；缩放 / 平移后按新的视野重新计算
+        self.full_shape = tuple(shape)
+        self.ax.set_autoscale_on(False)
+        self.ax.callbacks.connect('xlim_changed', self._on_view_changed)
+        self.ax.callbacks.connect('ylim_changed', self._on_view_changed)
         self.cbar = self.fig.colorbar(self.im_object, ax=self.ax, shrink=0.6, pad=0.02, label='Ratio Value')
         self.canvas.draw()
 
-    def update_image(self, img_data, vmin, vmax, log_scale=False, title="", cbar_label=None):
+    # =========================================================
+    #  [新增] 显示金字塔 (按缩放级别降采样 / 只算可见区域)
+    # =========================================================
+    def _on_view_changed(self, ax):
+        if hasattr(self.app, "request_render"): self.app.request_render()
+
+    def get_display_request(self, full_shape=None):
+        """
+        根据当前视野与坐标轴像素尺寸返回 (level, region)。
+        level: 块平均倍数 (2 的幂)；region: 可见区域 (y0, y1, x0, x1)，整幅可见时为 None。
+        """
+        h, w = full_shape if full_shape is not None else self.full_shape
+        (x0, x1), (y0, y1) = sorted(self.ax.get_xlim()), sorted(self.ax.get_ylim())
+        # 像素中心位于整数坐标，边界为 ±0.5
+        c0, c1 = max(0, int(np.floor(x0 + 0.5))), min(w, int(np.ceil(x1 + 0.5)))
+        r0, r1 = max(0, int(np.floor(y0 + 0.5))), min(h, int(np.ceil(y1 + 0.5)))
+        if c1 <= c0 or r1 <= r0: return 1, None
+        bbox = self.ax.get_window_extent()
+        level = min(display_level_for(c1 - c0, bbox.width), display_level_for(r1 - r0, bbox.height))
+        # 起点对齐到 level 的整数倍，平移时像素网格保持一致
+        c0 -= c0 % level; r0 -= r0 % level
+        if (r0, r1, c0, c1) == (0, h, 0, w): return level, None
+        return level, (r0, r1, c0, c1)
+
+    @staticmethod
+    def display_extent(img_shape, level=1, region=None):
+        """显示图像在全分辨率坐标下的 extent (origin='upper')"""
+        r0, c0 = (region[0], region[2]) if region is not None else (0, 0)
+        h, w = img_shape[0] * level, img_shape[1] * level
+        return (c0 - 0.5, c0 + w - 0.5, r0 + h - 0.5, r0 - 0.5)
+
+    def update_image(self, img_data, vmin, vmax, log_scale=False, title="", cbar_label=None, fast=False, direct=False,
+                     extent=None):
+        """
+        更新主图像。
+        fast=True (播放时): [新增] 走 Blitting 路径，只重绘图像 / ROI / 标题；
+        Colorbar 仅在显示范围变化时更新 (最多每 COLORBAR_REFRESH_S 秒一次完整重绘)。
+        direct=True (播放时): [新增] 用 FastImageViewer 直接显示，不经过 Matplotlib。
+        extent: [新增] 显示金字塔图像在全分辨率坐标下的范围，None = 整幅全分辨率。
+        """
         if self.im_object is None: return
+        if extent is None: extent = self.display_extent(img_data.shape)
+        if tuple(self.im_object.get_extent()) != tuple(extent): self.im_object.set_extent(extent)
         if log_scale:
             safe_vmin = max(vmin, 0.1)
             safe_vmax = max(vmax, safe_vmin * 1.1)
             norm = LogNorm(vmin=safe_vmin, vmax=safe_vmax)
         else:
             norm = Normalize(vmin=vmin, vmax=vmax)
-            
+        norm_key = (type(norm), norm.vmin, norm.vmax, cbar_label)
+
+        if fast and direct:
+            self._update_image_direct(img_data, norm.vmin, norm.vmax, log_scale, title)
+            return
+        if self.fast_viewer is not None and self.fast_viewer.visible: self._hide_direct()
+        if fast:
+            self._update_image_blit(img_data, norm, norm_key, title, cbar_label)
+            return
+        if self._blit_active: self.end_fast_render(redraw=False)
+
         self.im_object.set_data(img_data)
         self.im_object.set_norm(norm)
         if self.cbar: 
             self.cbar.update_normal(self.im_object)
             if cbar_label: self.cbar.set_label(cbar_label)
+        self._norm_key = norm_key
         self.ax.set_title(title)
         self.canvas.draw_idle()
 
+    # =========================================================
+    #  [新增] Blitting 快速渲染 (播放)
+    # =========================================================
+    COLORBAR_REFRESH_S = 0.25
+
+    def _on_draw_event(self, event):
+        """完整重绘后缓存背景 (不含动画 Artist)，并把动画 Artist 画回去"""
+        if not self._blit_active: return
+        self._blit_bg = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        self.ax.draw_artist(self.im_object)
+        # ROI 图形在图像之上，需要一起重绘
+        for a in self.ax.patches + self.ax.lines:
+            if a.get_visible(): self.ax.draw_artist(a)
+        self.ax.draw_artist(self.ax.title)
+
+    def _full_draw(self):
+        self.canvas.draw()
+        self._last_full_draw = time.perf_counter()
+
+    def _update_image_blit(self, img_data, norm, norm_key, title, cbar_label):
+        if not self._blit_active:
+            self._blit_active = True
+            self.im_object.set_animated(True)
+            self.ax.title.set_animated(True)
+            self._blit_bg = None
+
+        self.im_object.set_data(img_data)
+        self.ax.set_title(title)
+
+        if norm_key != self._norm_key:
+            if type(self.im_object.norm) is type(norm):
+                # 原地修改上下限，图像立即生效
+                self.im_object.norm.vmin, self.im_object.norm.vmax = norm.vmin, norm.vmax
+            else:
+                self.im_object.set_norm(norm)
+                self._blit_bg = None
+            # Colorbar 需要完整重绘，限制频率以免拖慢播放
+            if self._blit_bg is None or time.perf_counter() - self._last_full_draw > self.COLORBAR_REFRESH_S:
+                if self.cbar:
+                    self.cbar.update_normal(self.im_object)
+                    if cbar_label: self.cbar.set_label(cbar_label)
+                self._norm_key = norm_key
+                self._full_draw()  # 触发 draw_event -> 重新缓存背景
+                return
+
+        if self._blit_bg is None:
+            self._full_draw()
+            return
+        self.canvas.restore_region(self._blit_bg)
+        self._draw_animated()
+        self.canvas.blit(self.fig.bbox)
+
+    def _update_image_direct(self, img_data, vmin, vmax, log_scale, title):
+        if self._blit_active: self.end_fast_render(redraw=False)
+        if self.fast_viewer is None:
+            self.fast_viewer = FastImageViewer(self.parent, bg=to_hex(self.fig.get_facecolor()))
+        if not self.fast_viewer.visible:
+            # 用与画布相同的尺寸替换画布
+            size = (self.canvas_widget.winfo_width(), self.canvas_widget.winfo_height() - 24)
+            self.canvas_widget.pack_forget()
+            self.fast_viewer.label.pack(fill="both", expand=True)
+            self.fast_viewer.visible = True
+        else:
+            size = None
+        self.fast_viewer.show(img_data, vmin, vmax, self.im_object.get_cmap(),
+                              log_scale=log_scale, title=title, size=size)
+
+    def _hide_direct(self):
+        self.fast_viewer.label.pack_forget()
+        self.fast_viewer.visible = False
+        self.canvas_widget.pack(fill="both", expand=True)
+
+    def end_fast_render(self, redraw=True):
+        """[新增] 结束 Blitting / 直接渲染模式，恢复常规渲染"""
+        if self.fast_viewer is not None and self.fast_viewer.visible: self._hide_direct()
+        if not self._blit_active: return
+        self._blit_active = False
+        self._blit_bg = None
+        if self.im_object is not None: self.im_object.set_animated(False)
+        self.ax.title.set_animated(False)
+        self._norm_key = None
+        if redraw: self.canvas.draw_idle()
+
     def update_cmap(self, cmap_name, bg_color_str):
         if self.im_object is None: return
         cmap = plt.get_cmap(cmap_name).copy()
@@ -184,6 +347,339 @@ class PlotManager:
     def get_ax(self): return self.ax
 
 
+class FastImageViewer:
+    """
+    [新增] 播放专用的直接渲染器：numpy LUT 映射 -> PPM -> Tk PhotoImage，完全绕过 Matplotlib。
+    按显示尺寸最近邻缩放后再上色，耗时与原始图像大小基本无关。不绘制 ROI / Colorbar。
+    """
+    def __init__(self, parent, bg="#FFFFFF"):
+        self.label = tk.Label(parent, bg=bg, compound="top", font=("Segoe UI", 10))
+        self.photo = tk.PhotoImage(master=parent)
+        self.label.config(image=self.photo)
+        self.bg = bg
+        self._lut = None
+        self._lut_key = None
+        self.visible = False
+
+    def _get_lut(self, cmap):
+        bad = cmap.get_bad()
+        # bad 颜色透明时用背景色代替 (与 Matplotlib 中透出 Figure 背景的效果一致)
+        bad_rgb = self.label.winfo_rgb(self.bg) if bad[3] == 0 else None
+        if bad_rgb is not None: bad_rgb = tuple(c / 65535 for c in bad_rgb)
+        key = (cmap.name, tuple(bad), bad_rgb)
+        if key != self._lut_key:
+            self._lut = build_colormap_lut(cmap, 256, bad_rgb=bad_rgb)
+            self._lut_key = key
+        return self._lut
+
+    def _fit_shape(self, shape, width, height):
+        h, w = shape
+        if width < 10 or height < 10: return shape
+        scale = min(width / w, height / h)
+        return max(1, int(h * scale)), max(1, int(w * scale))
+
+    def show(self, img, vmin, vmax, cmap, log_scale=False, title="", size=None):
+        if size is None: size = (self.label.winfo_width(), self.label.winfo_height() - 24)
+        out_shape = self._fit_shape(img.shape, *size)
+        rgb = frame_to_rgb(img, vmin, vmax, self._get_lut(cmap), log_scale=log_scale, out_shape=out_shape)
+        h, w = rgb.shape[:2]
+        self.photo.configure(data=b"P6 %d %d 255 " % (w, h) + rgb.tobytes(), format="PPM", width=w, height=h)
+        self.label.config(text=title)
+
+
+class PlaybackEngine:
+    """
+    [新增] 播放引擎 (生产者 / 消费者)。
+    后台线程按播放顺序预取处理后的帧，放入有界缓冲区；Tk 线程按墙钟取帧渲染，落后时丢帧。
+    fps=None 表示 Max：不计时、不丢帧，吞吐量取决于计算与渲染中较慢的一方。
+    """
+    BUFFER_SIZE = 8
+
+    def __init__(self, root, get_frame, render, on_stats=None):
+        # get_frame(idx, params) 在后台线程调用；render(idx, img, params) / on_stats(achieved, fps, dropped) 在 Tk 线程调用
+        self.root = root
+        self.get_frame = get_frame
+        self.render = render
+        self.on_stats = on_stats
+        self.running = False
+        self.fps = None
+        self.params = None
+        self._cond = threading.Condition()
+        self._buf = collections.deque()   # (tick, frame_idx, img, params)
+        self._gen = 0                     # 启动 / 参数变化时递增，旧的生产者线程据此退出
+        self._next_tick = 0               # 生产者下一个要计算的序号
+        self._min_tick = 0                # 消费者已越过的序号，生产者不再计算更早的帧
+        self._last_tick = -1              # 最近一次渲染的序号
+        self._after_id = None
+
+    # --- 控制 (Tk 线程) ---
+    def start(self, start_idx, n_frames, fps, params):
+        self.stop()
+        self.running = True
+        self._start_idx, self._n = start_idx, n_frames
+        self.fps, self.params = fps, params
+        self._last_tick = -1
+        self._t0 = time.perf_counter()
+        self._stat_t0, self._stat_frames, self.dropped = self._t0, 0, 0
+        self._restart(0)
+        self._after_id = self.root.after(1, self._tick)
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._gen += 1
+            self._buf.clear()
+            self._cond.notify_all()
+        if self._after_id is not None:
+            try: self.root.after_cancel(self._after_id)
+            except Exception: pass
+            self._after_id = None
+
+    def set_fps(self, fps):
+        if not self.running or fps == self.fps: return
+        self.fps = fps
+        # 以当前播放位置为起点重新计时
+        if fps: self._t0 = time.perf_counter() - (self._last_tick + 1) / fps
+        self._stat_t0, self._stat_frames = time.perf_counter(), 0
+
+    def seek(self, idx):
+        """从第 idx 帧重新开始播放"""
+        if not self.running: return
+        self._start_idx = idx % self._n
+        self._last_tick = -1
+        self._t0 = time.perf_counter()
+        self._restart(0)
+
+    def update_params(self, params):
+        """处理参数变化：丢弃已预取的帧，从当前位置重新预取"""
+        if not self.running or params == self.params: return
+        self.params = params
+        self._restart(self._last_tick + 1)
+
+    def _restart(self, from_tick):
+        with self._cond:
+            self._gen += 1
+            self._buf.clear()
+            self._next_tick = self._min_tick = from_tick
+            self._cond.notify_all()
+            gen, params = self._gen, self.params
+        threading.Thread(target=self._produce, args=(gen, params), daemon=True).start()
+
+    # --- 生产者 (后台线程) ---
+    def _produce(self, gen, params):
+        while True:
+            with self._cond:
+                while gen == self._gen and len(self._buf) >= self.BUFFER_SIZE:
+                    self._cond.wait()
+                if gen != self._gen: return
+                tick = max(self._next_tick, self._min_tick)
+                self._next_tick = tick + 1
+            idx = (self._start_idx + tick) % self._n
+            try: img = self.get_frame(idx, params)
+            except Exception: img = None
+            with self._cond:
+                if gen != self._gen: return
+                self._buf.append((tick, idx, img, params))
+                self._cond.notify_all()
+
+    # --- 消费者 (Tk 线程) ---
+    def _tick(self):
+        self._after_id = None
+        if not self.running: return
+        now = time.perf_counter()
+        target = None if self.fps is None else int((now - self._t0) * self.fps)
+        frame = None
+        with self._cond:
+            if target is None:
+                if self._buf: frame = self._buf.popleft()
+            elif target > self._last_tick:
+                # 取不晚于目标的最新一帧，之前的帧丢弃
+                while self._buf and self._buf[0][0] <= target:
+                    frame = self._buf.popleft()
+                self._min_tick = max(self._min_tick, target)
+            self._cond.notify_all()
+
+        if frame is not None:
+            tick, idx, img, params = frame
+            if target is not None: self.dropped += max(0, tick - self._last_tick - 1)  # 跳过的帧
+            self._last_tick = tick
+            try:
+                if img is not None: self.render(idx, img, params)
+            except Exception as e:
+                print(f"Playback render error: {e}")
+                self.stop(); return
+            self._stat_frames += 1
+            elapsed = time.perf_counter() - self._stat_t0
+            if elapsed >= 1.0 and self.on_stats is not None:
+                self.on_stats(self._stat_frames / elapsed, self.fps, self.dropped)
+                self._stat_t0, self._stat_frames = time.perf_counter(), 0
+        if not self.running: return
+
+        if self.fps is None:
+            delay = 1 if frame is not None else 3  # Max 模式立即继续；缓冲区为空时短轮询
+        elif frame is None and target > self._last_tick:
+            delay = 3  # 已落后，等待生产者
+        else:
+            due = self._t0 + (self._last_tick + 1) / self.fps
+            delay = max(1, int((due - time.perf_counter()) * 1000))
+        self._after_id = self.root.after(delay, self._tick)
+
+
+class RenderScheduler:
+    """
+    [新增] 合并滑块触发的重绘。
+    请求在一个显示刷新周期 (interval_ms) 内合并为一次；帧计算 (含平滑) 在后台线程执行，
+    同一时刻只有一个计算任务，期间到来的请求合并为下一次；过期结果 (已被更新的渲染取代) 直接丢弃。
+    """
+    def __init__(self, root, snapshot, compute, render, interval_ms=16):
+        # snapshot() 在 Tk 线程采集参数；compute(snap) 在后台线程执行；render(snap, result) 在 Tk 线程执行
+        self.root = root
+        self.snapshot = snapshot
+        self.compute = compute
+        self.render = render
+        self.interval_ms = interval_ms
+        self._after_id = None
+        self._busy = False
+        self._dirty = False
+        self._seq = 0           # 请求序号
+        self._rendered_seq = 0  # 已显示结果的序号
+
+    def request(self):
+        self._dirty = True
+        if self._after_id is None and not self._busy:
+            self._after_id = self.root.after(self.interval_ms, self._flush)
+
+    def mark_rendered(self):
+        """同步渲染后调用：取消待处理请求，丢弃正在计算的旧结果"""
+        self._seq += 1
+        self._rendered_seq = self._seq
+        self._dirty = False
+        if self._after_id is not None:
+            try: self.root.after_cancel(self._after_id)
+            except Exception: pass
+            self._after_id = None
+
+    def _flush(self):
+        self._after_id = None
+        if not self._dirty or self._busy: return
+        self._dirty = False
+        self._busy = True
+        self._seq += 1
+        seq, snap = self._seq, self.snapshot()
+        threading.Thread(target=self._work, args=(seq, snap), daemon=True).start()
+
+    def _work(self, seq, snap):
+        try: result = self.compute(snap)
+        except Exception as e:
+            print(f"Render compute error: {e}"); result = None
+        self.root.after(0, self._deliver, seq, snap, result)
+
+    def _deliver(self, seq, snap, result):
+        self._busy = False
+        if seq > self._rendered_seq and result is not None:
+            self._rendered_seq = seq
+            self.render(snap, result)
+        if self._dirty and self._after_id is None:
+            # 计算期间又有新请求：立即开始下一次 (已等待过一个计算周期)
+            self._after_id = self.root.after(1, self._flush)
+
+
+class ProgressTask:
+    """
+    [新增] 后台任务的进度句柄：工作线程只写计数器和阶段名，不触碰 Tk。
+    可直接作为 progress_callback(curr, total) 传给 Model。
+    """
+    def __init__(self, name, total=0, stage="", on_update=None):
+        self.name = name
+        self.on_update = on_update   # on_update(info) 在 Tk 线程调用
+        self._lock = threading.Lock()
+        self.done = 0
+        self.total = total
+        self.stage = stage
+        self.finished = False
+        self.t0 = self._stage_t0 = time.perf_counter()
+
+    # --- 工作线程 ---
+    def __call__(self, curr, total=None):
+        self.update(curr, total)
+
+    def update(self, done, total=None):
+        with self._lock:
+            if total is not None: self.total = total
+            self.done = done
+
+    def set_stage(self, stage, total=None):
+        """进入新阶段：计数清零，吞吐量重新计时"""
+        with self._lock:
+            self.stage, self.done, self._stage_t0 = stage, 0, time.perf_counter()
+            if total is not None: self.total = total
+
+    def finish(self):
+        with self._lock:
+            self.finished = True
+
+    # --- Tk 线程 ---
+    def snapshot(self):
+        with self._lock:
+            done, total, stage, finished, t_stage = self.done, self.total, self.stage, self.finished, self._stage_t0
+        now = time.perf_counter()
+        dt = now - t_stage
+        rate = done / dt if dt > 0 and done > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 and total > done else None
+        return dict(name=self.name, stage=stage, done=done, total=total, rate=rate, eta=eta,
+                    elapsed=now - self.t0, finished=finished)
+
+
+class ProgressBus:
+    """
+    [新增] 进度事件总线：工作线程写 ProgressTask (加锁的计数器 + 阶段名)，
+    Tk 线程按固定频率轮询并回调 on_update，取代逐帧 root.after，避免长任务淹没事件队列。
+    """
+    POLL_MS = 100
+
+    def __init__(self, root):
+        self.root = root
+        self._tasks = []
+        self._last = {}
+        self._after_id = None
+
+    def start(self, name, total=0, stage="", on_update=None):
+        """登记一个任务 (Tk 线程调用)，返回交给工作线程的 ProgressTask"""
+        task = ProgressTask(name, total, stage, on_update)
+        self._tasks.append(task)
+        if self._after_id is None:
+            self._after_id = self.root.after(self.POLL_MS, self._poll)
+        return task
+
+    def _poll(self):
+        self._after_id = None
+        for task in list(self._tasks):
+            info = task.snapshot()
+            sig = (info['stage'], info['done'], info['total'], info['finished'])
+            if self._last.get(task) != sig:
+                self._last[task] = sig
+                if task.on_update is not None:
+                    try: task.on_update(info)
+                    except Exception as e: print(f"Progress update error: {e}")
+            if info['finished']:
+                self._tasks.remove(task)
+                self._last.pop(task, None)
+        if self._tasks:
+            self._after_id = self.root.after(self.POLL_MS, self._poll)
+
+    @staticmethod
+    def describe(info):
+        """格式化为 "Stage 120/500 · 45.2 fr/s · ETA 0:08" """
+        parts = []
+        if info['stage']: parts.append(info['stage'])
+        if info['total']: parts.append(f"{info['done']}/{info['total']}")
+        if info['rate'] > 0: parts.append(f"{info['rate']:.1f} fr/s")
+        if info['eta'] is not None:
+            m, s = divmod(int(round(info['eta'])), 60)
+            parts.append(f"ETA {m}:{s:02d}")
+        return " · ".join(parts)
+
+
 class RoiManager:
     def __init__(self, app_instance):
         self.app = app_instance
@@ -193,6 +689,7 @@ class RoiManager:
         
         # 直线交互状态
         self.line_start_pt = None
+        self.poly_pts = []             # [新增] 正在绘制的折线顶点
         self.temp_line_artist = None
         self.dragging_roi = None       
         self.dragging_point_idx = -1   # 0=起点, 1=终点, 2=中点(平移)
@@ -209,6 +706,9 @@ class RoiManager:
         self.is_drawing_bg = False
         self.last_drag_time = 0
 
+        # [新增] ROI 曲线额外计算的统计量 (Mean 总是计算)，由绘图窗口按需追加
+        self.trace_stats = ["mean"]
+
     def set_draw_button(self, btn_widget):
         self.btn_draw_ref = btn_widget
 
@@ -228,7 +728,7 @@ class RoiManager:
         self._stop_selector(clear_events=True)
         self.current_shape_mode = mode
 
-        if mode == "line":
+        if mode in ("line", "polyline"):
             self._connect_line_events()
             self.app.root.config(cursor="cross")
         elif mode:
@@ -239,6 +739,7 @@ class RoiManager:
     def cancel_drawing(self):
         """ESC 键按下时调用"""
         self.line_start_pt = None
+        self.poly_pts = []
         if self.temp_line_artist:
             self.temp_line_artist.remove()
             self.temp_line_artist = None
@@ -282,7 +783,7 @@ class RoiManager:
         self.is_drawing_bg = is_background 
         if self.btn_draw_ref: self.btn_draw_ref.state(['selected']) 
         
-        if self.current_shape_mode == "line":
+        if self.current_shape_mode in ("line", "polyline"):
             return
 
         if self.is_drawing_bg:
@@ -315,6 +816,15 @@ class RoiManager:
              return
 
         click_pt = (event.xdata, event.ydata)
+
+        # [新增] 折线绘制中：左键添加顶点，双击或右键结束
+        if self.current_shape_mode == "polyline" and (self.poly_pts or event.button == 3):
+            if event.button == 3 or event.dblclick:
+                self._finish_polyline()
+            else:
+                self.poly_pts.append(click_pt)
+            return
+
         min_dist = float('inf')
         target_roi = None
         pt_idx = -1 
@@ -322,7 +832,13 @@ class RoiManager:
         threshold = 30.0 # 拾取阈值
         
         for roi in self.roi_list:
-            if roi['type'] == 'line':
+            if roi['type'] == 'polyline':
+                # [新增] 折线: 每个顶点都是拖动手柄
+                for k, v in enumerate(roi['params']):
+                    d = np.hypot(v[0]-click_pt[0], v[1]-click_pt[1])
+                    if d < threshold and d < min_dist:
+                        min_dist = d; target_roi = roi; pt_idx = k
+            elif roi['type'] == 'line':
                 p1, p2 = roi['params']
                 
                 # 计算端点距离
@@ -348,11 +864,30 @@ class RoiManager:
             self.dragging_point_idx = pt_idx
             return 
 
+        if self.current_shape_mode == "polyline":
+            self.poly_pts = [click_pt]
+            return
+
         self.line_start_pt = (event.xdata, event.ydata)
 
     def _on_line_drag(self, event):
         if event.inaxes != self.ax_ref: return
         
+        # A0. [新增] 拖动折线顶点
+        if self.dragging_roi and self.dragging_roi['type'] == 'polyline':
+            pts = list(self.dragging_roi['params'])
+            pts[self.dragging_point_idx] = (event.xdata, event.ydata)
+            self.dragging_roi['params'] = pts
+            group = self.dragging_roi['patch_group']
+            xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+            group[0].set_data(xs, ys)
+            group[1].set_data(xs, ys)
+            group[2 + self.dragging_point_idx].center = pts[self.dragging_point_idx]
+            self.app.plot_mgr.canvas.draw_idle()
+            if hasattr(self.app, 'update_kymograph_for_roi'):
+                self.app.update_kymograph_for_roi(self.dragging_roi)
+            return
+
         # A. 拖动模式
         if self.dragging_roi:
             p1, p2 = self.dragging_roi['params']
@@ -397,6 +932,16 @@ class RoiManager:
                 self.app.update_kymograph_for_roi(self.dragging_roi)
             return
 
+        # B0. [新增] 折线预览 (已有顶点 + 当前鼠标位置)
+        if self.poly_pts:
+            xs = [p[0] for p in self.poly_pts] + [event.xdata]
+            ys = [p[1] for p in self.poly_pts] + [event.ydata]
+            if self.temp_line_artist: self.temp_line_artist.remove()
+            self.temp_line_artist = mlines.Line2D(xs, ys, color='yellow', linestyle='--', marker='o', markersize=3)
+            self.ax_ref.add_line(self.temp_line_artist)
+            self.app.plot_mgr.canvas.draw_idle()
+            return
+
         # B. 画新线预览
         if self.line_start_pt:
             x0, y0 = self.line_start_pt
@@ -442,6 +987,29 @@ class RoiManager:
             
             self.line_start_pt = None
 
+    def _finish_polyline(self):
+        """[新增] 结束折线绘制，至少两个顶点时生成 polyline ROI"""
+        pts = self.poly_pts
+        self.poly_pts = []
+        if self.temp_line_artist:
+            self.temp_line_artist.remove()
+            self.temp_line_artist = None
+        # 双击会在同一位置重复添加顶点，去掉相邻重复点
+        clean = [p for i, p in enumerate(pts) if i == 0 or np.hypot(p[0]-pts[i-1][0], p[1]-pts[i-1][1]) > 1.0]
+        if len(clean) >= 2:
+            next_id = len(self.roi_list) + 1
+            color = ROI_COLORS[(next_id - 1) % len(ROI_COLORS)]
+            patch_group = self._create_high_contrast_roi("polyline", clean, color)
+            self.roi_list.append({
+                'type': 'polyline',
+                'patch_group': patch_group,
+                'mask': None,
+                'color': color,
+                'id': next_id,
+                'params': clean
+            })
+        self.app.plot_mgr.canvas.draw_idle()
+
     # =========================================================
 
     def _update_temp_roi_data(self, extents):
@@ -487,7 +1055,7 @@ class RoiManager:
         self.temp_roi = {'type': "polygon", 'params': verts, 'mask': mask, 'color': color, 'id_display': next_id}
         self._commit_temp_roi()
 
-    def _create_high_contrast_roi(self, rtype, params, color):
+    def _create_high_contrast_roi(self, rtype, params, color, style="full"):
         patches = []
         if rtype == "line":
             (x1, y1), (x2, y2) = params
@@ -515,6 +1083,27 @@ class RoiManager:
             # 返回顺序很重要，拖动更新时会用到
             return [line_bg, line_fg, c_start, c_end, c_mid]
 
+        if rtype == "polyline":
+            # [新增] 折线: 线条 + 每个顶点一个拖动圆点 (顺序: bg, fg, 顶点...)
+            xs = [p[0] for p in params]; ys = [p[1] for p in params]
+            line_bg = mlines.Line2D(xs, ys, color='white', linewidth=3, alpha=0.8)
+            line_fg = mlines.Line2D(xs, ys, color=color, linewidth=1.5, linestyle='-')
+            self.ax_ref.add_line(line_bg)
+            self.ax_ref.add_line(line_fg)
+            group = [line_bg, line_fg]
+            for p in params:
+                c = Circle(tuple(p), radius=4, color=color, alpha=0.6)
+                self.ax_ref.add_patch(c)
+                group.append(c)
+            return group
+
+        # [新增] 轻量样式：仅一条彩色轮廓 (用于自动分割生成的大量 ROI，减少 Artist 数量)
+        if style == "outline" and rtype == "polygon":
+            p = Polygon(params, linewidth=1, edgecolor=color, facecolor='none', closed=True)
+            # add_artist 不触发 data limits 更新 (坐标范围已由图像确定)，批量添加时快得多
+            self.ax_ref.add_artist(p)
+            return [p]
+
         fill_alpha = 0.6
         if rtype == "rect":
             x, y, w, h = params
@@ -573,6 +1162,7 @@ class RoiManager:
             item = {"type": roi['type'], "color": roi['color'], "id": roi['id']}
             if roi['type'] == "polygon": item["params"] = np.array(roi['params']).tolist() 
             else: item["params"] = roi['params']
+            if roi.get('style', "full") != "full": item["style"] = roi['style']
             data_to_save.append(item)
             
         try:
@@ -593,15 +1183,16 @@ class RoiManager:
                 rtype = item["type"]
                 params = item["params"]
                 color = item.get("color", ROI_COLORS[0])
+                style = item.get("style", "full")
                 if rtype == "polygon": params = np.array(params)
                 else:
                     params = tuple(params)
                     if rtype == "circle": params = (tuple(params[0]), params[1], params[2])
                 mask = None
-                if rtype != "line":
-                    mask = self._generate_mask(rtype, params)
+                if rtype not in ("line", "polyline"):
+                    mask = self._generate_mask(rtype, params, crop=(rtype == "polygon"))
                     if mask is None: continue
-                patch_group = self._create_high_contrast_roi(rtype, params, color)
+                patch_group = self._create_high_contrast_roi(rtype, params, color, style)
                 if patch_group:
                     self.roi_list.append({
                         'type': rtype,
@@ -609,13 +1200,19 @@ class RoiManager:
                         'mask': mask,
                         'color': color,
                         'id': len(self.roi_list) + 1,
-                        'params': params
+                        'params': params,
+                        'style': style
                     })
             self.app.plot_mgr.canvas.draw_idle()
             messagebox.showinfo("Success", f"Loaded {len(self.roi_list)} ROIs.")
         except Exception as e: messagebox.showerror("Error", f"Failed to load ROIs:\n{e}")
 
-    def _generate_mask(self, shape_type, params):
+    def _generate_mask(self, shape_type, params, crop=False):
+        """
+        生成 ROI 的 bool Mask。
+        [新增] crop=True 时多边形只返回外接矩形内的裁剪形式 (y0, x0, crop)，
+        大量 ROI (自动分割 / 工程文件) 不必各自占用整幅图像大小的内存。
+        """
         if self.app.data1 is None: return None
         h, w = self.app.data1.shape[1], self.app.data1.shape[2]
         try:
@@ -633,16 +1230,59 @@ class RoiManager:
                 y, x = np.ogrid[:h, :w]
                 return (((x - center[0]) / (width/2))**2 + ((y - center[1]) / (height/2))**2) <= 1
             elif shape_type == "polygon":
-                verts = params
-                y, x = np.mgrid[:h, :w]
+                verts = np.asarray(params, dtype=np.float64)
+                # [优化] 只在多边形外接矩形内做 contains_points，而不是整幅图像
+                x0 = int(max(0, np.floor(verts[:, 0].min())))
+                x1 = int(min(w, np.ceil(verts[:, 0].max()) + 1))
+                y0 = int(max(0, np.floor(verts[:, 1].min())))
+                y1 = int(min(h, np.ceil(verts[:, 1].max()) + 1))
+                x1, y1 = max(x0, x1), max(y0, y1)
+                y, x = np.mgrid[y0:y1, x0:x1]
                 points = np.vstack((x.ravel(), y.ravel())).T
-                mpl_path = MplPath(verts)
-                return mpl_path.contains_points(points).reshape(h, w)
+                inside = MplPath(verts).contains_points(points).reshape(y1 - y0, x1 - x0)
+                if crop: return (y0, x0, inside)
+                mask = np.zeros((h, w), dtype=bool)
+                mask[y0:y1, x0:x1] = inside
+                return mask
         except Exception: return None
         return None
 
+    def add_rois_from_segmentation(self, labels, regions):
+        """
+        [新增] 将自动分割结果批量加入 roi_list。
+        Mask 直接由标签图在外接矩形内切片生成 (无需整图 contains_points)，
+        [修改] 并以裁剪形式 (y0, x0, crop) 保存，内存与 ROI 大小成正比而不是整幅图像；
+        轮廓保存为 polygon 参数，因此与 JSON 保存 / 工程文件完全兼容。
+        """
+        if self.ax_ref is None or labels is None: return 0
+        if self.temp_roi: self._commit_temp_roi()
+        self._stop_selector()
+
+        added = 0
+        for region in regions:
+            x, y, bw, bh = region['bbox']
+            mask = (y, x, labels[y:y + bh, x:x + bw] == region['label'])
+
+            verts = region_outline(labels, region)
+            next_id = len(self.roi_list) + 1
+            color = ROI_COLORS[(next_id - 1) % len(ROI_COLORS)]
+            patch_group = self._create_high_contrast_roi("polygon", verts, color, style="outline")
+            self.roi_list.append({
+                'type': "polygon",
+                'patch_group': patch_group,
+                'mask': mask,
+                'color': color,
+                'id': next_id,
+                'params': verts,
+                'style': "outline"
+            })
+            added += 1
+
+        self.app.plot_mgr.canvas.draw_idle()
+        return added
+
     def remove_last(self):
-        if self.current_shape_mode == "line" and self.line_start_pt:
+        if (self.current_shape_mode == "line" and self.line_start_pt) or self.poly_pts:
             self.cancel_drawing()
             return
         if self.temp_roi:
@@ -672,11 +1312,12 @@ class RoiManager:
 
     def get_last_line_roi(self):
         for roi in reversed(self.roi_list):
-            if roi['type'] == 'line':
+            if roi['type'] in ('line', 'polyline'):
                 return roi
         return None
 
-    def plot_curve(self, interval=1.0, unit='s', is_log=False, do_norm=False, int_thresh=0, ratio_thresh=0):
+    def plot_curve(self, interval=1.0, unit='s', is_log=False, do_norm=False, int_thresh=0, ratio_thresh=0,
+                   baseline="global", baseline_window=100):
         if not self.roi_list and not self.temp_roi: return
         if self.is_calculating: return
         
@@ -700,12 +1341,16 @@ class RoiManager:
             self.is_calculating = False
             return
 
+        # [新增] 曲线提取通过进度总线报告 (按帧块)
+        progress = self.app.start_roi_progress("roi_traces", total=data_num.shape[0], stage="Traces")
         threading.Thread(
             target=self._calc_multi_roi_thread, 
-            args=(data_num, data_den, bg_num, bg_den, data_aux_list, bg_aux_list, interval, unit, is_log, do_norm, task_list, int_thresh, ratio_thresh)
+            args=(data_num, data_den, bg_num, bg_den, data_aux_list, bg_aux_list, interval, unit, is_log, do_norm, task_list, int_thresh, ratio_thresh,
+                  baseline, baseline_window, progress)
         ).start()
 
-    def _calc_multi_roi_thread(self, data_num, data_den, bg_num, bg_den, data_aux_list, bg_aux_list, interval, unit, is_log, do_norm, task_list, int_thresh, ratio_thresh):
+    def _calc_multi_roi_thread(self, data_num, data_den, bg_num, bg_den, data_aux_list, bg_aux_list, interval, unit, is_log, do_norm, task_list, int_thresh, ratio_thresh,
+                               baseline="global", baseline_window=100, progress=None):
         try:
             results = []
             
@@ -719,46 +1364,36 @@ class RoiManager:
                 if f0 > 1e-6: return (arr - f0) / f0
                 else: return np.zeros_like(arr)
 
-            for item in task_list:
-                mask = item['mask']
-                if mask is None or np.sum(mask) == 0: continue
-
-                y_idxs, x_idxs = np.where(mask)
-                
-                roi_num = data_num[:, y_idxs, x_idxs].astype(np.float32) - bg_num
-                roi_num = np.clip(roi_num, 0, None)
-                means_num = np.nanmean(roi_num, axis=1)
-                means_num = np.nan_to_num(means_num, nan=0.0)
-
-                if data_den is None:
-                    means_ratio = means_num.copy()
-                    means_den = np.zeros_like(means_num)
-                else:
-                    roi_den = data_den[:, y_idxs, x_idxs].astype(np.float32) - bg_den
-                    roi_den = np.clip(roi_den, 0, None)
-                    mask_valid = (roi_num > int_thresh) & (roi_den > int_thresh) & (roi_den > 0.001)
-                    roi_ratio = np.full_like(roi_num, np.nan)
-                    np.divide(roi_num, roi_den, out=roi_ratio, where=mask_valid)
-                    if ratio_thresh > 0: roi_ratio[roi_ratio < ratio_thresh] = np.nan
-                    means_ratio = np.nanmean(roi_ratio, axis=1)
-                    means_ratio = np.nan_to_num(means_ratio, nan=0.0)
-                    means_den = np.nanmean(roi_den, axis=1)
-                    means_den = np.nan_to_num(means_den, nan=0.0)
-                
-                means_aux = []
-                for i, d_aux in enumerate(data_aux_list):
-                    bg_val = bg_aux_list[i] if i < len(bg_aux_list) else 0
-                    roi_aux = d_aux[:, y_idxs, x_idxs].astype(np.float32) - bg_val
-                    roi_aux = np.clip(roi_aux, 0, None)
-                    m = np.nanmean(roi_aux, axis=1)
-                    m = np.nan_to_num(m, nan=0.0)
-                    if do_norm: m = calc_dff(m)
-                    means_aux.append(m)
-
-                if do_norm:
+            # [优化] 所有 ROI 合并为一次分帧块 gather，峰值内存固定 (见 extract_roi_traces)
+            # 裁剪形式的 Mask 为 (y0, x0, crop)，只检查裁剪部分
+            has_pixels = lambda m: np.any(m[-1] if isinstance(m, tuple) else m)
+            items = [it for it in task_list if it['mask'] is not None and has_pixels(it['mask'])]
+            if not items: return
+            traces = extract_roi_traces(
+                data_num, [it['mask'] for it in items], data_den, bg_num, bg_den,
+                data_aux_list, bg_aux_list, int_thresh, ratio_thresh,
+                stats=tuple(self.trace_stats), progress_callback=progress)
+            st = traces['stats']
+
+            if do_norm and baseline != "global":
+                # [新增] 滑动基线: 所有 ROI 的曲线一次性向量化归一化
+                norm = lambda a: rolling_dff(a, baseline_window, method=baseline)
+                traces['ratio'] = norm(traces['ratio'])
+                traces['num'] = norm(traces['num'])
+                if data_den is not None: traces['den'] = norm(traces['den'])
+                traces['aux'] = [norm(a) for a in traces['aux']]
+
+            for k, item in enumerate(items):
+                means_ratio = traces['ratio'][k]
+                means_num = traces['num'][k]
+                means_den = traces['den'][k]
+                means_aux = [aux[k] for aux in traces['aux']]
+
+                if do_norm and baseline == "global":
                     means_ratio = calc_dff(means_ratio)
                     means_num = calc_dff(means_num)
                     if data_den is not None: means_den = calc_dff(means_den)
+                    means_aux = [calc_dff(m) for m in means_aux]
                 
                 results.append({
                     'id': item['id'],
@@ -766,7 +1401,14 @@ class RoiManager:
                     'means': means_ratio,
                     'means_num': means_num,
                     'means_den': means_den,
-                    'means_aux': means_aux
+                    'means_aux': means_aux,
+                    # [新增] 其它统计量 (不做 ΔF/F 归一化): {通道: {stat: 曲线}}
+                    'stats': {
+                        'ratio': {n: a[k] for n, a in st['ratio'].items()},
+                        'num': {n: a[k] for n, a in st['num'].items()},
+                        'den': {n: a[k] for n, a in st['den'].items()},
+                        'aux': [{n: a[k] for n, a in d.items()} for d in st['aux']],
+                    }
                 })
 
             if not results: return
@@ -805,17 +1447,26 @@ class RoiManager:
             import traceback
             traceback.print_exc()
         finally:
+            if progress is not None: progress.finish()
             self.is_calculating = False
 
+    def request_trace_stat(self, stat):
+        """
+        [新增] 绘图窗口请求一个尚未计算的统计量：加入计算列表并重新提取曲线。
+        """
+        if stat in self.trace_stats: return
+        self.trace_stats.append(stat)
+        self.app.plot_roi_curve()
+
     def _process_background_roi(self, roi_data):
         mask = roi_data['mask']
         if mask is None or self.app.data1 is None: return
         try:
-            mean_img1 = np.mean(self.app.data1, axis=0) 
-            bg_val1 = np.mean(mean_img1[mask])
+            # [优化] 只提取 Mask 内的像素 (或复用缓存的 Mean 投影)，不再整栈求平均
+            session = self.app.session
+            bg_val1 = session.get_masked_mean(mask, channel=1)
             if self.app.data2 is not None:
-                mean_img2 = np.mean(self.app.data2, axis=0)
-                bg_val2 = np.mean(mean_img2[mask])
+                bg_val2 = session.get_masked_mean(mask, channel=2)
             else:
                 bg_val2 = 0.0
             self.app.set_custom_background(float(bg_val1), float(bg_val2))
@@ -843,6 +1494,7 @@ class RoiManager:
                 item["params"] = np.array(roi['params']).tolist() 
             else: 
                 item["params"] = roi['params']
+            if roi.get('style', "full") != "full": item["style"] = roi['style']
             data_list.append(item)
         return data_list
 
@@ -866,6 +1518,7 @@ class RoiManager:
                 rtype = item["type"]
                 params = item["params"]
                 color = item.get("color", ROI_COLORS[0])
+                style = item.get("style", "full")
 
                 # 参数类型转换 (JSON 加载回来通常是 list，需要转回 tuple 或 numpy)
                 if rtype == "polygon": 
@@ -878,12 +1531,12 @@ class RoiManager:
 
                 # 生成 Mask
                 mask = None
-                if rtype != "line":
-                    mask = self._generate_mask(rtype, params)
+                if rtype not in ("line", "polyline"):
+                    mask = self._generate_mask(rtype, params, crop=(rtype == "polygon"))
                     if mask is None: continue
 
                 # 创建视觉元素
-                patch_group = self._create_high_contrast_roi(rtype, params, color)
+                patch_group = self._create_high_contrast_roi(rtype, params, color, style)
                 
                 if patch_group:
                     self.roi_list.append({
@@ -892,7 +1545,8 @@ class RoiManager:
                         'mask': mask,
                         'color': color,
                         'id': len(self.roi_list) + 1,
-                        'params': params
+                        'params': params,
+                        'style': style
                     })
             except Exception as e: 
                 print(f"Error restoring ROI: {e}")
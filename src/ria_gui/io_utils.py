@@ -1,5 +1,4 @@
 # src/io_utils.py
-import tifffile as tiff
 import numpy as np
 import warnings
 import os
@@ -22,6 +21,7 @@ def read_and_split_multichannel(file_path, is_interleaved, n_channels=2, z_proje
     Universal reading function.
     override_axes: 如果用户手动指定了 Axes (如 'TYX')，则忽略文件自带的元数据。
     """
+    import tifffile as tiff  # [优化] 延迟导入，缩短启动时间
     try:
         with tiff.TiffFile(file_path) as tif:
             raw_data = tif.asarray()
@@ -110,6 +110,7 @@ def read_separate_files(path1, path2):
     if not os.path.exists(path1) or not os.path.exists(path2):
         raise FileNotFoundError("One or both files not found.")
 
+    import tifffile as tiff
     with tiff.TiffFile(path1) as tif:
         d1 = tif.asarray()
     
@@ -122,4 +123,192 @@ def read_separate_files(path1, path2):
 
     # 确保长度一致
     min_len = min(d1.shape[0], d2.shape[0])
-    return d1[:min_len], d2[:min_len]
\ No newline at end of file
+    return d1[:min_len], d2[:min_len]
+
+# =================================================================
+# [新增] Tiff 导出选项 (压缩 / 预测器 / 分块 / 多线程压缩)
+# =================================================================
+
+# UI 名称 -> tifffile compression 参数；zstd / LZW 编码需要 imagecodecs
+TIFF_CODECS = {"none": None, "zlib": "zlib", "zstd": "zstd", "lzw": "lzw"}
+
+
+def tiff_write_options(compression=None, level=None, predictor=True, tile=None, maxworkers=None):
+    """
+    [新增] 生成 TiffWriter.write / imwrite 的压缩相关参数。
+    compression: None / 'none' / 'zlib' / 'zstd' / 'lzw'
+    predictor: 压缩时使用预测器 (float32 为浮点预测器，对 NaN 掩膜的比率图效果明显)，需要 imagecodecs
+    tile: 分块边长 (16 的倍数)，None 表示按行条带存储
+    maxworkers: 压缩线程数，None 表示 CPU 核数
+    """
+    key = (compression or "none").lower()
+    if key not in TIFF_CODECS:
+        raise ValueError(f"Unsupported compression: {compression}")
+    codec = TIFF_CODECS[key]
+    opts = {}
+    if codec is not None:
+        try:
+            import imagecodecs
+        except ImportError:
+            imagecodecs = None
+        if imagecodecs is None and codec != "zlib":
+            raise ImportError(f"Missing Dependency: Please install 'imagecodecs' to use {key.upper()} compression.")
+        opts["compression"] = (codec, level) if level is not None else codec
+        # 预测器编码由 imagecodecs 提供，缺失时 zlib 退回无预测器
+        opts["predictor"] = bool(predictor and imagecodecs is not None)
+        opts["maxworkers"] = maxworkers or os.cpu_count() or 1
+    if tile:
+        tile = int(tile)
+        if tile % 16:
+            raise ValueError("Tile size must be a multiple of 16.")
+        opts["tile"] = (tile, tile)
+        opts.setdefault("maxworkers", maxworkers or os.cpu_count() or 1)
+    return opts
+
+
+def iter_tiff_chunks(frames, tile=None):
+    """[新增] 把逐帧迭代器转换为 TiffWriter 迭代写入所需的块顺序 (分块存储时逐帧按行优先切块)"""
+    if not tile:
+        yield from frames
+        return
+    th, tw = tile
+    for frame in frames:
+        h, w = frame.shape
+        for y in range(0, h, th):
+            for x in range(0, w, tw):
+                yield frame[y:y + th, x:x + tw]  # 边缘块由 tifffile 补零
+
+
+# =================================================================
+# [新增] 批量数据导出 (Trace Table)
+# =================================================================
+
+def _round_scaled(x, scale):
+    """
+    [修改] 返回 round(x * scale) 的整数，按 x 的精确十进制值舍入 (与 f-string 一致，平局取偶)。
+    浮点乘积只可能在恰好落到 .5 时改变舍入方向，这些元素用 Dekker 双积求出乘法误差来修正。
+    """
+    p = x * scale
+    n = np.rint(p)
+    half = np.abs(p - n) == 0.5
+    if half.any():
+        xs, ss, ps = x[half], np.broadcast_to(scale, x.shape)[half].astype(np.float64), p[half]
+        def split(v):
+            c = 134217729.0 * v  # 2^27 + 1
+            hi = c - (c - v)
+            return hi, v - hi
+        xh, xl = split(xs)
+        sh, sl = split(ss)
+        err = ((xh * sh - ps) + xh * sl + xl * sh) + xl * sl   # x * scale 的精确值 = p + err
+        n[half] = np.where(err > 0, np.ceil(ps), np.where(err < 0, np.floor(ps), n[half]))
+    return n.astype(np.int64)
+
+
+def _format_block(a, dec, sep):
+    """把一块 2D float 数组按列小数位数格式化为字节串 (全部为数组运算)。"""
+    rows, cols = a.shape
+    finite = np.isfinite(a)
+    av = np.where(finite, a, 0.0)
+    neg = np.signbit(av) & finite
+    scale = 10 ** dec
+    ip, fp = np.divmod(_round_scaled(np.abs(av), scale), scale)
+
+    # 每个数的整数位数
+    nd = np.ones(a.shape, dtype=np.int8)
+    k = 10
+    while True:
+        m = ip >= k
+        if not m.any(): break
+        nd += m
+        k *= 10
+    wi = int(nd.max()) + 1                  # 整数位 + 符号位
+    wd = int(dec.max())
+    width = wi + (1 + wd if wd > 0 else 0) + 1
+
+    # 定宽字符矩阵，0 作为占位符，最后一次性压缩掉
+    chars = np.zeros((rows, cols, width), dtype=np.uint8)
+    q = ip.copy()
+    for k in range(wi):
+        d = (q % 10).astype(np.uint8) + 48
+        chars[:, :, wi - 1 - k] = np.where(k < nd, d, np.where((k == nd) & neg, 45, 0))
+        q //= 10
+    if wd > 0:
+        chars[:, :, wi] = np.where(dec > 0, 46, 0)
+        for j in range(wd):
+            shift = np.maximum(dec - 1 - j, 0)
+            d = ((fp // (10 ** shift)) % 10).astype(np.uint8) + 48
+            chars[:, :, wi + 1 + j] = np.where(j < dec, d, 0)
+    chars[:, :, -1] = ord(sep)
+    chars[:, -1, -1] = 10
+
+    if not finite.all():
+        for r, c in zip(*np.nonzero(~finite)):
+            v = a[r, c]
+            word = b"nan" if np.isnan(v) else (b"inf" if v > 0 else b"-inf")
+            chars[r, c, :-1] = 0
+            chars[r, c, :len(word)] = np.frombuffer(word, dtype=np.uint8)
+
+    flat = chars.ravel()
+    return flat[flat != 0].tobytes()
+
+
+def format_table_text(header, table, decimals=5, sep="\t", block_rows=2048):
+    """
+    [新增] 把 (N, C) 数组批量格式化为文本表格 (等价于逐个 f"{v:.{d}f}"，含 .5 附近的舍入)。
+    decimals: 整数或每列一个的序列。
+    """
+    table = np.asarray(table, dtype=np.float64)
+    if table.ndim == 1: table = table[:, None]
+    dec = np.broadcast_to(np.asarray(decimals, dtype=np.int64), (table.shape[1],))
+    head = (sep.join(header) + "\n") if header else ""
+    if table.size == 0:
+        return head
+
+    # 超出 int64 精度范围时退回 numpy 的逐元素格式化
+    finite = table[np.isfinite(table)]
+    if finite.size and np.abs(finite).max() * 10.0 ** dec.max() >= 2 ** 52:
+        fmt = sep.join(f"%.{d}f" for d in dec) + "\n"
+        return head + "".join(fmt % tuple(row) for row in table)
+
+    body = b"".join(_format_block(table[i:i + block_rows], dec, sep)
+                    for i in range(0, table.shape[0], block_rows))
+    return head + body.decode("ascii")
+
+
+def export_table(path, header, table, decimals=5):
+    """
+    [新增] 一次调用把导出表写入文件，按扩展名选择格式:
+    .csv / .tsv / .txt (文本), .parquet (pyarrow), .h5 / .hdf5 (h5py)。
+    """
+    table = np.asarray(table, dtype=np.float64)
+    if table.ndim == 1: table = table[:, None]
+    header = list(header)
+    if len(header) != table.shape[1]:
+        raise ValueError(f"Header has {len(header)} columns, table has {table.shape[1]}.")
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext in (".csv", ".tsv", ".txt"):
+        sep = "," if ext == ".csv" else "\t"
+        text = format_table_text(header, table, decimals, sep=sep)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+
+    elif ext == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Missing Dependency: Please install 'pyarrow' to export Parquet files.")
+        pq.write_table(pa.table({name: table[:, i] for i, name in enumerate(header)}), path)
+
+    elif ext in (".h5", ".hdf5"):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("Missing Dependency: Please install 'h5py' to export HDF5 files.")
+        with h5py.File(path, "w") as f:
+            dset = f.create_dataset("traces", data=table)
+            dset.attrs["columns"] = np.array(header, dtype=h5py.string_dtype())
+
+    else:
+        raise ValueError(f"Unsupported export format: {ext or path}")
@@ -4,7 +4,6 @@ import tkinter as tk
 import ctypes
 import argparse
 import platform
-import tifffile
 import json       # [新增] 用于处理配置文件
 import logging    # [新增] 用于调试日志
 
@@ -74,16 +73,31 @@ sys.path.append(current_dir)
 
 # Import core modules
 try:
-    from gui import RatioAnalyzerApp
     from _version import __version__
+    import diagnostics
 except ImportError:
     try:
-        from src.gui import RatioAnalyzerApp
         from src._version import __version__
+        from src import diagnostics
     except ImportError as e:
         print(f"Error importing core modules: {e}")
         raise
 
+def load_app_class():
+    """
+    [优化] GUI 模块 (matplotlib / Tk 组件) 延迟到真正启动窗口时才导入，
+    --version / --sysinfo / --info 等命令无需加载整个图形栈。
+    """
+    try:
+        from gui import RatioAnalyzerApp
+    except ImportError:
+        try:
+            from src.gui import RatioAnalyzerApp
+        except ImportError as e:
+            print(f"Error importing core modules: {e}")
+            raise
+    return RatioAnalyzerApp
+
 # ==========================================
 # [新增] 功能处理函数
 # ==========================================
@@ -165,6 +179,7 @@ def handle_file_info(filepath):
         sys.exit(1)
 
     print(f"\nScanning: {filepath} ...")
+    import tifffile
     try:
         with tifffile.TiffFile(filepath) as tif:
             series = tif.series[0]
@@ -222,7 +237,12 @@ def main():
     # 5. [新增] 初始化配置
     parser.add_argument('-ini', '--init', action='store_true', help="Generate default configuration file (ria_config.json).")
 
-    # 6. 启动文件
+    # 6. [新增] 性能诊断 (报告写入当前目录 ria_perf_<时间戳>.txt)
+    parser.add_argument('--profile', action='store_true', help="Profile the GUI main loop with cProfile and write a report on exit.")
+    parser.add_argument('--profile-startup', action='store_true', help="Record import and initialization phase timings.")
+    parser.add_argument('--trace-memory', action='store_true', help="Take tracemalloc snapshots at load, align and export milestones.")
+
+    # 7. 启动文件
     parser.add_argument('filename', nargs='?', help="Path to image/project to open.")
 
     args = parser.parse_args()
@@ -261,7 +281,15 @@ def main():
         except Exception as e:
             logging.warning(f"Could not set AppUserModelID: {e}")
 
-    root = tk.Tk()
+    diag = None
+    if args.profile or args.profile_startup or args.trace_memory:
+        diag = diagnostics.enable(profile=args.profile, startup=args.profile_startup, memory=args.trace_memory)
+        print(f"Diagnostics enabled, report: {diag.report_path()}")
+
+    with diagnostics.phase("import gui stack"):
+        RatioAnalyzerApp = load_app_class()
+    with diagnostics.phase("tk init"):
+        root = tk.Tk()
 
     startup_file = None
     if args.filename:
@@ -276,11 +304,18 @@ def main():
 
     # 启动应用
     try:
-        app = RatioAnalyzerApp(root, startup_file=startup_file)
+        with diagnostics.phase("app init"):
+            app = RatioAnalyzerApp(root, startup_file=startup_file)
+        root.after_idle(lambda: diagnostics.milestone("first idle"))
+        if diag: diag.start_profile()
         root.mainloop()
     except Exception as e:
         logging.critical(f"Unhandled exception in Main Loop: {e}", exc_info=True)
         raise
+    finally:
+        if diag:
+            diag.stop_profile()
+            print(f"Performance report written: {diag.write_report(__version__)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,17 +1,65 @@
 # src/model.py
 import numpy as np
-import tifffile as tiff
 import os
 import warnings
+import threading
+import collections
 from typing import List, Optional, Tuple, Any, Union
 
 # 尝试相对导入 (作为包运行)，失败则尝试绝对导入 (直接运行脚本)
 try:
-    from .io_utils import read_and_split_multichannel, read_separate_files
-    from .processing import calculate_background, process_frame_ratio
+    from .io_utils import read_and_split_multichannel, read_separate_files, tiff_write_options, iter_tiff_chunks
+    from .processing import (calculate_background, process_frame_ratio, compute_projection, masked_temporal_mean,
+                             FRAME_STAT_FIELDS, frame_statistics, detect_outlier_frames, display_frame)
+    from . import diagnostics
 except ImportError:
-    from io_utils import read_and_split_multichannel, read_separate_files
-    from processing import calculate_background, process_frame_ratio
+    from io_utils import read_and_split_multichannel, read_separate_files, tiff_write_options, iter_tiff_chunks
+    from processing import (calculate_background, process_frame_ratio, compute_projection, masked_temporal_mean,
+                            FRAME_STAT_FIELDS, frame_statistics, detect_outlier_frames, display_frame)
+    import diagnostics
+
+
+class FrameStatsIndex:
+    """
+    [新增] 逐帧统计索引：每个数据源 (ch1 / ch2 / aux_i / ratio) 一张 (T, len(FRAME_STAT_FIELDS)) 表。
+    表以 key (数据版本 + 处理参数) 区分，key 变化即失效并按块增量重建；
+    每个数据源保留最近几组参数的表，切回旧参数时无需重算。
+    """
+    MAX_KEYS_PER_SOURCE = 4
+
+    def __init__(self):
+        self._tables: dict = {}   # source -> {key: (table, done)}，插入顺序即新旧顺序
+        self._lock = threading.Lock()
+
+    def invalidate(self, source: Optional[str] = None) -> None:
+        with self._lock:
+            if source is None: self._tables = {}
+            else: self._tables.pop(source, None)
+
+    def get(self, source: str, key) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """返回 (table, done)；done[i] 为 True 表示第 i 帧已统计。"""
+        with self._lock:
+            return self._tables.get(source, {}).get(key)
+
+    def missing(self, source: str, key, n_frames: int) -> np.ndarray:
+        """返回尚未统计的帧索引 (必要时创建空表)。"""
+        with self._lock:
+            per_key = self._tables.setdefault(source, {})
+            entry = per_key.pop(key, None)
+            if entry is None or entry[0].shape[0] != n_frames:
+                entry = (np.full((n_frames, len(FRAME_STAT_FIELDS)), np.nan), np.zeros(n_frames, dtype=bool))
+            per_key[key] = entry  # 移到最新
+            while len(per_key) > self.MAX_KEYS_PER_SOURCE:
+                per_key.pop(next(iter(per_key)))
+            return np.flatnonzero(~entry[1])
+
+    def store(self, source: str, key, frames, rows) -> None:
+        with self._lock:
+            entry = self._tables.get(source, {}).get(key)
+            if entry is None: return  # 期间已失效
+            entry[0][frames] = rows
+            entry[1][frames] = True
+
 
 class AnalysisSession:
     """
@@ -24,6 +72,8 @@ class AnalysisSession:
     4. 执行核心计算 (背景计算, 帧处理)
     """
 
+    EXPORT_BLOCK_FRAMES = 8  # [新增] 导出时每个计算任务处理的帧数
+
     def __init__(self):
         # --- 核心图像数据 ---
         self.data1: Optional[np.ndarray] = None      # 分子 (Ch1 / Numerator)
@@ -59,6 +109,25 @@ class AnalysisSession:
         self.alignment_matrices = [] # [新增] 存储位移矩阵
         self.current_roles = None
 
+        # --- 派生数据缓存 (数据版本变化时失效) ---
+        self.data_version: int = 0
+        self._projection_cache: dict = {}   # (method, channel) -> (id(data), 2D float32)
+        self.frame_stats = FrameStatsIndex()  # [新增] 逐帧统计索引
+
+        # --- [新增] 导出流水线 (计算线程数，None = CPU 核数；待写入帧的内存上限 MB) ---
+        self.export_workers: Optional[int] = None
+        self.export_memory_mb: float = 256
+        self.export_use_memmap: bool = False  # [新增] 无压缩导出时直接写入内存映射文件
+
+
+    def notify_data_changed(self) -> None:
+        """
+        [新增] 图像数据被替换 (加载 / 配准 / 撤销) 后调用：递增数据版本，清空派生缓存。
+        """
+        self.data_version += 1
+        self._projection_cache = {}
+        self.frame_stats.invalidate()
+
 
     # [替换方法 1]
     def inspect_file_metadata(self, filepath: str) -> Tuple[bool, int, int, str]:
@@ -75,6 +144,7 @@ class AnalysisSession:
         detected_z = 1
         detected_axes = "?"
 
+        import tifffile as tiff  # [优化] 延迟导入，缩短启动时间
         try:
             with tiff.TiffFile(filepath) as tif:
                 
@@ -230,8 +300,10 @@ class AnalysisSession:
         self.data2_raw = None
         
         
+        self.notify_data_changed()
         self.recalc_background() # 自动重新计算背景
         self.alignment_matrices = [] #存储位移矩阵
+        diagnostics.milestone("load")
 
 
     def align_data(self, progress_callback=None) -> None:
@@ -274,7 +346,9 @@ class AnalysisSession:
         self.alignment_matrices = matrices
             
         # 5. 配准后像素位置变了，必须重新计算背景值
+        self.notify_data_changed()
         self.recalc_background()
+        diagnostics.milestone("align")
 
 
     def undo_alignment(self) -> bool:
@@ -296,6 +370,7 @@ class AnalysisSession:
             self.alignment_matrices = []
             
             # 数据变了，重新计算背景
+            self.notify_data_changed()
             self.recalc_background()
             return True
             
@@ -328,6 +403,7 @@ class AnalysisSession:
             
         # 4. 保存状态
         self.alignment_matrices = matrices
+        self.notify_data_changed()
         self.recalc_background()
 
     def recalc_background(self) -> None:
@@ -354,6 +430,152 @@ class AnalysisSession:
             val = calculate_background(aux, p)
             self.cached_bg_aux.append(val)
 
+    def get_projection(self, method: str = "mean", channel: int = 1,
+                       progress_callback=None) -> Optional[np.ndarray]:
+        """
+        [新增] 计算指定通道的时间投影图 (Mean / Max)，供自动 ROI 分割使用。
+        
+        Args:
+            method (str): 'mean' 或 'max'。
+            channel (int): 1 = data1 (分子), 2 = data2 (分母)。
+            progress_callback: (curr, total) 帧块进度 (命中缓存时不调用)。
+        """
+        data = self.data1 if channel == 1 else self.data2
+        if data is None:
+            return None
+
+        # [优化] 每个数据版本只计算一次，后续直接复用
+        key = (method, channel)
+        cached = self._projection_cache.get(key)
+        if cached is not None and cached[0] == id(data):
+            return cached[1]
+
+        proj = compute_projection(data, method, progress_callback=progress_callback)
+        self._projection_cache[key] = (id(data), proj)
+        return proj
+
+    def get_masked_mean(self, mask: np.ndarray, channel: int = 1) -> float:
+        """
+        [新增] 计算 Mask 区域内所有帧的平均强度 (用于背景 ROI)。
+        如果已有缓存的 Mean 投影则直接索引；否则仅按帧块提取 Mask 内像素，
+        不再对整个堆栈做 np.mean(axis=0)。
+        """
+        data = self.data1 if channel == 1 else self.data2
+        if data is None or mask is None:
+            return 0.0
+
+        cached = self._projection_cache.get(("mean", channel))
+        if cached is not None and cached[0] == id(data):
+            vals = cached[1][mask]
+            return float(np.nanmean(vals)) if vals.size else 0.0
+
+        return masked_temporal_mean(data, mask)
+
+    # =========================================================================
+    # [新增] 逐帧统计索引
+    # =========================================================================
+
+    def frame_stats_sources(self) -> List[str]:
+        """需要建立统计表的数据源：原始通道 + 当前参数下的 Ratio"""
+        if self.data1 is None: return []
+        sources = ["ch1"]
+        if self.data2 is not None: sources.append("ch2")
+        sources += [f"aux_{i}" for i in range(len(self.data_aux))]
+        return sources + ["ratio"]
+
+    def _source_data(self, source: str) -> Optional[np.ndarray]:
+        if source == "ch1": return self.data1
+        if source == "ch2": return self.data2
+        if source.startswith("aux_"):
+            idx = int(source.split("_")[1])
+            return self.data_aux[idx] if idx < len(self.data_aux) else None
+        return None
+
+    def _source_bg(self, source: str, use_custom_bg: bool = False) -> float:
+        if source == "ch1": return self.custom_bg1 if use_custom_bg else self.cached_bg1
+        if source == "ch2": return self.custom_bg2 if use_custom_bg else self.cached_bg2
+        idx = int(source.split("_")[1])
+        return self.cached_bg_aux[idx] if idx < len(self.cached_bg_aux) else 0.0
+
+    def frame_stats_key(self, source: str, params: Optional[dict] = None):
+        """
+        原始通道的统计只依赖数据版本 (背景在查询时扣除)；
+        Ratio 的统计还依赖处理参数和当时的背景值。
+        """
+        if source != "ratio": return (self.data_version,)
+        params = params or {}
+        if params.get("use_custom_bg"): bg = (self.custom_bg1, self.custom_bg2)
+        else: bg = (self.cached_bg1, self.cached_bg2)
+        return (self.data_version, tuple(sorted(params.items())), bg)
+
+    def build_frame_stats(self, source: str, params: Optional[dict] = None, chunk: int = 32,
+                          should_stop=None, on_progress=None) -> bool:
+        """
+        增量补全 source 的统计表 (只计算缺失的帧)，可在后台线程调用。
+        Returns: 是否已全部完成 (被 should_stop 中断时返回 False)。
+        """
+        if self.data1 is None: return False
+        key = self.frame_stats_key(source, params)
+        n_frames = self.data1.shape[0]
+        todo = self.frame_stats.missing(source, key, n_frames)
+        data = self._source_data(source)
+        for start in range(0, len(todo), chunk):
+            if should_stop is not None and should_stop(): return False
+            frames = todo[start:start + chunk]
+            if source == "ratio":
+                imgs = (self.get_processed_frame(int(i), view_mode="ratio", **(params or {})) for i in frames)
+            else:
+                imgs = (data[i] for i in frames)
+            rows = [frame_statistics(img) if img is not None else np.full(len(FRAME_STAT_FIELDS), np.nan)
+                    for img in imgs]
+            self.frame_stats.store(source, key, frames, rows)
+            if on_progress is not None: on_progress(source, start + len(frames), len(todo))
+        return True
+
+    def get_frame_stats(self, view_mode: str, params: Optional[dict] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        按显示模式返回逐帧统计 (table, done)。原始通道视图的数值已扣除背景并截断到 0，
+        与 get_processed_frame 的显示一致。
+        """
+        if view_mode == "ratio":
+            return self.frame_stats.get("ratio", self.frame_stats_key("ratio", params))
+        entry = self.frame_stats.get(view_mode, self.frame_stats_key(view_mode))
+        if entry is None: return None
+        table, done = entry
+        shifted = table.copy()
+        cols = [FRAME_STAT_FIELDS.index(f) for f in FRAME_STAT_FIELDS if f != "valid_frac"]
+        bg = self._source_bg(view_mode, (params or {}).get("use_custom_bg", False))
+        shifted[:, cols] = np.clip(table[:, cols] - bg, 0, None)
+        return shifted, done
+
+    def detect_outlier_frames(self, params: Optional[dict] = None) -> Optional[np.ndarray]:
+        """基于各数据源逐帧均值检测异常帧 (任一数据源异常即标记)，尚无统计时返回 None"""
+        col = FRAME_STAT_FIELDS.index("mean")
+        flags = None
+        for source in self.frame_stats_sources():
+            entry = self.frame_stats.get(source, self.frame_stats_key(source, params))
+            if entry is None: continue
+            series = np.where(entry[1], entry[0][:, col], np.nan)
+            f = detect_outlier_frames(series)
+            flags = f if flags is None else flags | f
+        return flags
+
+    def frame_stats_contrast(self, view_mode: str, params: Optional[dict] = None,
+                             outliers: Optional[np.ndarray] = None) -> Optional[Tuple[float, float]]:
+        """
+        由逐帧统计即时给出全序列显示范围：min(P5) ~ max(P95)，忽略异常帧。
+        统计未完成时使用已完成的帧。
+        """
+        entry = self.get_frame_stats(view_mode, params)
+        if entry is None: return None
+        table, done = entry
+        ok = done.copy()
+        if outliers is not None and outliers.shape == ok.shape and np.any(ok & ~outliers): ok &= ~outliers
+        lo = table[ok, FRAME_STAT_FIELDS.index("p5")]
+        hi = table[ok, FRAME_STAT_FIELDS.index("p95")]
+        if not np.any(np.isfinite(lo)) or not np.any(np.isfinite(hi)): return None
+        return float(np.nanmin(lo)), float(np.nanmax(hi))
+
     def get_processed_frame(self, 
                             frame_idx: int, 
                             int_thresh: float = 0, 
@@ -361,7 +583,10 @@ class AnalysisSession:
                             smooth_size: int = 0,
                             log_scale: bool = False,
                             use_custom_bg: bool = False,
-                            swap_channels: bool = False) -> Optional[np.ndarray]: # <--- [必须加上这一行]
+                            swap_channels: bool = False,
+                            view_mode: Optional[str] = None,
+                            level: int = 1,
+                            region: Optional[Tuple[int, int, int, int]] = None) -> Optional[np.ndarray]: # <--- [必须加上这一行]
         """
         [Pipeline] 获取处理后的一帧图像 (Intensity 或 Ratio)。
         
@@ -373,6 +598,9 @@ class AnalysisSession:
             log_scale (bool): 是否进行对数变换。
             use_custom_bg (bool): 是否使用自定义 ROI 背景 (而非全局百分位)。
             swap_channels (bool): 是否交换分子分母 (即 Ch2/Ch1)。
+            view_mode (str): [新增] 覆盖当前 view_mode (后台统计用)，默认使用 self.view_mode。
+            level (int): [新增] 显示金字塔层级 (level×level 块平均)，1 = 全分辨率。仅用于显示。
+            region (tuple): [新增] 只计算可见区域 (y0, y1, x0, x1)，全分辨率坐标。
         
         Returns:
             Optional[np.ndarray]: 处理后的图像矩阵 (2D)。
@@ -404,32 +632,40 @@ class AnalysisSession:
             bg_den = bg1
 
         # 2. 根据 view_mode 决定返回什么
+        mode = view_mode or self.view_mode
+
+        # [新增] 显示路径: 先裁剪 / 降采样原始帧，平滑核按层级缩小以保持相同的物理尺度
+        if level > 1 or region is not None:
+            take = lambda data: display_frame(data[frame_idx], level, region)
+            if level > 1 and smooth_size > 1: smooth_size = max(1, int(round(smooth_size / level)))
+        else:
+            take = lambda data: data[frame_idx]
         
         # --- Case A: 查看原始通道 (Ch1) ---
-        if self.view_mode == "ch1":
+        if mode == "ch1":
             # 返回：(数据 - 背景)，并 Clip 掉负值
             try:
-                raw = self.data1[frame_idx].astype(np.float32) - bg1
+                raw = take(self.data1).astype(np.float32) - bg1
                 return np.clip(raw, 0, None)
             except IndexError:
                 return None
             
         # --- Case B: 查看原始通道 (Ch2) ---
-        elif self.view_mode == "ch2":
+        elif mode == "ch2":
             if self.data2 is None: return None
             try:
-                raw = self.data2[frame_idx].astype(np.float32) - bg2
+                raw = take(self.data2).astype(np.float32) - bg2
                 return np.clip(raw, 0, None)
             except IndexError:
                 return None
             
         # --- Case C: 查看辅助通道 (Aux) ---
-        elif self.view_mode.startswith("aux_"):
+        elif mode.startswith("aux_"):
             try:
-                idx = int(self.view_mode.split("_")[1])
+                idx = int(mode.split("_")[1])
                 if idx < len(self.data_aux):
                     bg_val = bg_aux_list[idx] if idx < len(bg_aux_list) else 0
-                    raw = self.data_aux[idx][frame_idx].astype(np.float32) - bg_val
+                    raw = take(self.data_aux[idx]).astype(np.float32) - bg_val
                     return np.clip(raw, 0, None)
             except: 
                 return None
@@ -438,8 +674,8 @@ class AnalysisSession:
         # --- Case D: Ratio / Intensity 模式 (默认) ---
         # 调用 processing 模块的核心算法
         return process_frame_ratio(
-            d_num[frame_idx], 
-            d_den[frame_idx] if d_den is not None else None,
+            take(d_num), 
+            take(d_den) if d_den is not None else None,
             bg_num, bg_den,
             int_thresh, 
             ratio_thresh,
@@ -454,82 +690,169 @@ class AnalysisSession:
     def export_processed_stack(self, 
                                filepath: str, 
                                params: dict, 
-                               progress_callback=None) -> None:
+                               progress_callback=None,
+                               workers: Optional[int] = None,
+                               max_memory_mb: Optional[float] = None) -> None:
         """
         将当前参数处理后的所有帧保存为多页 Tiff 文件。
         这个方法结合了 Processing (计算) 和 I/O (写入)，属于业务逻辑层。
         
         Args:
             filepath (str): 保存路径。
-            params (dict): 处理参数 (int_thresh, ratio_thresh, smooth, log_scale 等)。
+            params (dict): 处理参数 (int_thresh, ratio_thresh, smooth, log_scale 等)；
+                [新增] compression ('none' / 'zlib' / 'zstd' / 'lzw') 与 tile (分块边长) 控制写入格式。
             progress_callback (callable, optional): 进度回调 (current, total)。
+            workers / max_memory_mb: [新增] 计算线程数 / 待写入帧的内存上限，默认取 export_workers / export_memory_mb。
         """
         if self.data1 is None:
             raise ValueError("No data to save.")
-            
-        n_frames = self.data1.shape[0]
-        
-        # 使用 tifffile 的 Writer 来流式写入，节省内存
-        # bigtiff=True 允许保存超过 4GB 的文件，适合长序列成像
-        with tiff.TiffWriter(filepath, bigtiff=True) as tif:
-            for i in range(n_frames):
-                # 1. 核心：调用 Model 自身的处理管道获取图像
-                frame_data = self.get_processed_frame(
-                    frame_idx=i,
-                    int_thresh=params.get("int_thresh", 0),
-                    ratio_thresh=params.get("ratio_thresh", 0),
-                    smooth_size=params.get("smooth", 0),
-                    log_scale=params.get("log_scale", False),
-                    use_custom_bg=params.get("use_custom_bg", False)
-                )
-                
-                # 2. 写入文件
-                if frame_data is not None:
-                    tif.write(frame_data.astype(np.float32), contiguous=True)
-                
-                # 3. 报告进度
-                if progress_callback and i % 5 == 0:
-                    progress_callback(i, n_frames)
-        
-        # 最后报告一次完成
-        if progress_callback:
-            progress_callback(n_frames, n_frames)
+
+        # 导出期间视图切换不影响结果：固定当前 view_mode
+        frame_args = dict(
+            int_thresh=params.get("int_thresh", 0),
+            ratio_thresh=params.get("ratio_thresh", 0),
+            smooth_size=params.get("smooth", 0),
+            log_scale=params.get("log_scale", False),
+            use_custom_bg=params.get("use_custom_bg", False),
+            view_mode=self.view_mode,
+        )
+        # 核心：调用 Model 自身的处理管道获取图像
+        write_opts = tiff_write_options(params.get("compression"), tile=params.get("tile"))
+        self._export_stack_pipelined(filepath, lambda i: self.get_processed_frame(frame_idx=i, **frame_args),
+                                     progress_callback, workers, max_memory_mb, write_opts)
+        diagnostics.milestone("export stack")
 
     def export_raw_ratio_stack(self, 
                                filepath: str, 
                                int_thresh: float, 
                                ratio_thresh: float, 
-                               progress_callback=None) -> None:
+                               progress_callback=None,
+                               workers: Optional[int] = None,
+                               max_memory_mb: Optional[float] = None,
+                               compression: Optional[str] = None,
+                               tile: Optional[int] = None) -> None:
         """
         导出“纯净”的比率堆栈 (不含 Log 变换，不含平滑，仅做基础阈值过滤)。
         这通常用于需要将数据导入其他软件(如 ImageJ)进行进一步量化分析的场景。
+        compression / tile: [新增] 压缩方式与分块边长，见 tiff_write_options。
         """
         if self.data1 is None:
             raise ValueError("No data to save.")
 
-        n_frames = self.data1.shape[0]
-        
-        with tiff.TiffWriter(filepath, bigtiff=True) as tif:
-            for i in range(n_frames):
-                # 强制 smooth=0, log=False, use_custom_bg=False
-                # 仅保留最基础的阈值过滤，保留数据的原始性
-                frame_data = self.get_processed_frame(
-                    frame_idx=i,
-                    int_thresh=int_thresh,
-                    ratio_thresh=ratio_thresh,
-                    smooth_size=0, 
-                    log_scale=False,
-                    use_custom_bg=False
-                )
-                
-                if frame_data is not None:
-                    tif.write(frame_data.astype(np.float32), contiguous=True)
+        # 强制 smooth=0, log=False, use_custom_bg=False
+        # 仅保留最基础的阈值过滤，保留数据的原始性
+        frame_args = dict(
+            int_thresh=int_thresh,
+            ratio_thresh=ratio_thresh,
+            smooth_size=0, 
+            log_scale=False,
+            use_custom_bg=False,
+            view_mode=self.view_mode,
+        )
+        write_opts = tiff_write_options(compression, tile=tile)
+        self._export_stack_pipelined(filepath, lambda i: self.get_processed_frame(frame_idx=i, **frame_args),
+                                     progress_callback, workers, max_memory_mb, write_opts)
+        diagnostics.milestone("export raw ratio")
+
+    def _export_stack_pipelined(self, filepath: str, compute_frame, progress_callback=None,
+                                workers: Optional[int] = None, max_memory_mb: Optional[float] = None,
+                                write_opts: Optional[dict] = None, use_memmap: Optional[bool] = None) -> None:
+        """
+        [新增] 流水线导出：线程池按块计算帧 (平滑等 numpy / OpenCV 运算会释放 GIL)，
+        调用线程作为唯一写入者按帧顺序写入文件，计算与写盘重叠。
+        已提交未写入的帧块受 max_memory_mb、总块数和线程数限制 (有界队列)。
+        write_opts: tiff_write_options() 的结果 (压缩 / 分块 / 压缩线程数)，整个堆栈写为一个 series。
+        [优化] 无压缩时先建好 Tiff 结构，每块 N 帧计算到预分配的 float32 缓冲区后一次写入数据区；
+        use_memmap=True 时计算线程直接写入内存映射的输出文件 (默认取 export_use_memmap)。
+        """
+        import tifffile as tiff
+        from concurrent.futures import ThreadPoolExecutor
 
-                if progress_callback and i % 5 == 0:
-                    progress_callback(i, n_frames)
-        
-        if progress_callback:
-            progress_callback(n_frames, n_frames)
+        n_frames = self.data1.shape[0]
+        shape = self.data1.shape[1:]
+        frame_bytes = int(np.prod(shape)) * 4  # float32
+        block = max(1, min(self.EXPORT_BLOCK_FRAMES, n_frames))
+        budget = (max_memory_mb if max_memory_mb is not None else self.export_memory_mb) * 2 ** 20
+        n_blocks = -(-n_frames // block)
+        workers = max(1, workers or self.export_workers or (os.cpu_count() or 1))
+        # [修改] 在途块数同时受内存预算、总块数和并行度限制 (短序列不会按整个预算占内存)
+        max_pending = max(1, min(max(2, int(budget // (frame_bytes * block))), n_blocks, workers + 2))
+        workers = min(workers, max_pending)
+        write_opts = dict(write_opts or {})
+        if use_memmap is None: use_memmap = self.export_use_memmap
+
+        def compute_block(start, out):
+            # 直接写入预分配的 float32 块 (copyto 完成类型转换，省去逐帧 astype 副本)
+            n = min(block, n_frames - start)
+            for k in range(n):
+                img = compute_frame(start + k)
+                if img is None: out[k] = np.nan  # 缺失帧写为 NaN，保持帧数与时间轴一致
+                else: np.copyto(out[k], img, casting="unsafe")
+            return start, out, n
+
+        starts = iter(range(0, n_frames, block))
+        pending = collections.deque()
+
+        def ordered_blocks(pool, get_buffer):
+            """按帧顺序交出已计算的块；消费者处理完上一块后再提交新块 (有界)"""
+            def refill():
+                while len(pending) < max_pending:
+                    start = next(starts, None)
+                    if start is None: return
+                    pending.append(pool.submit(compute_block, start, get_buffer(start)))
+            try:
+                refill()
+                while pending:
+                    yield pending.popleft().result()
+                    refill()
+            except BaseException:
+                for fut in pending: fut.cancel()
+                raise
+
+        def report(done):
+            if progress_callback: progress_callback(done, n_frames)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            if write_opts:
+                # 压缩 / 分块：逐帧交给 tifffile 编码 (编码线程可能仍持有数据，缓冲区不复用)
+                def frames():
+                    for start, buf, n in ordered_blocks(pool, lambda _: np.empty((block,) + shape, np.float32)):
+                        for k, frame in enumerate(buf[:n]):
+                            # 先报告再交出：tifffile 取完最后一帧后不会再恢复生成器
+                            report(start + k + 1)
+                            yield frame
+
+                # bigtiff=True 允许保存超过 4GB 的文件，适合长序列成像
+                with tiff.TiffWriter(filepath, bigtiff=True) as tif:
+                    tif.write(iter_tiff_chunks(frames(), write_opts.get("tile")),
+                              shape=(n_frames,) + shape, dtype=np.float32, photometric="minisblack", **write_opts)
+                return
+
+            # 无压缩：先写出 Tiff 结构 (IFD + 连续的数据区)，再按块填充数据
+            with tiff.TiffWriter(filepath, bigtiff=True) as tif:
+                # photometric 固定为灰度，避免 3 / 4 帧的堆栈被识别为 RGB(A)
+                offset = tif.write(shape=(n_frames,) + shape, dtype=np.float32, photometric="minisblack",
+                                   returnoffset=True)[0]
+
+            if use_memmap:
+                mm = np.memmap(filepath, dtype=np.float32, mode="r+", offset=offset, shape=(n_frames,) + shape)
+                try:
+                    for start, _, n in ordered_blocks(pool, lambda start: mm[start:start + block]):
+                        report(start + n)
+                    mm.flush()
+                finally:
+                    del mm
+                return
+
+            # 缓冲区按需分配并循环复用 (最多 max_pending 块)
+            free = collections.deque()
+            get_buffer = lambda _: free.popleft() if free else np.empty((block,) + shape, np.float32)
+            with open(filepath, "r+b") as f:
+                for start, buf, n in ordered_blocks(pool, get_buffer):
+                    f.seek(offset + start * frame_bytes)
+                    f.write(memoryview(buf[:n]))  # 每块一次写入
+                    free.append(buf)
+                    report(start + n)
 
     def export_current_frame(self, filepath: str, frame_idx: int, params: dict) -> None:
         """保存单帧图像"""
@@ -542,4 +865,7 @@ class AnalysisSession:
             use_custom_bg=params.get("use_custom_bg", False)
         )
         if img is not None:
-            tiff.imwrite(filepath, img)
+            import tifffile as tiff
+            write_opts = tiff_write_options(params.get("compression"), tile=params.get("tile"))
+            tiff.imwrite(filepath, img, **write_opts)
+            diagnostics.milestone("export frame")
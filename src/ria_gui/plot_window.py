@@ -1,10 +1,17 @@
 # src/plot_window.py
 import tkinter as tk
-from tkinter import ttk, Toplevel
+from tkinter import ttk, Toplevel, filedialog, messagebox
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import numpy as np
 
+try:
+    from .processing import TRACE_STATS, decimate_minmax
+    from .io_utils import format_table_text, export_table
+except ImportError:
+    from processing import TRACE_STATS, decimate_minmax
+    from io_utils import format_table_text, export_table
+
 # --- Define Color Palettes ---
 COLOR_PALETTES = {
     "Standard": ['#FF3333', '#33FF33', '#3388FF', '#FFFF33', '#FF33FF', '#33FFFF', '#FF8833'], # 经典亮色
@@ -30,6 +37,8 @@ class ROIPlotWindow:
         
         # --- 绘图参数 ---
         self.plot_mode = "ratio" # ratio, num, den, combo, aux_0, aux_1...
+        self.plot_stat = "mean"  # [新增] 单通道模式下显示的统计量 (见 TRACE_STATS)
+        self.on_stat_request = None  # [新增] 回调: 请求计算尚未提取的统计量
         self.font_size = 10
         self.cached_ylim = None 
         self.current_palette_idx = 0 
@@ -38,6 +47,7 @@ class ROIPlotWindow:
         self.var_grid = None 
         self.var_lock_y = None
         self.var_legend = None 
+        self.var_stat = None
         
         # --- 内部组件 ---
         self.fig = None
@@ -48,6 +58,14 @@ class ROIPlotWindow:
         self.fr_view_inner = None
         self.mode_buttons = {} 
 
+        # [新增] 增量绘图状态: (ROI id, 角色) -> Line2D，以及上次的样式 / 图例 / 布局 key
+        self._lines = {}
+        self._line_data = {}   # [新增] (ROI id, 角色) -> 全分辨率 (x, y)，显示时按视野抽稀
+        self._style_key = None
+        self._legend_key = None
+        self._layout_key = None
+        self._in_refresh = False
+
         # [新增] 默认主题颜色 (浅色)
         self.current_theme_colors = {
             "bg": "#F0F2F5", 
@@ -126,6 +144,7 @@ class ROIPlotWindow:
         if self.var_grid is None: self.var_grid = tk.BooleanVar(value=True)
         if self.var_lock_y is None: self.var_lock_y = tk.BooleanVar(value=False)
         if self.var_legend is None: self.var_legend = tk.BooleanVar(value=True)
+        if self.var_stat is None: self.var_stat = tk.StringVar(value=self.plot_stat)
 
         # 1. 顶部：绘图区
         plot_frame = ttk.Frame(self.window)
@@ -138,6 +157,11 @@ class ROIPlotWindow:
         
         self.ax = self.fig.add_subplot(111)
         self.ax.set_facecolor(self.current_theme_colors["plot_bg"])
+        self.ax_right = None
+        self._lines = {}
+        self._line_data = {}
+        self._style_key = self._legend_key = self._layout_key = None
+        self.ax.callbacks.connect('xlim_changed', self._on_xlim_changed)
         
         self.canvas = FigureCanvasTkAgg(self.fig, master=plot_frame)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
@@ -200,6 +224,10 @@ class ROIPlotWindow:
                                         command=lambda: self._copy_data(with_time=False))
         self.btn_copy_data.pack(side="left", padx=3)
 
+        # [新增] 直接导出为文件 (CSV / TSV / Parquet / HDF5)
+        self.btn_save = ttk.Button(fr_data_inner, text="💾 Save", width=10, command=self._save_data)
+        self.btn_save.pack(side="left", padx=3)
+
         # 首次创建时应用颜色
         self.apply_theme(self.current_theme_colors)
 
@@ -244,6 +272,12 @@ class ROIPlotWindow:
         btn_color = ttk.Button(self.fr_view_inner, text="🎨 Color", width=8, style="Compact.TButton", command=self._cycle_palette)
         btn_color.pack(side="left", padx=2)
 
+        # [新增] 统计量选择 (Mean / Median / SD / ...)
+        cb_stat = ttk.Combobox(self.fr_view_inner, textvariable=self.var_stat, values=list(TRACE_STATS),
+                               width=7, state="readonly")
+        cb_stat.pack(side="left", padx=2)
+        cb_stat.bind("<<ComboboxSelected>>", lambda e: self._set_stat(self.var_stat.get()))
+
         # 6. 状态检查
         if self.plot_mode == "ratio" and not has_ratio:
             self.plot_mode = "num"
@@ -261,6 +295,39 @@ class ROIPlotWindow:
         self.plot_mode = mode
         self._refresh_plot()
 
+    def _set_stat(self, stat):
+        """[新增] 切换统计量；若当前数据中没有该统计量，则请求重新提取。"""
+        self.plot_stat = stat
+        series = self.data_cache['series'] if self.data_cache else []
+        missing = stat != "mean" and series and stat not in series[0].get('stats', {}).get('num', {})
+        if missing and self.on_stat_request:
+            self.on_stat_request(stat)
+        else:
+            self._refresh_plot()
+
+    def _get_values(self, s, mode, stat="mean"):
+        """
+        [新增] 取出某条 ROI 曲线在指定通道 / 统计量下的数据 (不存在时返回 None)。
+        """
+        if mode.startswith("aux_"):
+            try: idx = int(mode.split("_")[1])
+            except ValueError: return None
+            if stat == "mean":
+                return s['means_aux'][idx] if idx < len(s.get('means_aux', [])) else None
+            aux_stats = s.get('stats', {}).get('aux', [])
+            return aux_stats[idx].get(stat) if idx < len(aux_stats) else None
+        if stat == "mean":
+            key = {"ratio": "means", "num": "means_num", "den": "means_den"}.get(mode)
+            return s.get(key) if key else None
+        return s.get('stats', {}).get(mode, {}).get(stat)
+
+    def _extra_stats(self, series):
+        """[新增] 当前数据中已计算的额外统计量 (按 TRACE_STATS 排序)。"""
+        if not series: return []
+        computed = series[0].get('stats', {}).get('num', {})
+        order = {n: i for i, n in enumerate(TRACE_STATS)}
+        return sorted(computed, key=lambda n: order.get(n, len(order)))
+
     def _change_font(self, delta):
         self.font_size = max(6, min(24, self.font_size + delta))
         self._refresh_plot()
@@ -276,144 +343,210 @@ class ROIPlotWindow:
             self.cached_ylim = None
             self._refresh_plot()
 
+    def _style_ax(self, ax):
+        """设置坐标轴颜色与字号 (主题或字号变化时调用)"""
+        bg = self.current_theme_colors["plot_bg"]
+        fg = self.current_theme_colors["plot_fg"]
+        ax.set_facecolor(bg)
+        for side in ('bottom', 'top', 'left', 'right'):
+            ax.spines[side].set_color(fg)
+        ax.xaxis.label.set_color(fg)
+        ax.yaxis.label.set_color(fg)
+        ax.xaxis.label.set_fontsize(self.font_size)
+        ax.yaxis.label.set_fontsize(self.font_size)
+        ax.tick_params(axis='x', colors=fg, labelsize=self.font_size)
+        ax.tick_params(axis='y', colors=fg, labelsize=self.font_size)
+        ax.title.set_color(fg)
+
+    def _single_ylabel(self, info, do_norm):
+        labels = info.get("labels", ("Ch1", "Ch2"))
+        label_num, label_den = labels[0], labels[1]
+        chan_name, ylabel = None, "Value"
+        if self.plot_mode == "ratio":
+            chan_name = "Ratio"
+            ylabel = r"$\Delta R / R_0$" if do_norm else f"Ratio ({label_num}/{label_den})"
+        elif self.plot_mode == "num":
+            chan_name = label_num
+            ylabel = r"$\Delta F / F_0$" if do_norm else f"Intensity ({label_num})"
+        elif self.plot_mode == "den":
+            chan_name = label_den
+            ylabel = r"$\Delta F / F_0$" if do_norm else f"Intensity ({label_den})"
+        elif self.plot_mode.startswith("aux_"):
+            try:
+                idx = int(self.plot_mode.split("_")[1])
+                chan_name = info['aux_labels'][idx] if idx < len(info['aux_labels']) else f"Ch{idx+3}"
+                ylabel = r"$\Delta F / F_0$" if do_norm else f"Intensity ({chan_name})"
+            except: pass
+        # [新增] 非 Mean 统计量不做归一化，标签注明统计量
+        if self.plot_stat != "mean" and chan_name:
+            ylabel = f"{self.plot_stat.upper()} ({chan_name})"
+        return ylabel
+
+    def _line_specs(self, d, colors):
+        """
+        [新增] 当前模式下需要显示的曲线: [(key, 是否右轴, y, 样式 dict)]，key = (ROI id, 角色)。
+        """
+        info = d['info']; do_norm = d['do_norm']
+        specs = []
+        if self.plot_mode == "combo":
+            use_dual = not do_norm
+            labels = info.get("labels", ("Ch1", "Ch2"))
+            label_main = "Ratio" if info.get("has_ratio") else "Intensity"
+            for i, s in enumerate(d['series']):
+                c = colors[i % len(colors)]
+                specs.append(((s['id'], "c_main"), False, s['means'],
+                              dict(color=c, linestyle='-', linewidth=2, alpha=1.0, label=f"ROI {s['id']} {label_main}")))
+                specs.append(((s['id'], "c_num"), use_dual, s['means_num'],
+                              dict(color=c, linestyle='--', linewidth=1, alpha=0.7, label=f"ROI {s['id']} {labels[0]}")))
+                if info.get("has_ratio"):
+                    specs.append(((s['id'], "c_den"), use_dual, s['means_den'],
+                                  dict(color=c, linestyle=':', linewidth=1, alpha=0.7, label=f"ROI {s['id']} {labels[1]}")))
+                for k, aux_data in enumerate(s.get('means_aux', [])):
+                    label_aux = info['aux_labels'][k] if k < len(info['aux_labels']) else f"Aux{k+1}"
+                    specs.append(((s['id'], f"c_aux{k}"), use_dual, aux_data,
+                                  dict(color=c, linestyle='-.', linewidth=1, alpha=0.5, label=f"ROI {s['id']} {label_aux}")))
+        else:
+            for i, s in enumerate(d['series']):
+                data_to_plot = self._get_values(s, self.plot_mode, self.plot_stat)
+                if data_to_plot is None: continue
+                specs.append(((s['id'], "single"), False, data_to_plot,
+                              dict(color=colors[i % len(colors)], linestyle='-', linewidth=1.5, alpha=1.0,
+                                   label=f"ROI {s['id']}")))
+        return specs
+
+    def _plot_width_px(self):
+        try: return max(int(self.ax.get_window_extent().width), 100)
+        except Exception: return 800
+
+    def _on_xlim_changed(self, ax):
+        """
+        [新增] 视野变化 (缩放 / 平移) 后按可见范围重新抽稀：每个像素列保留 min / max，
+        绘制开销只与窗口宽度有关。全分辨率数据仍在 data_cache 中供导出使用。
+        """
+        if self._in_refresh or not self._lines: return
+        x_range = sorted(self.ax.get_xlim())
+        n_px = self._plot_width_px()
+        for key, line in self._lines.items():
+            full = self._line_data.get(key)
+            if full is None: continue
+            line.set_data(*decimate_minmax(full[0], full[1], n_px, x_range))
+        self.canvas.draw_idle()
+
     def _refresh_plot(self):
+        """
+        [优化] 增量刷新：曲线对象按 (ROI id, 角色) 复用，只用 set_data 更新数据；
+        只增删变化的曲线，图例 / 主题 / tight_layout 仅在结构变化时重建。
+        """
         if not self.data_cache: return
         
         d = self.data_cache
-        x = d['x']; series_list = d['series']; unit = d['unit']
+        x = d['x']; unit = d['unit']
         is_log = d['is_log']; do_norm = d['do_norm']
         info = d['info']
         
         self._update_button_states()
 
-        # 1. 清空 Axes
-        self.ax.clear()
-        if self.ax_right:
+        import matplotlib
+        matplotlib.rcParams.update({'font.size': self.font_size})
+        colors = COLOR_PALETTES[PALETTE_NAMES[self.current_palette_idx]]
+        fg = self.current_theme_colors["plot_fg"]
+        specs = self._line_specs(d, colors)
+
+        # 1. 右轴 (Combo 且未归一化时使用双轴)
+        need_right = self.plot_mode == "combo" and not do_norm
+        style_key = (tuple(sorted(self.current_theme_colors.items())), self.font_size)
+        if need_right and self.ax_right is None:
+            self.ax_right = self.ax.twinx()
+            self._style_key = None
+        elif not need_right and self.ax_right is not None:
+            for key in [k for k, l in self._lines.items() if l.axes is self.ax_right]:
+                del self._lines[key]; self._line_data.pop(key, None)
             self.ax_right.remove()
             self.ax_right = None
 
-        # 2. [关键] 恢复坐标轴颜色 (clear会重置样式，必须重设)
-        bg = self.current_theme_colors["plot_bg"]
-        fg = self.current_theme_colors["plot_fg"]
-
-        def style_ax(ax):
-            ax.set_facecolor(bg)
-            ax.spines['bottom'].set_color(fg)
-            ax.spines['top'].set_color(fg)
-            ax.spines['left'].set_color(fg)
-            ax.spines['right'].set_color(fg)
-            ax.xaxis.label.set_color(fg)
-            ax.yaxis.label.set_color(fg)
-            ax.tick_params(axis='x', colors=fg)
-            ax.tick_params(axis='y', colors=fg)
-            ax.title.set_color(fg)
-
-        style_ax(self.ax)
-
-        # 3. 准备绘图参数
-        import matplotlib
-        matplotlib.rcParams.update({'font.size': self.font_size})
-        palette_name = PALETTE_NAMES[self.current_palette_idx]
-        colors = COLOR_PALETTES[palette_name]
-        
-        labels = info.get("labels", ("Ch1", "Ch2"))
-        label_num, label_den = labels[0], labels[1]
+        # 2. 主题 / 字号变化时才重新设置坐标轴样式
+        if style_key != self._style_key:
+            self._style_key = style_key
+            self._style_ax(self.ax)
+            if self.ax_right: self._style_ax(self.ax_right)
+
+        # 3. 曲线: 删除多余的，复用已有的，只新建缺少的
+        wanted = {key for key, _, _, _ in specs}
+        for key in [k for k in self._lines if k not in wanted]:
+            self._lines.pop(key).remove()
+            self._line_data.pop(key, None)
+        ordered = []
+        n_px = self._plot_width_px()
+        for key, on_right, y, style in specs:
+            target_ax = self.ax_right if on_right else self.ax
+            self._line_data[key] = (x, y)
+            xd, yd = decimate_minmax(x, y, n_px)  # [新增] 全范围按像素列抽稀 (坐标范围不变)
+            line = self._lines.get(key)
+            if line is not None and line.axes is not target_ax:
+                line.remove(); line = None
+            if line is None:
+                line, = target_ax.plot(xd, yd, **style)
+                self._lines[key] = line
+            else:
+                line.set_data(xd, yd)
+                line.set(**style)
+            ordered.append(line)
 
-        # 4. 绘图逻辑
+        # 4. 坐标轴标签 / 刻度类型
         if self.plot_mode == "combo":
-            use_dual = not do_norm
-            target_ax_sec = self.ax.twinx() if use_dual else self.ax
-            self.ax_right = target_ax_sec if use_dual else None
-            
-            # 如果是双轴，也要设置右轴的颜色
-            if self.ax_right: style_ax(self.ax_right)
-            
-            self.ax.set_axisbelow(True)
-            
-            lines = []
-            for i, s in enumerate(series_list):
-                c = colors[i % len(colors)]
-                
-                label_main = "Ratio" if info.get("has_ratio") else "Intensity"
-                l1, = self.ax.plot(x, s['means'], color=c, linestyle='-', linewidth=2, label=f"ROI {s['id']} {label_main}")
-                lines.append(l1)
-                
-                l2, = target_ax_sec.plot(x, s['means_num'], color=c, linestyle='--', linewidth=1, alpha=0.7, label=f"ROI {s['id']} {label_num}")
-                lines.append(l2)
-                
-                if info.get("has_ratio"): 
-                    l3, = target_ax_sec.plot(x, s['means_den'], color=c, linestyle=':', linewidth=1, alpha=0.7, label=f"ROI {s['id']} {label_den}")
-                    lines.append(l3)
-                
-                if 'means_aux' in s:
-                    for k, aux_data in enumerate(s['means_aux']):
-                        label_aux = info['aux_labels'][k] if k < len(info['aux_labels']) else f"Aux{k+1}"
-                        la, = target_ax_sec.plot(x, aux_data, color=c, linestyle='-.', linewidth=1, alpha=0.5, label=f"ROI {s['id']} {label_aux}")
-                        lines.append(la)
-            
-            self.ax.set_ylabel(r"$\Delta R / R_0$" if do_norm else "Ratio")
-            if use_dual: target_ax_sec.set_ylabel("Intensity")
-            
-            if self.var_legend.get():
-                labs = [l.get_label() for l in lines]
-                leg = self.ax.legend(lines, labs, loc='best', fontsize='small')
-                # 设置图例文字颜色
-                for text in leg.get_texts(): text.set_color(fg)
-
+            ylabel = r"$\Delta R / R_0$" if do_norm else "Ratio"
+            yscale = 'linear'
         else:
-            # Single Modes
-            ylabel = "Value"
-            for i, s in enumerate(series_list):
-                c = colors[i % len(colors)]
-                data_to_plot = None
-                
-                if self.plot_mode == "ratio":
-                    data_to_plot = s['means']
-                    ylabel = r"$\Delta R / R_0$" if do_norm else f"Ratio ({label_num}/{label_den})"
-                elif self.plot_mode == "num":
-                    data_to_plot = s['means_num']
-                    ylabel = r"$\Delta F / F_0$" if do_norm else f"Intensity ({label_num})"
-                elif self.plot_mode == "den":
-                    data_to_plot = s['means_den']
-                    ylabel = r"$\Delta F / F_0$" if do_norm else f"Intensity ({label_den})"
-                elif self.plot_mode.startswith("aux_"):
-                    try:
-                        idx = int(self.plot_mode.split("_")[1])
-                        if idx < len(s['means_aux']):
-                            data_to_plot = s['means_aux'][idx]
-                            aux_name = info['aux_labels'][idx] if idx < len(info['aux_labels']) else f"Ch{idx+3}"
-                            ylabel = r"$\Delta F / F_0$" if do_norm else f"Intensity ({aux_name})"
-                    except: pass
-                
-                if data_to_plot is not None:
-                    self.ax.plot(x, data_to_plot, color=c, label=f"ROI {s['id']}", linewidth=1.5)
-
-            if self.plot_mode == "ratio" and is_log: self.ax.set_yscale('log')
-            else: self.ax.set_yscale('linear')
-                
-            self.ax.set_ylabel(ylabel)
-            if self.var_legend.get(): 
-                leg = self.ax.legend(loc='best', fontsize='small')
-                for text in leg.get_texts(): text.set_color(fg)
-
-        # 5. 通用设置
+            ylabel = self._single_ylabel(info, do_norm)
+            yscale = 'log' if (self.plot_mode == "ratio" and is_log and self.plot_stat == "mean") else 'linear'
+        if self.ax.get_yscale() != yscale: self.ax.set_yscale(yscale)
+        self.ax.set_ylabel(ylabel)
+        if self.ax_right: self.ax_right.set_ylabel("Intensity")
         self.ax.set_xlabel(f"Time ({unit})")
         if self.var_grid.get(): self.ax.grid(True, which="both", alpha=0.3)
         else: self.ax.grid(False)
+
+        # 5. 图例: 曲线集合 / 标签 / 样式变化时才重建 (图例句柄是曲线的副本，换配色后必须重建)
+        legend_key = (self.var_legend.get(), fg, self.font_size,
+                      tuple((l.get_label(), str(l.get_color()), l.get_linestyle(), l.get_linewidth(), l.get_marker())
+                            for l in ordered))
+        if legend_key != self._legend_key:
+            self._legend_key = legend_key
+            if self.ax.get_legend(): self.ax.get_legend().remove()
+            if self.var_legend.get() and ordered:
+                leg = self.ax.legend(ordered, [l.get_label() for l in ordered], loc='best', fontsize='small')
+                for text in leg.get_texts(): text.set_color(fg)
+
+        # 6. 坐标范围 (自动缩放会触发 xlim_changed，此时已是全范围数据，无需再次抽稀)
+        self._in_refresh = True
+        try:
+            for ax in (self.ax, self.ax_right):
+                if ax is None: continue
+                ax.relim()
+                ax.autoscale_view()
+        finally:
+            self._in_refresh = False
         if self.var_lock_y.get() and self.cached_ylim: self.ax.set_ylim(self.cached_ylim)
-        self.fig.tight_layout()
-        self.canvas.draw()
 
+        # 7. 布局只在标签 / 字号 / 轴结构变化时重新计算
+        ymax = max(abs(v) for v in self.ax.get_ylim())
+        layout_key = (ylabel, unit, need_right, yscale, self.font_size,
+                      int(np.floor(np.log10(ymax))) if ymax > 0 and np.isfinite(ymax) else 0)
+        if layout_key != self._layout_key:
+            self._layout_key = layout_key
+            self.fig.tight_layout()
+        self.canvas.draw_idle()
 
-    def _copy_data(self, with_time=True):
+
+    def _build_export(self, with_time=True):
         """
-        导出数据逻辑
+        [优化] 把所有选中曲线一次性堆叠为 (N, C) 数组，返回 (header, table, decimals)。
         """
-        if not self.data_cache: return
         d = self.data_cache
         x = d['x']; series = d['series']; info = d['info']
         unit = d['unit']
-        
+        n = len(x)
+
         data_label = "Value"
         if self.plot_mode == "ratio": data_label = "Ratio"
         elif self.plot_mode == "num": data_label = info['labels'][0]
@@ -425,45 +558,40 @@ class ROIPlotWindow:
             except: data_label = "Aux"
         elif self.plot_mode == "combo": data_label = "Combo"
 
-        content = ""
-        header_parts = []
-        if with_time: header_parts.append(f"Time({unit})")
-        
+        header, columns = [], []
+        if with_time:
+            header.append(f"Time({unit})")
+            columns.append(x)
+
         if self.plot_mode == "combo":
             for s in series:
-                header_parts.append(f"R_{s['id']}")
-                header_parts.append(f"N_{s['id']}")
-                if info.get("has_ratio"): header_parts.append(f"D_{s['id']}")
+                header.append(f"R_{s['id']}"); columns.append(s['means'])
+                header.append(f"N_{s['id']}"); columns.append(s['means_num'])
+                if info.get("has_ratio"):
+                    header.append(f"D_{s['id']}"); columns.append(s['means_den'])
         else:
+            # [新增] 每个 ROI 先导出 Mean，再导出已计算的其它统计量列
+            extra_stats = self._extra_stats(series)
+            missing = np.zeros(n)
             for s in series:
-                header_parts.append(f"ROI_{s['id']}_{data_label}")
-        
-        content += "\t".join(header_parts) + "\n"
-        
-        for i in range(len(x)):
-            row_parts = []
-            if with_time: row_parts.append(f"{x[i]:.4f}")
-            
-            for s in series:
-                if self.plot_mode == "combo":
-                    row_parts.append(f"{s['means'][i]:.5f}")     
-                    row_parts.append(f"{s['means_num'][i]:.5f}") 
-                    if info.get("has_ratio"): 
-                        row_parts.append(f"{s['means_den'][i]:.5f}") 
-                else:
-                    val = 0.0
-                    if self.plot_mode == "ratio": val = s['means'][i]
-                    elif self.plot_mode == "num": val = s['means_num'][i]
-                    elif self.plot_mode == "den": val = s['means_den'][i]
-                    elif self.plot_mode.startswith("aux_"):
-                        try:
-                            idx = int(self.plot_mode.split("_")[1])
-                            val = s['means_aux'][idx][i]
-                        except: val = 0.0
-                    row_parts.append(f"{val:.5f}")
-            
-            content += "\t".join(row_parts) + "\n"
-            
+                for stat in ["mean"] + extra_stats:
+                    suffix = "" if stat == "mean" else f"_{stat}"
+                    header.append(f"ROI_{s['id']}_{data_label}{suffix}")
+                    vals = self._get_values(s, self.plot_mode, stat)
+                    columns.append(vals if vals is not None else missing)
+
+        table = np.column_stack([np.asarray(c, dtype=np.float64)[:n] for c in columns]) if columns else np.empty((n, 0))
+        decimals = [4] * int(with_time) + [5] * (table.shape[1] - int(with_time))
+        return header, table, decimals
+
+    def _copy_data(self, with_time=True):
+        """
+        导出数据逻辑 ([优化] 批量格式化，替代逐行字符串拼接)
+        """
+        if not self.data_cache: return
+        header, table, decimals = self._build_export(with_time)
+        content = format_table_text(header, table, decimals)
+
         self.window.clipboard_clear()
         self.window.clipboard_append(content)
         
@@ -476,4 +604,17 @@ class ROIPlotWindow:
                 if target_btn.winfo_exists():
                     target_btn.config(text=original_text, style="TButton")
             except: pass
-        self.window.after(1000, restore)
\ No newline at end of file
+        self.window.after(1000, restore)
+
+    def _save_data(self):
+        """[新增] 把当前表格 (含时间列) 一次性写入文件。"""
+        if not self.data_cache: return
+        path = filedialog.asksaveasfilename(
+            parent=self.window, defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("TSV", "*.tsv"), ("Parquet", "*.parquet"), ("HDF5", "*.h5 *.hdf5")])
+        if not path: return
+        header, table, decimals = self._build_export(with_time=True)
+        try:
+            export_table(path, header, table, decimals)
+        except Exception as e:
+            messagebox.showerror("Export Error", str(e), parent=self.window)
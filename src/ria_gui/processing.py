@@ -1,11 +1,22 @@
 # src/processing.py
+import logging
 import numpy as np
 
-# [核心依赖] 必须安装 OpenCV
-try:
-    import cv2
-except ImportError:
-    cv2 = None
+logger = logging.getLogger(__name__)
+
+# [优化] OpenCV 延迟加载：只在首次平滑 / 对齐 / 分割时导入，缩短启动时间
+_cv2 = None
+
+def _load_cv2():
+    """返回 cv2 模块；未安装时返回 None (结果会被缓存)。"""
+    global _cv2
+    if _cv2 is None:
+        try:
+            import cv2 as module
+        except ImportError:
+            module = False
+        _cv2 = module
+    return _cv2 or None
 
 def calculate_background(stack_data, percentile):
     """
@@ -23,6 +34,7 @@ def smooth_nan_safe(arr, size):
     if size <= 1: return arr
     
     # 如果没有 OpenCV，直接报错提示用户安装，不再依赖 scipy
+    cv2 = _load_cv2()
     if cv2 is None:
         raise ImportError("Missing Dependency: Please install 'opencv-python' to use Smoothing features.")
 
@@ -96,11 +108,38 @@ def process_frame_ratio(d1_frame, d2_frame, bg1, bg2, int_thresh, ratio_thresh,
     return ratio
 
 
+def display_frame(frame, level=1, region=None):
+    """
+    [新增] 显示金字塔取帧：先裁剪到可见区域 region=(y0, y1, x0, x1)，再做 level×level 块平均。
+    level=1 且 region=None 时原样返回 (分析 / 导出路径不受影响)。
+    """
+    if region is not None:
+        y0, y1, x0, x1 = region
+        frame = frame[y0:y1, x0:x1]
+    if level <= 1: return frame
+    h, w = frame.shape
+    h, w = h - h % level, w - w % level
+    if h == 0 or w == 0: return frame
+    block = np.asarray(frame[:h, :w], dtype=np.float32)
+    cv2 = _load_cv2()
+    if cv2 is not None:
+        return cv2.resize(block, (w // level, h // level), interpolation=cv2.INTER_AREA)
+    return block.reshape(h // level, level, w // level, level).mean(axis=(1, 3))
+
+
+def display_level_for(visible_px, screen_px):
+    """[新增] 选取金字塔层级：使降采样后的像素数不少于屏幕像素数的最大 2 的幂"""
+    level = 1
+    while visible_px / (level * 2) >= max(screen_px, 1): level *= 2
+    return level
+
+
 def align_stack_ecc(data1, data2, progress_callback=None):
     """
     [修改] 返回值增加了 matrices 列表
     Returns: (aligned_1, aligned_2, matrices_list)
     """
+    cv2 = _load_cv2()
     if cv2 is None: raise ImportError("OpenCV required.")
 
     frames, h, w = data1.shape
@@ -181,6 +220,7 @@ def apply_alignment_matrices(data, matrices):
     """
     [新增] 快速应用已知的矩阵列表
     """
+    cv2 = _load_cv2()
     if cv2 is None: raise ImportError("OpenCV required.")
     if data is None: return None
     
@@ -209,36 +249,820 @@ def apply_alignment_matrices(data, matrices):
 
 
 
-def extract_kymograph(stack, p1, p2):
+def _sampling_plan_from_coords(shape, xs, ys, nx, ny, line_width=1, method="bilinear"):
+    """
+    [新增] 由采样中心坐标 (xs, ys) 与单位法向 (nx, ny) 生成采样计划。
+    line_width > 1 时沿法向取 N 条平行线平均。
+    返回 dict: 'idx' (L, K) 扁平像素索引, 'weights' (L, K) 权重 (每行和为 1)。
+    """
+    h, w = shape[-2], shape[-1]
+    n_par = max(1, int(line_width))
+    offsets = np.arange(n_par, dtype=np.float64) - (n_par - 1) / 2.0
+    # (L, N) 的平行线采样坐标
+    px = xs[:, None] + offsets[None, :] * np.asarray(nx, dtype=np.float64).reshape(-1, 1)
+    py = ys[:, None] + offsets[None, :] * np.asarray(ny, dtype=np.float64).reshape(-1, 1)
+
+    if method == "nearest":
+        # 与旧版一致: 坐标直接截断为整数
+        xi = np.clip(np.floor(px).astype(np.int64), 0, w - 1)
+        yi = np.clip(np.floor(py).astype(np.int64), 0, h - 1)
+        idx = yi * w + xi
+        weights = np.full(idx.shape, 1.0 / n_par, dtype=np.float32)
+    elif method == "bilinear":
+        px = np.clip(px, 0, w - 1); py = np.clip(py, 0, h - 1)
+        x0 = np.floor(px).astype(np.int64); y0 = np.floor(py).astype(np.int64)
+        fx = px - x0; fy = py - y0
+        x1 = np.minimum(x0 + 1, w - 1); y1 = np.minimum(y0 + 1, h - 1)
+        idx = np.concatenate((y0 * w + x0, y0 * w + x1, y1 * w + x0, y1 * w + x1), axis=1)
+        weights = np.concatenate(((1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy), axis=1)
+        weights = (weights / n_par).astype(np.float32)
+    else:
+        raise ValueError(f"Unknown sampling method: {method}")
+
+    return {'idx': idx, 'weights': weights, 'length': idx.shape[0], 'shape': (h, w)}
+
+
+def build_line_sampling_plan(shape, p1, p2, line_width=1, method="bilinear"):
+    """
+    [新增] 预计算直线 Kymograph 的采样计划 (索引 + 权重)，可在所有帧 / 通道间复用。
+    采样点与旧版 extract_kymograph 相同 (int(长度) 个等距点)。
+    """
+    x1, y1 = p1
+    x2, y2 = p2
+    length = int(np.hypot(x2 - x1, y2 - y1))
+    if length == 0: return None
+    xs = np.linspace(x1, x2, length)
+    ys = np.linspace(y1, y2, length)
+    dist = np.hypot(x2 - x1, y2 - y1)
+    nx, ny = -(y2 - y1) / dist, (x2 - x1) / dist
+    return _sampling_plan_from_coords(shape, xs, ys, nx, ny, line_width, method)
+
+
+def _catmull_rom(points, samples_per_seg=16):
+    """[新增] Catmull-Rom 样条加密折线顶点 (经过所有顶点)。"""
+    p = np.asarray(points, dtype=np.float64)
+    ext = np.vstack((2 * p[0] - p[1], p, 2 * p[-1] - p[-2]))
+    t = np.linspace(0, 1, samples_per_seg, endpoint=False)[:, None]
+    t2, t3 = t * t, t * t * t
+    out = []
+    for i in range(len(p) - 1):
+        p0, p1, p2, p3 = ext[i], ext[i + 1], ext[i + 2], ext[i + 3]
+        out.append(0.5 * ((2 * p1) + (-p0 + p2) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t2
+                          + (-p0 + 3 * p1 - 3 * p2 + p3) * t3))
+    out.append(p[-1:])
+    return np.vstack(out)
+
+
+def build_polyline_sampling_plan(shape, points, line_width=1, method="bilinear", spline=False):
+    """
+    [新增] 折线 / 样条 Kymograph 的采样计划：按弧长等距 (1 px) 采样，
+    法向取所在线段的法向，线宽与插值方式同 build_line_sampling_plan。
+    两点且不平滑时与 build_line_sampling_plan 完全一致。
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 2: return None
+    if len(pts) == 2 and not spline:
+        return build_line_sampling_plan(shape, pts[0], pts[1], line_width, method)
+
+    path = _catmull_rom(pts) if spline and len(pts) > 2 else pts
+    seg = np.diff(path, axis=0)
+    seg_len = np.hypot(seg[:, 0], seg[:, 1])
+    keep = seg_len > 1e-9
+    if not np.any(keep): return None
+    path = np.vstack((path[:1], path[1:][keep]))
+    seg, seg_len = seg[keep], seg_len[keep]
+
+    # 弧长参数化
+    arc = np.concatenate(([0.0], np.cumsum(seg_len)))
+    length = int(arc[-1])
+    if length == 0: return None
+    s = np.linspace(0, arc[-1], length)
+    xs = np.interp(s, arc, path[:, 0])
+    ys = np.interp(s, arc, path[:, 1])
+    k = np.clip(np.searchsorted(arc, s, side='right') - 1, 0, len(seg) - 1)
+    nx = -seg[k, 1] / seg_len[k]
+    ny = seg[k, 0] / seg_len[k]
+    return _sampling_plan_from_coords(shape, xs, ys, nx, ny, line_width, method)
+
+
+def _gather_pixels(stack, flat_idx):
+    """
+    [新增] 按展平索引取出 (T, H, W) 堆栈每帧的像素，返回 (T, n)。
+    用 (y, x) 花式索引代替 reshape(T, -1)[:, idx]：对齐后 / 切片得到的非连续视图不会被整体复制。
+    """
+    ys, xs = np.unravel_index(flat_idx, stack.shape[1:])
+    return stack[:, ys, xs]
+
+
+def extract_kymographs(stack, plans):
+    """
+    [新增] 一次遍历同时提取多条线的 Kymograph。
+    多个采样计划拼接为一个 (权重不足的列补 0)，按帧块只 gather 一次，最后按长度切分。
+    返回与 plans 对应的 (T, L_i) 列表 (plan 为 None 时对应 None)。
+    """
+    valid = [p for p in plans if p is not None]
+    if not valid: return [None] * len(plans)
+    k_max = max(p['idx'].shape[1] for p in valid)
+
+    idx_parts, w_parts = [], []
+    for p in valid:
+        pad = k_max - p['idx'].shape[1]
+        idx_parts.append(np.pad(p['idx'], ((0, 0), (0, pad))))
+        w_parts.append(np.pad(p['weights'], ((0, 0), (0, pad))))
+    combined = {'idx': np.concatenate(idx_parts), 'weights': np.concatenate(w_parts)}
+    combined['length'] = combined['idx'].shape[0]
+
+    if k_max == 1:
+        kymo_all = _gather_pixels(stack, combined['idx'][:, 0])
+    else:
+        kymo_all = apply_sampling_plan(stack, combined)
+
+    out, start = [], 0
+    for p in plans:
+        if p is None:
+            out.append(None); continue
+        out.append(kymo_all[:, start:start + p['length']])
+        start += p['length']
+    return out
+
+
+def apply_sampling_plan(stack, plan, max_block_bytes=32 * 1024 * 1024):
+    """
+    [新增] 将采样计划应用到 (T, H, W) 堆栈，按帧块做一次向量化 gather。
+    返回 (T, L) float32。
+    """
+    idx, weights = plan['idx'], plan['weights']
+    L, K = idx.shape
+    ys, xs = np.unravel_index(idx.ravel(), stack.shape[1:])
+    n_frames = stack.shape[0]
+    out = np.empty((n_frames, L), dtype=np.float32)
+    block = int(max(1, min(n_frames, max_block_bytes // max(1, L * K * 8))))
+    for t0 in range(0, n_frames, block):
+        b = min(block, n_frames - t0)
+        vals = stack[t0:t0 + b, ys, xs].reshape(b, L, K)
+        if K == 1:
+            out[t0:t0 + b] = vals[:, :, 0] * weights[:, 0]
+        else:
+            np.einsum('blk,lk->bl', vals.astype(np.float32, copy=False), weights, out=out[t0:t0 + b])
+    return out
+
+
+def extract_kymograph(stack, p1, p2, method="nearest", line_width=1, plan=None):
     """
     从图像堆栈中提取沿直线的 Kymograph 数据。
     stack: (Frames, Height, Width)
     p1: (x1, y1) 起点
     p2: (x2, y2) 终点
+    method: 'nearest' (与旧版一致) 或 'bilinear' (亚像素插值)
+    line_width: 垂直方向平均的平行线条数
+    plan: [新增] 可传入预计算的采样计划 (build_line_sampling_plan)，跳过坐标计算
     返回: (Frames, Distance) 的 2D 矩阵
     """
-    import numpy as np
-    
-    # 1. 计算两点间距离 (作为 Kymograph 的宽度)
-    x1, y1 = p1
-    x2, y2 = p2
-    length = int(np.hypot(x2 - x1, y2 - y1))
-    
-    if length == 0: return None
+    if plan is None:
+        plan = build_line_sampling_plan(stack.shape, p1, p2, line_width, method)
+    if plan is None: return None
 
-    # 2. 生成采样坐标 (使用线性插值)
-    x_coords = np.linspace(x1, x2, length)
-    y_coords = np.linspace(y1, y2, length)
-    
-    # 3. 转换为整数索引并限制在图像范围内
-    h, w = stack.shape[1], stack.shape[2]
-    x_idxs = np.clip(x_coords.astype(int), 0, w - 1)
-    y_idxs = np.clip(y_coords.astype(int), 0, h - 1)
-    
-    # 4. 利用 NumPy 高级索引一次性提取所有帧的数据
-    # stack 形状为 (T, Y, X)，我们提取所有 T，特定的 Y 和 X
-    kymo_matrix = stack[:, y_idxs, x_idxs]
-    
-    return kymo_matrix
+    # 单像素最近邻: 保持旧版的直接索引 (原始 dtype)
+    if plan['idx'].shape[1] == 1:
+        return _gather_pixels(stack, plan['idx'][:, 0])
+    return apply_sampling_plan(stack, plan)
+
+
+def build_colormap_lut(cmap, n=256, bad_rgb=None):
+    """
+    [新增] 由 Matplotlib colormap 生成 (n + 1, 3) uint8 查找表，最后一行为 NaN (bad) 颜色。
+    bad_rgb: 覆盖 bad 颜色 (例如 colormap 的 bad 为透明时传入背景色)。
+    """
+    lut = np.empty((n + 1, 3), dtype=np.uint8)
+    lut[:n] = np.round(np.asarray(cmap(np.linspace(0, 1, n)))[:, :3] * 255)
+    if bad_rgb is None: bad_rgb = cmap.get_bad()[:3]
+    lut[n] = np.round(np.asarray(bad_rgb[:3], dtype=np.float64) * 255)
+    return lut
+
+
+def frame_to_rgb(img, vmin, vmax, lut, log_scale=False, out_shape=None):
+    """
+    [新增] 把单帧数据经查找表映射为 (H, W, 3) uint8 RGB (最近邻缩放到 out_shape)。
+    先缩放再映射，像素数只与显示尺寸有关；NaN 映射为 LUT 的最后一行。
+    """
+    owned = False
+    if out_shape is not None and tuple(out_shape) != img.shape:
+        h, w = img.shape
+        oh, ow = out_shape
+        rows = (np.arange(oh) * h // oh)
+        cols = (np.arange(ow) * w // ow)
+        img = img[rows[:, None], cols[None, :]]
+        owned = True
+
+    n = lut.shape[0] - 1
+    val = np.asarray(img, dtype=np.float32)
+    if log_scale:
+        vmin = max(vmin, 1e-6); vmax = max(vmax, vmin * 1.0001)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            val = np.log10(val)
+        lo, hi = np.log10(vmin), np.log10(vmax)
+    else:
+        if val is img and not owned: val = val.copy()
+        lo, hi = float(vmin), float(vmax)
+    # [修改] 与 Matplotlib 相同的等宽分箱: floor((v - lo) / (hi - lo) * n)，再截断到 n - 1
+    scale = n / (hi - lo) if hi > lo else 0.0
+
+    bad = np.isnan(val)
+    val -= lo
+    val *= scale
+    np.clip(val, 0, n - 1, out=val)
+    val[bad] = n
+    return lut[val.astype(np.intp)]
+
+
+def _contrast_sample(img, max_samples, min_value=None):
+    """确定性步长抽样 (同一帧每次结果一致)，去掉 NaN 与 <= min_value 的像素"""
+    flat = np.asarray(img).ravel()
+    step = max(1, -(-flat.size // max_samples))
+    sample = flat[::step]
+    valid = ~np.isnan(sample) if sample.dtype.kind == 'f' else np.ones(sample.shape, dtype=bool)
+    if min_value is not None: valid &= sample > min_value
+    return sample[valid]
+
+
+def fast_contrast_limits(img, percentiles=(5, 95), max_samples=1 << 18, min_value=None):
+    """
+    [新增] 快速估计显示范围：在至多 max_samples 个步长抽样像素上求百分位，
+    代替对整帧 nanpercentile。无有效像素时返回 None。
+    """
+    sample = _contrast_sample(img, max_samples, min_value)
+    if sample.size == 0: return None
+    lo, hi = np.percentile(sample, percentiles)
+    return float(lo), float(hi)
+
+
+FRAME_STAT_FIELDS = ("min", "max", "mean", "p1", "p5", "p50", "p95", "p99", "valid_frac")
+
+
+def frame_statistics(img, max_samples=1 << 16):
+    """
+    [新增] 单帧紧凑统计，顺序同 FRAME_STAT_FIELDS。
+    min / max / mean / valid_frac 为整帧精确值；百分位在确定性抽样上估计。
+    """
+    out = np.full(len(FRAME_STAT_FIELDS), np.nan)
+    img = np.asarray(img)
+    if img.dtype.kind == 'f':
+        finite = np.isfinite(img)
+        n_valid = int(np.count_nonzero(finite))
+        out[8] = n_valid / img.size if img.size else 0.0
+        if n_valid == 0: return out
+        vals = img if n_valid == img.size else img[finite]
+    else:
+        out[8] = 1.0
+        vals = img
+    if vals.size == 0: return out
+    out[0], out[1] = vals.min(), vals.max()
+    out[2] = vals.mean(dtype=np.float64)
+    sample = _contrast_sample(vals, max_samples)
+    out[3:8] = np.percentile(sample, (1, 5, 50, 95, 99))
+    return out
+
+
+def detect_outlier_frames(series, window=15, z_thresh=6.0):
+    """
+    [新增] 检测异常帧 (闪烁 / 失焦 / 丢帧)：相对滑动中位数的残差做稳健 z 分数 (MAD)。
+    缓慢漂移 (漂白) 会被滑动中位数吸收，不会被标记。NaN 视为非异常。
+    """
+    x = np.asarray(series, dtype=np.float64)
+    n = x.size
+    flags = np.zeros(n, dtype=bool)
+    ok = np.isfinite(x)
+    if np.count_nonzero(ok) < 5: return flags
+    xv = x[ok]
+    w = min(int(window) | 1, xv.size if xv.size % 2 else xv.size - 1)  # 奇数窗口，不超过序列长度
+    half = w // 2
+    padded = np.pad(xv, half, mode='reflect')
+    trend = np.median(np.lib.stride_tricks.sliding_window_view(padded, w), axis=1)
+    resid = xv - trend
+    mad = np.median(np.abs(resid - np.median(resid))) * 1.4826
+    if not mad > 0:
+        mad = np.mean(np.abs(resid)) * 1.2533
+        if not mad > 0: return flags
+    flags[np.flatnonzero(ok)] = np.abs(resid) / mad > z_thresh
+    return flags
+
+
+def compute_projection(stack, method='mean', block_frames=64, progress_callback=None):
+    """
+    [新增] 计算时间投影 (Mean / Max)，用于自动分割等场景。
+    按帧块累加，避免整栈 float64 临时数组；NaN (配准边缘) 自动忽略。
+    progress_callback(curr, total): 每处理完一个帧块调用一次。
+    返回: (Height, Width) float32
+    """
+    if stack is None: return None
+    if stack.ndim == 2: return stack.astype(np.float32)
+
+    n_frames, h, w = stack.shape
+    if method == 'max':
+        result = np.full((h, w), -np.inf, dtype=np.float32)
+        for t0 in range(0, n_frames, block_frames):
+            block = stack[t0:t0 + block_frames]
+            np.fmax(result, np.fmax.reduce(block, axis=0), out=result)
+            if progress_callback: progress_callback(t0 + block.shape[0], n_frames)
+        result[np.isinf(result)] = np.nan
+        return result
 
+    acc = np.zeros((h, w), dtype=np.float64)
+    counts = np.zeros((h, w), dtype=np.int64)
+    for t0 in range(0, n_frames, block_frames):
+        block = stack[t0:t0 + block_frames]
+        if block.dtype.kind == 'f':
+            valid = ~np.isnan(block)
+            acc += np.where(valid, block, 0).sum(axis=0, dtype=np.float64)
+            counts += valid.sum(axis=0)
+        else:
+            acc += block.sum(axis=0, dtype=np.float64)
+            counts += block.shape[0]
+        if progress_callback: progress_callback(t0 + block.shape[0], n_frames)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = acc / counts
+    return mean.astype(np.float32)
+
+
+def masked_temporal_mean(stack, mask, block_frames=256):
+    """
+    [新增] 计算 Mask 内像素在所有帧上的平均值 (NaN 忽略)。
+    按帧块只提取 Mask 内的像素，开销与 Mask 大小成正比，而不是整个堆栈。
+    """
+    flat_idx = np.flatnonzero(mask)
+    if len(flat_idx) == 0: return 0.0
+
+    total = 0.0
+    count = 0
+    for t0 in range(0, stack.shape[0], block_frames):
+        block = stack[t0:t0 + block_frames]
+        vals = np.take(block.reshape(block.shape[0], -1), flat_idx, axis=1)
+        if vals.dtype.kind == 'f':
+            valid = ~np.isnan(vals)
+            total += float(vals[valid].sum(dtype=np.float64))
+            count += int(valid.sum())
+        else:
+            total += float(vals.sum(dtype=np.float64))
+            count += vals.size
+    return total / count if count > 0 else 0.0
+
+
+# [新增] ROI 曲线可选的统计量 (另支持任意 'pNN' 百分位，如 'p10')
+TRACE_STATS = ("mean", "median", "sd", "sem", "min", "max", "count", "p5", "p25", "p75", "p95")
+
+
+def _stat_quantile(stat):
+    """[新增] 顺序统计量对应的百分位 (非顺序统计量返回 None)。"""
+    if stat == "median": return 50.0
+    if len(stat) > 1 and stat[0] == "p":
+        try: q = float(stat[1:])
+        except ValueError: return None
+        if 0 <= q <= 100: return q
+    return None
+
+
+def _block_quantiles(seg, invalid, q_list):
+    """
+    [新增] 对 (b, n) 块的每一行计算多个百分位 (与 np.percentile 的 linear 插值一致)。
+    无 NaN 时对所有百分位共用一次 partition；有 NaN 时 NaN 排到末尾后按行的有效数插值。
+    """
+    b, n = seg.shape
+    q = np.asarray(q_list, dtype=np.float64) / 100.0
+    if invalid is None or not invalid.any():
+        pos = q * (n - 1)
+        lo = np.floor(pos).astype(np.intp)
+        hi = np.minimum(lo + 1, n - 1)
+        part = np.partition(seg, np.unique(np.concatenate((lo, hi))), axis=1)
+        frac = (pos - lo)[:, None]
+        return part[:, lo].T * (1 - frac) + part[:, hi].T * frac
+
+    work = np.where(invalid, np.inf, seg)
+    work.sort(axis=1)
+    cnt = n - invalid.sum(axis=1)
+    pos = q[:, None] * np.maximum(cnt - 1, 0)[None, :]
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo + 1, np.maximum(cnt - 1, 0)[None, :])
+    v_lo = np.take_along_axis(work, lo.T, axis=1).T
+    v_hi = np.take_along_axis(work, hi.T, axis=1).T
+    frac = pos - lo
+    with np.errstate(invalid='ignore'):
+        out = v_lo * (1 - frac) + v_hi * frac
+    out[:, cnt == 0] = np.nan
+    return out
+
+
+def _segment_stats(buf, invalid, starts, sizes, stats, dev_buf=None):
+    """
+    [新增] 按 ROI 分段 (starts) 一次性计算多个统计量，返回 {stat: (b, n_rois)}。
+    invalid 为 None 表示没有 NaN；注意 buf 会被原地修改 (NaN 置 0)。
+    SD / SEM 为样本标准差 (ddof=1)，按片段均值中心化后以 float64 累加平方和
+    (避免 sumsq - sum*mean 在大基线强度下的精度抵消)。
+    """
+    b = buf.shape[0]
+    n_rois = len(starts)
+    ends = np.append(starts[1:], buf.shape[1])
+    out = {}
+
+    # 1. 顺序统计量: 每个 ROI 片段只做一次 partition (多个百分位共用)
+    quantiles = {s: _stat_quantile(s) for s in stats}
+    q_list = sorted({q for q in quantiles.values() if q is not None})
+    if q_list:
+        res = np.empty((len(q_list), b, n_rois), dtype=np.float64)
+        for k in range(n_rois):
+            seg_invalid = None if invalid is None else invalid[:, starts[k]:ends[k]]
+            res[:, :, k] = _block_quantiles(buf[:, starts[k]:ends[k]], seg_invalid, q_list)
+        for s, q in quantiles.items():
+            if q is not None: out[s] = res[q_list.index(q)]
+
+    # 2. 极值: fmin / fmax 自动忽略 NaN
+    if "min" in stats: out["min"] = np.fmin.reduceat(buf, starts, axis=1)
+    if "max" in stats: out["max"] = np.fmax.reduceat(buf, starts, axis=1)
+
+    # 3. 求和类统计 (sum / sum of squares / count)
+    if invalid is not None:
+        np.copyto(buf, 0, where=invalid)
+        counts = sizes - np.add.reduceat(invalid.view(np.uint8), starts, axis=1, dtype=np.int32)
+    else:
+        counts = np.broadcast_to(sizes, (b, n_rois))
+    sums = np.add.reduceat(buf, starts, axis=1, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / counts
+        out["mean"] = mean
+        if "sd" in stats or "sem" in stats:
+            # [修改] 中心化平方和: dev = buf - 所属片段均值 (float64)
+            seg_id = np.repeat(np.arange(n_rois), sizes)
+            dev = dev_buf[:b] if dev_buf is not None else np.empty(buf.shape, dtype=np.float64)
+            np.take(mean, seg_id, axis=1, out=dev)
+            np.subtract(buf, dev, out=dev)
+            np.square(dev, out=dev)
+            if invalid is not None: np.copyto(dev, 0, where=invalid)
+            ssd = np.add.reduceat(dev, starts, axis=1)
+            sd = np.sqrt(np.where(counts > 1, ssd / (counts - 1), np.nan))
+            if "sd" in stats: out["sd"] = sd
+            if "sem" in stats: out["sem"] = sd / np.sqrt(counts)
+    if "count" in stats: out["count"] = counts.astype(np.float64)
+    return out
+
+
+def _mask_flat_index(mask, shape):
+    """[新增] ROI Mask 在 (H, W) 图像中的展平像素索引；mask 为整图 bool 数组或裁剪形式 (y0, x0, crop)。"""
+    if isinstance(mask, tuple):
+        y0, x0, crop = mask
+        ys, xs = np.nonzero(crop)
+        return (ys + y0) * shape[1] + (xs + x0)
+    return np.flatnonzero(mask)
+
+
+def extract_roi_traces(data_num, masks, data_den=None, bg_num=0.0, bg_den=0.0,
+                       aux_list=(), bg_aux_list=(), int_thresh=0.0, ratio_thresh=0.0,
+                       stats=("mean",), max_block_bytes=64 * 1024 * 1024, progress_callback=None):
+    """
+    [新增] 分帧块提取多个 ROI 的曲线 (分子 / 分母 / 比率 / 辅助通道)。
+    所有 ROI 的像素合并为一次 gather，按帧块流式累加；
+    临时缓冲区大小固定，峰值内存与 ROI 大小和录像长度无关。
+    masks: 每个 ROI 为 (H, W) bool 数组，或外接矩形内的裁剪形式 (y0, x0, crop)。
+    stats: 需要的统计量 (见 TRACE_STATS)，在同一次遍历中计算。
+    progress_callback(curr, total): 每个帧块处理完后调用。
+    返回 dict: 'num', 'den', 'ratio' 为 (n_rois, T) 平均值数组，'aux' 为同形状数组的列表；
+    'stats' 按通道保存其它统计量: {'num': {stat: arr}, ..., 'aux': [{stat: arr}, ...]}。
+    """
+    stats = tuple(dict.fromkeys(("mean",) + tuple(stats)))
+    unknown = [s for s in stats if s not in TRACE_STATS and _stat_quantile(s) is None]
+    if unknown:
+        raise ValueError(f"Unknown trace statistic(s): {unknown}")
+
+    n_frames = data_num.shape[0]
+    n_rois = len(masks)
+    flat_idx = [_mask_flat_index(m, data_num.shape[1:]) for m in masks]
+    sizes = np.array([len(f) for f in flat_idx], dtype=np.int64)
+    if n_rois == 0 or np.any(sizes == 0):
+        raise ValueError("Every ROI mask must contain at least one pixel.")
+    idx = np.concatenate(flat_idx)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    n_pix = len(idx)
+
+    need_sq = "sd" in stats or "sem" in stats
+    need_order = any(_stat_quantile(s) is not None for s in stats)
+
+    # 每帧临时缓冲: 原始 gather + num/den/ratio (float32) + 有效标记 (bool)
+    # 以及可选的中心化平方缓冲 (float64) 和百分位计算时的片段拷贝
+    bytes_per_frame = n_pix * (data_num.dtype.itemsize + 3 * 4 + 2 + 8 * need_sq + 8 * need_order)
+    block = int(max(1, min(n_frames, max_block_bytes // max(1, bytes_per_frame))))
+
+    raw_buf = np.empty((block, n_pix), dtype=data_num.dtype)
+    num_buf = np.empty((block, n_pix), dtype=np.float32)
+    den_buf = np.empty((block, n_pix), dtype=np.float32) if data_den is not None else None
+    ratio_buf = np.empty((block, n_pix), dtype=np.float32) if data_den is not None else None
+    valid_buf = np.empty((block, n_pix), dtype=bool)
+    ratio_valid = np.empty((block, n_pix), dtype=bool) if data_den is not None else None
+    dev_buf = np.empty((block, n_pix), dtype=np.float64) if need_sq else None
+
+    def new_out():
+        return {s: np.empty((n_rois, n_frames), dtype=np.float64) for s in stats}
+
+    out_num = new_out()
+    out_den = new_out() if data_den is not None else {s: np.zeros((n_rois, n_frames)) for s in stats}
+    out_ratio = new_out() if data_den is not None else out_num
+    out_aux = [new_out() for _ in aux_list]
+
+    def may_nan(stack, bg):
+        return stack.dtype.kind not in 'biu' or not np.isfinite(bg)
+
+    def gather(stack, t0, b, bg, out):
+        # 提取 ROI 像素 -> 扣背景 -> 截断负值 (NaN 保持 NaN)
+        flat = stack[t0:t0 + b].reshape(b, -1)
+        if flat.dtype == raw_buf.dtype:
+            raw = np.take(flat, idx, axis=1, out=raw_buf[:b])
+        else:
+            raw = np.take(flat, idx, axis=1)
+        out = out[:b]
+        np.subtract(raw, bg, out=out, casting='unsafe')
+        np.maximum(out, 0, out=out)
+        return out
+
+    def reduce_into(buf, dest, t0, b, may_nan=True):
+        # 整数数据扣除有限背景后不会出现 NaN，可跳过有效性检查
+        invalid = np.isnan(buf, out=valid_buf[:b]) if may_nan else None
+        if invalid is not None and not invalid.any(): invalid = None
+        res = _segment_stats(buf, invalid, starts, sizes, stats, dev_buf)
+        for s in stats:
+            dest[s][:, t0:t0 + b] = res[s].T
+
+    for t0 in range(0, n_frames, block):
+        b = min(block, n_frames - t0)
+        num = gather(data_num, t0, b, bg_num, num_buf)
+
+        if data_den is not None:
+            den = gather(data_den, t0, b, bg_den, den_buf)
+            rv = ratio_valid[:b]
+            np.greater(num, int_thresh, out=rv)
+            rv &= np.greater(den, max(int_thresh, 0.001), out=valid_buf[:b])
+            ratio = ratio_buf[:b]
+            ratio.fill(np.nan)
+            np.divide(num, den, out=ratio, where=rv)
+            if ratio_thresh > 0:
+                with np.errstate(invalid='ignore'):
+                    ratio[ratio < ratio_thresh] = np.nan
+            reduce_into(ratio, out_ratio, t0, b)
+            reduce_into(den, out_den, t0, b, may_nan(data_den, bg_den))
+
+        reduce_into(num, out_num, t0, b, may_nan(data_num, bg_num))
+
+        for i, d_aux in enumerate(aux_list):
+            bg_val = bg_aux_list[i] if i < len(bg_aux_list) else 0
+            aux = gather(d_aux, t0, b, bg_val, num_buf)
+            reduce_into(aux, out_aux[i], t0, b, may_nan(d_aux, bg_val))
 
+        if progress_callback: progress_callback(t0 + b, n_frames)
+
+    peak = sum(a.nbytes for a in (raw_buf, num_buf, den_buf, ratio_buf, valid_buf, ratio_valid, dev_buf) if a is not None)
+    logger.debug("extract_roi_traces: %d ROIs, %d px, %d frames, block=%d, stats=%s, scratch peak=%.1f MB",
+                 n_rois, n_pix, n_frames, block, ",".join(stats), peak / 1024 ** 2)
+
+    clean = lambda d: {s: np.nan_to_num(a, nan=0.0) for s, a in d.items()}
+    out_num, out_den, out_ratio = clean(out_num), clean(out_den), clean(out_ratio)
+    out_aux = [clean(d) for d in out_aux]
+    extra = lambda d: {s: a for s, a in d.items() if s != "mean"}
+    return {
+        'num': out_num['mean'], 'den': out_den['mean'], 'ratio': out_ratio['mean'],
+        'aux': [d['mean'] for d in out_aux],
+        'stats': {
+            'num': extra(out_num), 'den': extra(out_den), 'ratio': extra(out_ratio),
+            'aux': [extra(d) for d in out_aux],
+        },
+        'peak_bytes': peak,
+    }
+
+
+def _sliding_min(x, window):
+    """
+    [新增] 居中滑动最小值 (van Herk / Gil-Werman 算法)，对 (n, T) 的每一行 O(T) 计算。
+    """
+    n, T = x.shape
+    half = window // 2
+    length = -(-(T + window - 1) // window) * window  # 向上取整到 window 的倍数
+    xp = np.pad(x, ((0, 0), (half, length - T - half)), mode='edge')
+    blocks = xp.reshape(n, -1, window)
+    g = np.minimum.accumulate(blocks, axis=2).reshape(n, -1)              # 块内前缀最小
+    h = np.minimum.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n, -1)  # 块内后缀最小
+    return np.minimum(h[:, :T], g[:, window - 1:window - 1 + T])
+
+
+def rolling_baseline(traces, window, method="percentile", percentile=8.0, max_chunk_elems=8_000_000):
+    """
+    [新增] 计算滑动窗口基线 F0 (对所有 ROI 同时向量化计算)。
+    traces: (n_rois, T) 或 (T,)；window: 窗口帧数 (居中)；
+    method: 'percentile' (窗口百分位) 或 'min' (窗口最小值)。
+    百分位模式每隔 window/4 帧计算一次窗口百分位后线性插值，复杂度约 O(T·4)/ROI。
+    """
+    x = np.asarray(traces, dtype=np.float32)
+    squeeze = x.ndim == 1
+    if squeeze: x = x[None, :]
+    n, T = x.shape
+    window = int(max(1, min(window, T)))
+    if window % 2 == 0: window += 1
+
+    if method == "min":
+        base = _sliding_min(x, window)
+    elif method == "percentile":
+        half = window // 2
+        step = max(1, window // 4)
+        centers = np.arange(0, T, step)
+        if centers[-1] != T - 1: centers = np.append(centers, T - 1)
+        xp = np.pad(x, ((0, 0), (half, half)), mode='edge')
+        view = np.lib.stride_tricks.sliding_window_view(xp, window, axis=1)
+        # 与 np.percentile (linear) 一致：只 partition 一次，相邻秩用片段 max/min 取得
+        pos = np.clip(percentile, 0, 100) / 100.0 * (window - 1)
+        lo = int(np.floor(pos)); hi = min(lo + 1, window - 1); frac_q = pos - lo
+        anchors = np.empty((n, len(centers)), dtype=np.float32)
+        rows = max(1, max_chunk_elems // (len(centers) * window))
+        for r0 in range(0, n, rows):
+            chunk = view[r0:r0 + rows][:, centers]
+            if hi == lo:
+                v_lo = v_hi = np.partition(chunk, lo, axis=2)[..., lo]
+            elif lo < window // 2:
+                part = np.partition(chunk, hi, axis=2)
+                v_hi = part[..., hi]; v_lo = part[..., :hi].max(axis=2)
+            else:
+                part = np.partition(chunk, lo, axis=2)
+                v_lo = part[..., lo]; v_hi = part[..., lo + 1:].min(axis=2)
+            anchors[r0:r0 + rows] = v_lo * (1 - frac_q) + v_hi * frac_q
+        if len(centers) == 1:
+            base = np.repeat(anchors, T, axis=1)
+        else:
+            t = np.arange(T)
+            i = np.clip(np.searchsorted(centers, t, side='right') - 1, 0, len(centers) - 2)
+            frac = ((t - centers[i]) / (centers[i + 1] - centers[i])).astype(np.float32)
+            base = anchors[:, i] * (1 - frac) + anchors[:, i + 1] * frac
+    else:
+        raise ValueError(f"Unknown baseline method: {method}")
+    return base[0] if squeeze else base
+
+
+def rolling_dff(traces, window, method="percentile", percentile=8.0):
+    """
+    [新增] 使用滑动基线的 ΔF/F 归一化: (F - F0) / F0，F0 过小处置 0。
+    """
+    x = np.asarray(traces, dtype=np.float32)
+    f0 = rolling_baseline(x, window, method, percentile)
+    out = np.zeros_like(x)
+    np.divide(x - f0, f0, out=out, where=f0 > 1e-6)
+    return out
+
+
+def decimate_minmax(x, y, n_bins, x_range=None):
+    """
+    [新增] 按像素列做 min/max 包络抽稀，用于长曲线显示。
+    只保留可见范围 x_range=(x0, x1) (两侧各多留一个点，使曲线延伸到边缘)，
+    每个 bin 取最小值和最大值两个原始样本 (按时间先后)，峰值不会丢失。
+    x 须单调递增。点数不多于 4 * n_bins 时只裁剪不抽稀。
+    """
+    x = np.asarray(x); y = np.asarray(y, dtype=np.float64)
+    i0, i1 = 0, len(x)
+    if x_range is not None and len(x):
+        i0 = max(int(np.searchsorted(x, x_range[0], side='left')) - 1, 0)
+        i1 = min(int(np.searchsorted(x, x_range[1], side='right')) + 1, len(x))
+    n = i1 - i0
+    n_bins = max(int(n_bins), 1)
+    if n <= 4 * n_bins: return x[i0:i1], y[i0:i1]
+
+    b = -(-n // n_bins)
+    nb = -(-n // b)
+    seg = np.empty(nb * b)
+    seg[:n] = y[i0:i1]
+    seg[n:] = np.nan
+    seg = seg.reshape(nb, b)
+    nan = np.isnan(seg)
+    lo = np.where(nan, np.inf, seg).argmin(axis=1)
+    hi = np.where(nan, -np.inf, seg).argmax(axis=1)
+    first, second = np.minimum(lo, hi), np.maximum(lo, hi)
+    base = i0 + np.arange(nb) * b
+    idx = np.empty(2 * nb, dtype=np.intp)
+    idx[0::2] = base + first
+    idx[1::2] = base + second
+    idx = np.minimum(idx, i1 - 1)
+    # 首尾样本始终保留 (坐标范围与未抽稀时一致)
+    idx = np.concatenate(([i0], idx, [i1 - 1]))
+    return x[idx], y[idx]
+
+
+def _label_bboxes(labels, n_labels):
+    """
+    [新增] 向量化计算每个标签的面积与外接矩形 (不依赖 SciPy)。
+    Returns: areas, x0, y0, x1, y1 (长度 n_labels + 1，索引 0 为背景)
+    """
+    flat = labels.ravel()
+    fg = np.flatnonzero(flat)
+    lab = flat[fg]
+    order = np.argsort(lab, kind='stable')
+    lab = lab[order]
+    ys, xs = np.divmod(fg[order], labels.shape[1])
+
+    areas = np.bincount(lab, minlength=n_labels + 1)
+    x0 = np.zeros(n_labels + 1, dtype=np.int64); x1 = np.zeros_like(x0)
+    y0 = np.zeros_like(x0); y1 = np.zeros_like(x0)
+    present = np.flatnonzero(areas)
+    present = present[present > 0]
+    if len(present) > 0:
+        starts = np.searchsorted(lab, present)
+        x0[present] = np.minimum.reduceat(xs, starts)
+        x1[present] = np.maximum.reduceat(xs, starts) + 1
+        y0[present] = np.minimum.reduceat(ys, starts)
+        y1[present] = np.maximum.reduceat(ys, starts) + 1
+    return areas, x0, y0, x1, y1
+
+
+def segment_cells(image, threshold=None, min_area=20, max_area=None,
+                  use_watershed=False, min_distance=5):
+    """
+    [新增] 自动细胞分割：阈值 + 连通域 (+ 可选 Watershed 拆分粘连细胞)。
+    image: 2D 投影图 (Mean / Max)
+    threshold: None 表示 Otsu 自动阈值，否则为原始强度阈值
+    min_area / max_area: 面积过滤 (像素)
+    min_distance: Watershed 种子点的最小间距 (像素)
+    Returns: (labels, regions)
+        labels: int32 标签图 (0 = 背景，1..N 连续编号)
+        regions: list of dict {'label', 'area', 'bbox': (x, y, w, h)}
+    """
+    cv2 = _load_cv2()
+    if cv2 is None:
+        raise ImportError("Missing Dependency: Please install 'opencv-python' to use Auto ROI features.")
+
+    img = np.nan_to_num(np.asarray(image, dtype=np.float32), nan=0.0)
+    lo, hi = float(img.min()), float(img.max())
+    if hi <= lo:
+        return np.zeros(img.shape, dtype=np.int32), []
+
+    # 1. 二值化
+    if threshold is None:
+        img_u8 = ((img - lo) * (255.0 / (hi - lo))).astype(np.uint8)
+        _, binary = cv2.threshold(img_u8, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    else:
+        binary = np.where(img > threshold, 255, 0).astype(np.uint8)
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+
+    # 2. 连通域 / Watershed
+    if use_watershed:
+        dist = cv2.distanceTransform(binary, cv2.DIST_L2, 5)
+        k = 2 * max(1, int(min_distance)) + 1
+        peak_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+        peaks = ((dist >= cv2.dilate(dist, peak_kernel)) & (dist > 1.0)).astype(np.uint8)
+        n_seeds, markers = cv2.connectedComponents(peaks)
+
+        # 1 = 确定背景, 0 = 待定区域, 2.. = 种子
+        markers = markers + 1
+        markers[(binary > 0) & (peaks == 0)] = 0
+        img_u8 = ((img - lo) * (255.0 / (hi - lo))).astype(np.uint8)
+        markers = cv2.watershed(cv2.cvtColor(img_u8, cv2.COLOR_GRAY2BGR), markers.astype(np.int32))
+        labels = np.where(markers > 1, markers - 1, 0).astype(np.int32)
+        labels[binary == 0] = 0
+        n_labels = n_seeds - 1
+    else:
+        n_labels, labels = cv2.connectedComponents(binary, connectivity=8, ltype=cv2.CV_32S)
+        n_labels -= 1
+
+    if n_labels <= 0:
+        return np.zeros(img.shape, dtype=np.int32), []
+
+    # 3. 面积过滤 + 重新连续编号
+    areas, x0, y0, x1, y1 = _label_bboxes(labels, n_labels)
+    keep = areas >= max(1, int(min_area))
+    if max_area:
+        keep &= areas <= int(max_area)
+    keep[0] = False
+
+    kept = np.flatnonzero(keep)
+    lut = np.zeros(n_labels + 1, dtype=np.int32)
+    lut[kept] = np.arange(1, len(kept) + 1, dtype=np.int32)
+    labels = lut[labels]
+
+    regions = [
+        {'label': i + 1, 'area': int(areas[k]),
+         'bbox': (int(x0[k]), int(y0[k]), int(x1[k] - x0[k]), int(y1[k] - y0[k]))}
+        for i, k in enumerate(kept)
+    ]
+    return labels, regions
+
+
+def region_outline(labels, region):
+    """
+    [新增] 提取单个分割区域的外轮廓 (多边形顶点，图像坐标)。
+    只在外接矩形内运算，避免整图扫描。
+    """
+    x, y, w, h = region['bbox']
+    crop = (labels[y:y + h, x:x + w] == region['label']).astype(np.uint8)
+    # 2 倍最近邻放大后取轮廓，再映射回原坐标 (v/2 - 0.25)：
+    # 轮廓落在边界像素中心之外 0.25 px，保证由多边形重建 Mask 时边界像素不丢失
+    cv2 = _load_cv2()
+    crop2 = cv2.resize(crop, (w * 2, h * 2), interpolation=cv2.INTER_NEAREST)
+    contours, _ = cv2.findContours(crop2, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        cnt = max(contours, key=cv2.contourArea).reshape(-1, 2)
+        if len(cnt) >= 3:
+            return cnt.astype(np.float64) / 2.0 - 0.25 + (x, y)
+    # 过小的区域退化为外接矩形
+    return np.array([[x, y], [x + w - 1, y], [x + w - 1, y + h - 1], [x, y + h - 1]], dtype=np.float64) + \
+        np.array([[-0.25, -0.25], [0.25, -0.25], [0.25, 0.25], [-0.25, 0.25]])
@@ -0,0 +1,71 @@
+# tests/bench_export.py
+"""
+导出压缩基准：比较各 Tiff 压缩方式 (及分块存储) 的文件大小 / 耗时。
+用法: python tests/bench_export.py [--frames 100] [--size 1024] [--smooth 0]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path: sys.path.insert(0, src_path)
+
+from ria_gui.model import AnalysisSession
+
+
+def make_session(n_frames, size, seed=0):
+    """合成双通道数据：若干明亮的 "细胞" + 暗背景，阈值后背景为 NaN (与真实比率图相似)"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:size, :size]
+    cells = np.zeros((size, size), np.float32)
+    for _ in range(max(4, size // 64)):
+        cy, cx, r = rng.integers(0, size), rng.integers(0, size), rng.integers(size // 40 + 4, size // 12 + 8)
+        cells += 2000 * np.exp(-((yy - cy) ** 2 + (xx - cx) ** 2) / (2.0 * r * r))
+    t = np.linspace(0, 4 * np.pi, n_frames, dtype=np.float32)[:, None, None]
+    base = 100 + cells[None]
+    d1 = base * (1 + 0.2 * np.sin(t)) + rng.normal(0, 10, (n_frames, size, size))
+    d2 = base + rng.normal(0, 10, (n_frames, size, size))
+
+    session = AnalysisSession()
+    session.data1 = np.clip(d1, 0, 65535).astype(np.uint16)
+    session.data2 = np.clip(d2, 0, 65535).astype(np.uint16)
+    session.recalc_background()
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compressed ratio-stack export.")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--int-thresh', type=float, default=300)
+    parser.add_argument('--out-dir', default=None, help="Directory for temporary files (default: system temp).")
+    args = parser.parse_args()
+
+    session = make_session(args.frames, args.size)
+    raw_mb = args.frames * args.size * args.size * 4 / 2 ** 20
+    print(f"Stack: {args.frames} x {args.size} x {args.size} float32 ({raw_mb:.0f} MB), CPUs: {os.cpu_count()}")
+    print(f"{'codec':<6} {'tiles':<6} {'time (s)':>9} {'size (MB)':>10} {'ratio':>7} {'MB/s':>8}")
+
+    with tempfile.TemporaryDirectory(dir=args.out_dir) as tmp:
+        for codec in ("none", "zlib", "zstd", "lzw"):
+            for tile in (None, 256):
+                path = os.path.join(tmp, f"bench_{codec}_{tile}.tif")
+                t0 = time.perf_counter()
+                try:
+                    session.export_raw_ratio_stack(path, args.int_thresh, 0, compression=codec, tile=tile)
+                except ImportError as e:
+                    print(f"{codec:<6} {'yes' if tile else 'no':<6} skipped: {e}")
+                    break
+                dt = time.perf_counter() - t0
+                size_mb = os.path.getsize(path) / 2 ** 20
+                print(f"{codec:<6} {'yes' if tile else 'no':<6} {dt:>9.2f} {size_mb:>10.1f} "
+                      f"{raw_mb / size_mb:>6.1f}x {raw_mb / dt:>8.0f}")
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# tests/test_gui_components.py
+import pytest
+
+gui_components = pytest.importorskip("ria_gui.gui_components")
+ProgressTask, ProgressBus = gui_components.ProgressTask, gui_components.ProgressBus
+
+
+class FakeClock:
+    def __init__(self): self.t = 100.0
+    def __call__(self): return self.t
+
+
+def test_progress_task_snapshot_rate_eta_and_stage(monkeypatch):
+    """测试进度快照的吞吐量 / ETA，以及 set_stage 清零计数并重新计时"""
+    clock = FakeClock()
+    monkeypatch.setattr(gui_components.time, "perf_counter", clock)
+
+    task = ProgressTask("export", total=100, stage="Writing")
+    clock.t += 2.0
+    task(40)  # 可直接作为 progress_callback(curr, total)
+    info = task.snapshot()
+    assert (info['stage'], info['done'], info['total']) == ("Writing", 40, 100)
+    assert info['rate'] == pytest.approx(20.0)
+    assert info['eta'] == pytest.approx(3.0)
+    assert info['elapsed'] == pytest.approx(2.0)
+    assert not info['finished']
+
+    task.set_stage("Verifying", total=10)
+    info = task.snapshot()
+    assert (info['stage'], info['done'], info['total']) == ("Verifying", 0, 10)
+    assert info['rate'] == 0.0 and info['eta'] is None
+
+    clock.t += 1.0
+    task.update(10)
+    task.finish()
+    info = task.snapshot()
+    assert info['rate'] == pytest.approx(10.0)
+    assert info['eta'] is None  # 已完成
+    assert info['elapsed'] == pytest.approx(3.0)
+    assert info['finished']
+
+
+def test_progress_bus_describe():
+    """测试进度文本格式 (阶段 / 计数 / 吞吐量 / ETA，缺失的部分省略)"""
+    info = dict(stage="Aligning", done=120, total=500, rate=45.2, eta=8.4)
+    assert ProgressBus.describe(info) == "Aligning · 120/500 · 45.2 fr/s · ETA 0:08"
+    info = dict(stage="Segmenting", done=0, total=0, rate=0.0, eta=None)
+    assert ProgressBus.describe(info) == "Segmenting"
+    info = dict(stage="", done=3, total=10, rate=0.5, eta=125.0)
+    assert ProgressBus.describe(info) == "3/10 · 0.5 fr/s · ETA 2:05"
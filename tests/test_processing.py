@@ -1,7 +1,13 @@
 # tests/test_processing.py
 import numpy as np
 import pytest
-from ria_gui.processing import calculate_background, process_frame_ratio, smooth_nan_safe
+from ria_gui.processing import (calculate_background, process_frame_ratio, smooth_nan_safe, segment_cells,
+                                region_outline, masked_temporal_mean, extract_roi_traces, rolling_baseline,
+                                extract_kymograph, build_polyline_sampling_plan, extract_kymographs,
+                                build_colormap_lut, frame_to_rgb, fast_contrast_limits,
+                                FRAME_STAT_FIELDS, frame_statistics, detect_outlier_frames, display_frame,
+                                display_level_for, decimate_minmax)
+from ria_gui.io_utils import format_table_text, export_table
 
 # --- 测试用例开始 ---
 
@@ -51,4 +57,374 @@ def test_smooth_nan_safe():
     smoothed = smooth_nan_safe(img, size=3)
     assert smoothed[5, 5] < 100.0
     assert smoothed[4, 5] > 0.0
-    assert smoothed.shape == img.shape
\ No newline at end of file
+    assert smoothed.shape == img.shape
+
+def test_segment_cells_area_filter():
+    """测试自动分割 (阈值 + 连通域) 与面积过滤"""
+    try:
+        import cv2
+    except ImportError:
+        pytest.skip("OpenCV not installed, skipping segmentation test")
+
+    img = np.zeros((64, 64), dtype=np.float32)
+    img[5:15, 5:15] = 100.0    # 100 px
+    img[30:50, 30:50] = 100.0  # 400 px
+    img[55:57, 55:57] = 100.0  # 4 px (噪点，会被开运算/面积过滤去除)
+
+    labels, regions = segment_cells(img, min_area=20)
+    assert len(regions) == 2
+    assert labels.max() == 2
+    assert sorted(r['area'] for r in regions) == [100, 400]
+
+    labels, regions = segment_cells(img, min_area=20, max_area=200)
+    assert len(regions) == 1
+    assert regions[0]['bbox'] == (5, 5, 10, 10)
+
+def test_segment_cells_watershed_split():
+    """测试 Watershed 拆分两个粘连的圆形细胞"""
+    try:
+        import cv2
+    except ImportError:
+        pytest.skip("OpenCV not installed, skipping segmentation test")
+
+    yy, xx = np.mgrid[:100, :140]
+    img = np.zeros((100, 140), dtype=np.float32)
+    img[(yy - 50)**2 + (xx - 45)**2 < 400] = 100.0
+    img[(yy - 50)**2 + (xx - 80)**2 < 400] = 100.0
+
+    _, regions = segment_cells(img)
+    assert len(regions) == 1
+    _, regions = segment_cells(img, use_watershed=True)
+    assert len(regions) == 2
+
+def test_region_outline_roundtrip():
+    """测试轮廓多边形可以无损重建原始 Mask (保证 ROI JSON 保存/加载一致)"""
+    try:
+        import cv2
+    except ImportError:
+        pytest.skip("OpenCV not installed, skipping segmentation test")
+    from matplotlib.path import Path as MplPath
+
+    img = np.zeros((40, 40), dtype=np.float32)
+    img[10:20, 12:30] = 50.0
+    img[20:28, 12:18] = 50.0
+    labels, regions = segment_cells(img, threshold=10)
+    verts = region_outline(labels, regions[0])
+
+    y, x = np.mgrid[:40, :40]
+    points = np.vstack((x.ravel(), y.ravel())).T
+    mask = MplPath(verts).contains_points(points).reshape(40, 40)
+    np.testing.assert_array_equal(mask, labels == regions[0]['label'])
+
+def test_masked_temporal_mean():
+    """测试 Mask 时间平均与整堆栈平均结果一致 (含 NaN)"""
+    rng = np.random.default_rng(0)
+    stack = rng.random((7, 20, 30)).astype(np.float32)
+    stack[2, 5, 5] = np.nan
+    mask = np.zeros((20, 30), dtype=bool)
+    mask[3:9, 4:12] = True
+
+    expected = np.nanmean(stack[:, mask])
+    assert masked_temporal_mean(stack, mask, block_frames=3) == pytest.approx(expected, rel=1e-6)
+    assert masked_temporal_mean(stack, np.zeros_like(mask)) == 0.0
+
+def test_extract_roi_traces_matches_full_gather():
+    """测试分帧块提取与一次性整体提取的结果一致"""
+    rng = np.random.default_rng(1)
+    d1 = rng.integers(0, 500, (9, 16, 16)).astype(np.uint16)
+    d2 = rng.integers(0, 500, (9, 16, 16)).astype(np.uint16)
+    masks = [np.zeros((16, 16), dtype=bool) for _ in range(2)]
+    masks[0][2:6, 3:9] = True
+    masks[1][8:15, 1:4] = True
+
+    progress = []
+    traces = extract_roi_traces(d1, masks, d2, 20.0, 30.0, int_thresh=50, max_block_bytes=1,
+                                progress_callback=lambda c, t: progress.append((c, t)))
+    assert progress == [(i, 9) for i in range(1, 10)]  # 每个帧块报告一次
+    for k, m in enumerate(masks):
+        num = np.clip(d1[:, m].astype(np.float32) - 20.0, 0, None)
+        den = np.clip(d2[:, m].astype(np.float32) - 30.0, 0, None)
+        valid = (num > 50) & (den > 50)
+        ratio = np.where(valid, num / np.where(valid, den, 1), np.nan)
+        np.testing.assert_allclose(traces['num'][k], num.mean(axis=1), rtol=1e-5)
+        np.testing.assert_allclose(traces['den'][k], den.mean(axis=1), rtol=1e-5)
+        np.testing.assert_allclose(traces['ratio'][k], np.nan_to_num(np.nanmean(ratio, axis=1)), rtol=1e-5)
+
+    # 裁剪形式 (y0, x0, crop) 的 Mask 与整图 Mask 结果相同
+    cropped = [(2, 3, masks[0][2:6, 3:9]), (8, 1, masks[1][8:15, 1:4])]
+    traces_crop = extract_roi_traces(d1, cropped, d2, 20.0, 30.0, int_thresh=50)
+    for key in ('num', 'den', 'ratio'):
+        np.testing.assert_array_equal(traces_crop[key], traces[key])
+
+def test_extract_roi_traces_statistics():
+    """测试单次遍历计算的多种统计量 (含 NaN 像素)"""
+    rng = np.random.default_rng(2)
+    stack = rng.random((6, 12, 12)).astype(np.float32) * 100
+    stack[1, 2:4, 2:4] = np.nan
+    mask = np.zeros((12, 12), dtype=bool)
+    mask[1:7, 1:8] = True
+
+    traces = extract_roi_traces(stack, [mask], stats=("median", "sd", "sem", "min", "max", "count", "p90"))
+    st = traces['stats']['num']
+    vals = stack[:, mask]
+    np.testing.assert_allclose(st['median'][0], np.nanmedian(vals, axis=1), rtol=1e-5)
+    np.testing.assert_allclose(st['p90'][0], np.nanpercentile(vals, 90, axis=1), rtol=1e-5)
+    np.testing.assert_allclose(st['sd'][0], np.nanstd(vals, axis=1, ddof=1), rtol=1e-4)
+    np.testing.assert_allclose(st['min'][0], np.nanmin(vals, axis=1), rtol=1e-6)
+    np.testing.assert_allclose(st['max'][0], np.nanmax(vals, axis=1), rtol=1e-6)
+    np.testing.assert_array_equal(st['count'][0], np.sum(~np.isnan(vals), axis=1))
+
+    with pytest.raises(ValueError):
+        extract_roi_traces(stack, [mask], stats=("mode",))
+
+def test_extract_roi_traces_sd_large_offset():
+    """测试高基线强度 (10000 + N(0,1)) 下 SD / SEM 不丢失精度"""
+    rng = np.random.default_rng(7)
+    stack = (10000 + rng.normal(0, 1, (5, 64, 64))).astype(np.float32)
+    stack[2, :3, :3] = np.nan
+    masks = [np.zeros((64, 64), dtype=bool) for _ in range(2)]
+    masks[0][:40, :40] = True
+    masks[1][30:, 20:] = True
+
+    st = extract_roi_traces(stack, masks, stats=("sd", "sem"))['stats']['num']
+    for k, m in enumerate(masks):
+        vals = stack[:, m].astype(np.float64)
+        sd = np.nanstd(vals, axis=1, ddof=1)
+        np.testing.assert_allclose(st['sd'][k], sd, rtol=1e-4)
+        np.testing.assert_allclose(st['sem'][k], sd / np.sqrt(np.sum(~np.isnan(vals), axis=1)), rtol=1e-4)
+
+def test_rolling_baseline_matches_naive_window():
+    """测试滑动最小值 / 百分位基线与逐窗口朴素计算一致"""
+    rng = np.random.default_rng(3)
+    traces = rng.random((3, 60)).astype(np.float32) + np.linspace(0, 2, 60, dtype=np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(traces, ((0, 0), (4, 4)), mode='edge'), 9, axis=1)
+
+    np.testing.assert_array_equal(rolling_baseline(traces, 9, method="min"), windows.min(axis=2))
+    # 百分位模式在锚点 (每 window//4 帧) 上精确
+    anchors = np.arange(0, 60, 2)
+    np.testing.assert_allclose(rolling_baseline(traces, 9, method="percentile", percentile=20)[:, anchors],
+                               np.percentile(windows, 20, axis=2)[:, anchors], rtol=1e-6)
+
+def test_extract_kymograph_bilinear_width():
+    """测试双线性 + 线宽采样在线性渐变图像上精确，最近邻与旧版截断一致"""
+    yy, xx = np.mgrid[:64, :64]
+    ramp = (2 * xx + 3 * yy).astype(np.float32)
+    stack = np.stack([ramp, ramp + 10])
+
+    kymo = extract_kymograph(stack, (5.5, 5.25), (40.5, 30.75), method="bilinear", line_width=3)
+    xs = np.linspace(5.5, 40.5, kymo.shape[1])
+    ys = np.linspace(5.25, 30.75, kymo.shape[1])
+    np.testing.assert_allclose(kymo[1], 2 * xs + 3 * ys + 10, atol=1e-3)
+
+    nearest = extract_kymograph(stack, (5.5, 5.25), (40.5, 30.75))
+    np.testing.assert_array_equal(nearest, stack[:, ys.astype(int), xs.astype(int)])
+
+    # 非连续视图 (切片) 与连续副本结果一致
+    view = np.stack([ramp, ramp + 10, ramp + 20])[::2, 2:, 1:]
+    assert not view.flags.c_contiguous
+    for method in ("nearest", "bilinear"):
+        np.testing.assert_array_equal(extract_kymograph(view, (3, 4), (50, 40), method=method),
+                                      extract_kymograph(np.ascontiguousarray(view), (3, 4), (50, 40), method=method))
+
+def test_polyline_kymographs_single_pass():
+    """测试折线按弧长采样，并且多条线一次提取与逐条提取一致"""
+    yy, xx = np.mgrid[:128, :128]
+    stack = np.stack([2 * xx + 3 * yy, xx + yy]).astype(np.float32)
+
+    plan = build_polyline_sampling_plan(stack.shape, [(10, 10), (60, 10), (60, 80)], line_width=3)
+    assert plan['length'] == 120
+    s = np.linspace(0, 120, 120)
+    x = np.where(s < 50, 10 + s, 60)
+    y = np.where(s < 50, 10, 10 + s - 50)
+
+    straight = build_polyline_sampling_plan(stack.shape, [(5.5, 5.25), (40.5, 30.75)], method="nearest")
+    kymos = extract_kymographs(stack, [plan, None, straight])
+    np.testing.assert_allclose(kymos[0][0], 2 * x + 3 * y, atol=1e-3)
+    assert kymos[1] is None
+    np.testing.assert_array_equal(kymos[2], extract_kymograph(stack, (5.5, 5.25), (40.5, 30.75)))
+
+def test_frame_to_rgb_lut_mapping():
+    """测试直接渲染的 LUT 映射：上下限截断、NaN 映射为 bad 颜色、最近邻缩放"""
+    import matplotlib.pyplot as plt
+    cmap = plt.get_cmap("gray").copy()
+    cmap.set_bad("red")
+    lut = build_colormap_lut(cmap, 256)
+    assert lut.shape == (257, 3) and lut.dtype == np.uint8
+
+    img = np.array([[-5.0, 0.0, 0.5, 1.0], [2.0, np.nan, 1.0, 0.0]], dtype=np.float32)
+    rgb = frame_to_rgb(img, 0.0, 1.0, lut)
+    assert rgb.shape == (2, 4, 3)
+    np.testing.assert_array_equal(rgb[0, 0], [0, 0, 0])
+    np.testing.assert_array_equal(rgb[1, 0], [255, 255, 255])
+    np.testing.assert_array_equal(rgb[1, 1], [255, 0, 0])
+    assert abs(int(rgb[0, 2, 0]) - 128) <= 1
+    assert np.isnan(img[1, 1])  # 输入不被原地修改
+
+    small = frame_to_rgb(img, 0.0, 1.0, lut, out_shape=(1, 2))
+    np.testing.assert_array_equal(small, rgb[::2, ::2])
+
+    # 与 Matplotlib 的 Normalize + colormap 分箱一致 (每个颜色区间等宽)
+    viridis = plt.get_cmap("viridis")
+    vals = np.random.default_rng(4).uniform(-0.2, 3.2, (64, 64)).astype(np.float32)
+    expected = np.round(viridis(plt.Normalize(0.0, 3.0)(vals))[..., :3] * 255).astype(np.uint8)
+    np.testing.assert_array_equal(frame_to_rgb(vals, 0.0, 3.0, build_colormap_lut(viridis)), expected)
+
+def test_contrast_limits_sampled():
+    """测试抽样估计的显示范围与整帧百分位接近，并忽略 NaN / 过小值"""
+    rng = np.random.default_rng(0)
+    img = rng.normal(1.0, 0.2, (600, 700)).astype(np.float32)
+    img[:50] = np.nan
+    ref = np.nanpercentile(img, [5, 95])
+    lo, hi = fast_contrast_limits(img, max_samples=20000)
+    assert abs(lo - ref[0]) < 0.02 and abs(hi - ref[1]) < 0.02
+    assert fast_contrast_limits(img, max_samples=20000) == (lo, hi)  # 确定性
+    assert fast_contrast_limits(np.full((4, 4), np.nan)) is None
+    assert fast_contrast_limits(np.array([0.0, 2.0, 3.0]), (0, 100), min_value=1.0) == (2.0, 3.0)
+
+def test_frame_statistics_and_outliers():
+    """测试逐帧统计字段与异常帧检测 (缓慢漂白不应被标记)"""
+    img = np.arange(100, dtype=np.float32).reshape(10, 10)
+    img[0, :5] = np.nan
+    row = dict(zip(FRAME_STAT_FIELDS, frame_statistics(img)))
+    assert row["min"] == 5 and row["max"] == 99
+    assert row["mean"] == pytest.approx(np.nanmean(img))
+    assert row["p50"] == pytest.approx(np.nanmedian(img))
+    assert row["valid_frac"] == pytest.approx(0.95)
+    assert np.isnan(frame_statistics(np.full((3, 3), np.nan))[0])
+
+    rng = np.random.default_rng(1)
+    series = np.linspace(100, 60, 300) + rng.normal(0, 0.5, 300)
+    series[[10, 150, 299]] += [30, -20, 15]
+    series[200] = np.nan
+    assert list(np.flatnonzero(detect_outlier_frames(series))) == [10, 150, 299]
+
+def test_display_pyramid_frame():
+    """测试显示金字塔：可见区域裁剪 + 块平均，层级按屏幕像素选择"""
+    frame = np.arange(64 * 48, dtype=np.uint16).reshape(64, 48)
+    assert display_frame(frame) is frame
+
+    binned = display_frame(frame, level=4)
+    assert binned.shape == (16, 12)
+    np.testing.assert_allclose(binned, frame.reshape(16, 4, 12, 4).mean(axis=(1, 3)))
+
+    crop = display_frame(frame, level=2, region=(8, 29, 4, 20))
+    assert crop.shape == (10, 8)
+    np.testing.assert_allclose(crop, frame[8:28, 4:20].reshape(10, 2, 8, 2).mean(axis=(1, 3)))
+
+    assert display_level_for(4096, 800) == 4
+    assert display_level_for(1000, 800) == 1
+    assert display_level_for(300, 800) == 1
+
+def test_decimate_minmax_keeps_envelope():
+    """测试 min/max 抽稀：点数受像素列限制，保留峰值与首尾，按可见范围裁剪"""
+    x = np.arange(10000, dtype=np.float64)
+    y = np.sin(x / 50.0)
+    y[1234] = 5.0
+    y[4321] = -5.0
+    xd, yd = decimate_minmax(x, y, 100)
+    assert xd.size <= 2 * 100 + 2
+    assert yd.max() == 5.0 and yd.min() == -5.0
+    assert xd[0] == 0 and xd[-1] == 9999
+    assert np.all(np.diff(xd) >= 0)
+
+    xs, ys = decimate_minmax(x, y, 100, x_range=(2000, 2100))
+    assert xs[0] == 1999 and xs[-1] == 2101
+    np.testing.assert_array_equal(ys, y[1999:2102])
+
+
+def test_export_table_bulk_format(tmp_path):
+    """测试批量格式化与逐元素 f-string 结果一致，并能写出 CSV"""
+    rng = np.random.default_rng(3)
+    table = rng.normal(0, 50, (300, 4))
+    table[0, 1] = np.nan
+    table[1, 2] = -1e-9
+    table[2, 3] = 9.999996
+    decimals = [4, 5, 5, 5]
+
+    text = format_table_text(["t", "a", "b", "c"], table, decimals)
+    lines = text.splitlines()
+    assert lines[0] == "t\ta\tb\tc"
+    for row, line in zip(table, lines[1:]):
+        assert line == "\t".join(f"{v:.{d}f}" for v, d in zip(row, decimals))
+
+    # 接近舍入中点的值 (x.xxxxx5 及其相邻浮点数) 也必须与 f-string 完全一致
+    mid = (rng.integers(-10 ** 8, 10 ** 8, 2000) + 0.5) / 1e5
+    mid = np.concatenate((mid, np.nextafter(mid, np.inf), np.nextafter(mid, -np.inf), [25.636005, 0.125, 2.5]))
+    for d in (2, 5):
+        lines = format_table_text(None, mid, d).splitlines()
+        assert lines == [f"{v:.{d}f}" for v in mid]
+
+    path = tmp_path / "traces.csv"
+    export_table(str(path), ["t", "a", "b", "c"], table, decimals)
+    back = np.genfromtxt(path, delimiter=",", skip_header=1)
+    assert back.shape == table.shape
+    assert np.allclose(back, table, atol=1e-4, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        export_table(str(tmp_path / "traces.xyz"), ["t", "a", "b", "c"], table)
+
+
+def test_export_stack_pipelined_order(tmp_path):
+    """测试流水线导出 (多线程计算 + 单写入者 / 内存映射) 保持帧顺序且与逐帧结果一致"""
+    import tifffile
+    from ria_gui.model import AnalysisSession
+
+    rng = np.random.default_rng(5)
+    session = AnalysisSession()
+    session.data1 = rng.integers(100, 1000, (37, 24, 20), dtype=np.uint16)
+    session.data2 = rng.integers(100, 1000, (37, 24, 20), dtype=np.uint16)
+    session.recalc_background()
+
+    progress = []
+    path = tmp_path / "raw.tif"
+    session.export_raw_ratio_stack(str(path), 150, 0, progress_callback=lambda c, t: progress.append(c),
+                                   workers=4, max_memory_mb=0.01)
+    out = tifffile.imread(path)
+    expected = np.stack([session.get_processed_frame(i, int_thresh=150) for i in range(37)]).astype(np.float32)
+    assert out.shape == (37, 24, 20)
+    assert np.array_equal(out, expected, equal_nan=True)
+    assert progress == sorted(progress) and progress[-1] == 37
+
+    session.export_use_memmap = True
+    session.export_raw_ratio_stack(str(tmp_path / "raw_mm.tif"), 150, 0, workers=2)
+    assert np.array_equal(tifffile.imread(tmp_path / "raw_mm.tif"), expected, equal_nan=True)
+
+    # 短序列的缓冲区按块数分配，而不是按整个内存预算
+    import tracemalloc
+    short = AnalysisSession()
+    short.data1 = session.data1[:3].repeat(20, axis=1).repeat(20, axis=2)
+    short.data2 = session.data2[:3].repeat(20, axis=1).repeat(20, axis=2)
+    short.recalc_background()
+    tracemalloc.start()
+    try:
+        short.export_raw_ratio_stack(str(tmp_path / "short.tif"), 150, 0)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 64 * 2 ** 20
+
+
+def test_export_stack_compressed_tiled(tmp_path):
+    """测试 zlib 压缩 + 分块导出可无损读回，且整个堆栈为一个 series"""
+    import tifffile
+    from ria_gui.model import AnalysisSession
+    from ria_gui.io_utils import tiff_write_options
+
+    rng = np.random.default_rng(6)
+    session = AnalysisSession()
+    session.data1 = rng.integers(100, 1000, (9, 40, 36), dtype=np.uint16)
+    session.data2 = rng.integers(100, 1000, (9, 40, 36), dtype=np.uint16)
+    session.recalc_background()
+
+    path = tmp_path / "raw_zlib.tif"
+    session.export_raw_ratio_stack(str(path), 300, 0, compression="zlib", tile=16)
+    expected = np.stack([session.get_processed_frame(i, int_thresh=300) for i in range(9)]).astype(np.float32)
+    with tifffile.TiffFile(path) as tif:
+        assert len(tif.series) == 1
+        assert tif.pages[0].is_tiled and tif.pages[0].compression == 8  # ADOBE_DEFLATE
+        assert np.array_equal(tif.asarray(), expected, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        tiff_write_options("jpeg")
+    with pytest.raises(ValueError):
+        tiff_write_options("zlib", tile=20)
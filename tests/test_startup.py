@@ -0,0 +1,78 @@
+# tests/test_startup.py
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# 启动阶段不应加载的重量级 / 可选模块 (首次使用时才导入)
+LAZY_MODULES = ["cv2", "requests", "tifffile", "mpl_toolkits.axes_grid1", "webbrowser"]
+
+# 首个窗口出现的时间上限 (秒)，慢速 CI 可通过环境变量放宽
+STARTUP_BUDGET = float(os.environ.get("RIA_STARTUP_BUDGET", "5.0"))
+
+
+def run_python(code):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, timeout=120)
+
+
+def test_import_does_not_load_heavy_modules():
+    """测试导入 GUI / 入口模块时不会提前加载 cv2、requests、tifffile 等"""
+    code = (
+        "import sys, json\n"
+        "import ria_gui.main, ria_gui.gui\n"
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))\n"
+    )
+    res = run_python(code)
+    assert res.returncode == 0, res.stderr
+    assert json.loads(res.stdout.strip().splitlines()[-1]) == []
+
+
+def test_time_to_first_window():
+    """测试从导入到主窗口首次绘制的耗时 (无显示环境时跳过)"""
+    code = (
+        "import time\n"
+        "t0 = time.perf_counter()\n"
+        "import tkinter as tk\n"
+        "try:\n"
+        "    root = tk.Tk()\n"
+        "except tk.TclError:\n"
+        "    raise SystemExit(77)\n"
+        "from ria_gui.gui import RatioAnalyzerApp\n"
+        "app = RatioAnalyzerApp(root)\n"
+        "root.update()\n"
+        "print(time.perf_counter() - t0)\n"
+        "root.destroy()\n"
+    )
+    res = run_python(code)
+    if res.returncode == 77:
+        pytest.skip("No display available for Tk.")
+    assert res.returncode == 0, res.stderr
+    elapsed = float(res.stdout.strip().splitlines()[-1])
+    assert elapsed < STARTUP_BUDGET, f"Startup took {elapsed:.2f}s (budget {STARTUP_BUDGET:.1f}s)"
+
+
+def test_diagnostics_report(tmp_path):
+    """测试诊断报告包含阶段耗时、内存快照与 profile 数据"""
+    from ria_gui import diagnostics
+    diag = diagnostics.enable(profile=True, startup=True, memory=True, out_dir=str(tmp_path))
+    try:
+        with diagnostics.phase("app init"):
+            sum(range(1000))
+        diag.start_profile()
+        sorted(range(1000), key=lambda v: -v)
+        diag.stop_profile()
+        diagnostics.milestone("load")
+        path = diag.write_report("test")
+    finally:
+        diagnostics._active = None
+        import tracemalloc
+        tracemalloc.stop()
+
+    text = open(path, encoding="utf-8").read()
+    assert os.path.basename(path).startswith("ria_perf_")
+    assert "app init" in text and "[load]" in text and "cumulative" in text
+    assert os.path.exists(diag.report_path(".pstats"))